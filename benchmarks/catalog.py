@@ -0,0 +1,156 @@
+"""
+Generates a synthetic catalog and fills the Mongo product and kit repositories with it. Sku popularity follows a zipf
+distribution (rank 0 is the most popular product), kits draw their components from the most popular products, so a
+smaller component pool means more components shared between kits, and bundle sizes follow a weighted distribution.
+
+    $ export $(cat .env | xargs)
+    $ python -m benchmarks.catalog --products 100000 --kits 20000 --skew 1.1 --bundle-sizes 2:50,5:30,20:15,100:5
+
+Synthetic skus start with SYN-, --replace removes a previously generated catalog first. The in memory repositories
+live in the app process, benchmarks.load seeds them through the api with the same options.
+"""
+import argparse
+import random
+from typing import Dict, List
+
+from src.kitmanagement.domain import Product, Kit, KitProduct
+
+SKU_PREFIX = 'SYN-'
+DEFAULT_BUNDLE_SIZES = '2:50,5:30,20:15,100:5'
+
+
+def parse_distribution(text: str) -> Dict[int, float]:
+    '''
+        Parses value:weight pairs, e.g. 2:50,5:30
+    :return:
+    '''
+    distribution = {}
+    for pair in text.split(','):
+        value, weight = pair.split(':')
+        distribution[int(value)] = float(weight)
+    return distribution
+
+
+def zipf_weights(amount: int, skew: float) -> List[float]:
+    return [1 / (rank + 1) ** skew for rank in range(amount)]
+
+
+def product_sku(rank: int) -> str:
+    return '{}P{:07d}'.format(SKU_PREFIX, rank)
+
+
+def kit_sku(rank: int) -> str:
+    return '{}K{:07d}'.format(SKU_PREFIX, rank)
+
+
+def rank_of(sku: str) -> int:
+    return int(sku[len(SKU_PREFIX) + 1:])
+
+
+def weighted_sample(random_generator: random.Random, population: list, weights: List[float], amount: int) -> list:
+    # INFO: weighted sampling without replacement, keeping the amount items with the highest random() ** (1 / weight)
+    keys = [(random_generator.random() ** (1 / weight), index) for index, weight in enumerate(weights)]
+    keys.sort(reverse=True)
+    return [population[index] for _, index in keys[:amount]]
+
+
+def generate(products: int, kits: int, skew: float = 1.0, bundle_sizes: Dict[int, float] = None,
+             component_pool: int = 1000, seed: int = 1) -> dict:
+    '''
+        Builds the catalog in popularity order: products[0] and kits[0] are the most requested ones
+    :return: a dict with the products and kits, without ids
+    '''
+    random_generator = random.Random(seed)
+    bundle_sizes = bundle_sizes or parse_distribution(DEFAULT_BUNDLE_SIZES)
+
+    catalog_products = []
+    for rank in range(products):
+        cost = round(random_generator.uniform(1, 500), 2)
+        catalog_products.append(Product(
+            name='Synthetic Product {}'.format(rank),
+            sku=product_sku(rank),
+            cost=cost,
+            price=round(cost * random_generator.uniform(1.1, 2.5), 2),
+            inventory_quantity=random_generator.randint(0, 5000)
+        ))
+
+    pool = [product.sku for product in catalog_products[:component_pool]]
+    pool_weights = zipf_weights(len(pool), skew)
+    sizes = list(bundle_sizes)
+    size_weights = [bundle_sizes[size] for size in sizes]
+    catalog_kits = []
+    for rank in range(kits):
+        bundle_size = min(random_generator.choices(sizes, size_weights)[0], len(pool))
+        catalog_kits.append(Kit(
+            name='Synthetic Kit {}'.format(rank),
+            sku=kit_sku(rank),
+            kit_products=[
+                KitProduct(
+                    product_sku=sku,
+                    quantity=random_generator.randint(1, 5),
+                    discount_percentage=float(random_generator.choice([0, 5, 10, 15, 20, 30]))
+                )
+                for sku in weighted_sample(random_generator, pool, pool_weights, bundle_size)
+            ]
+        ))
+    return {'products': catalog_products, 'kits': catalog_kits}
+
+
+def fill(product_repository, kit_repository, catalog: dict) -> None:
+    for product in catalog['products']:
+        product_repository.add(product)
+    for kit in catalog['kits']:
+        kit_repository.add(kit)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--kits', type=int, default=2000)
+    parser.add_argument('--skew', type=float, default=1.0, help='zipf exponent of sku popularity, 0 is uniform')
+    parser.add_argument('--bundle-sizes', default=DEFAULT_BUNDLE_SIZES, help='components per kit as size:weight pairs')
+    parser.add_argument('--component-pool', type=int, default=1000,
+                        help='kit components are drawn from this many most popular products')
+    parser.add_argument('--seed', type=int, default=1)
+
+
+def generate_from(arguments: argparse.Namespace) -> dict:
+    return generate(
+        arguments.products,
+        arguments.kits,
+        skew=arguments.skew,
+        bundle_sizes=parse_distribution(arguments.bundle_sizes),
+        component_pool=arguments.component_pool,
+        seed=arguments.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument('--replace', action='store_true', help='remove the previously generated catalog first')
+    arguments = parser.parse_args()
+
+    from src import configurations
+
+    if configurations.get_config().REPOSITORY_BACKEND == 'memory':
+        parser.error('the in memory repositories live in the app process, use python -m benchmarks.load')
+
+    from src import connections
+    from src.initialize import create_app
+    from src.kitmanagement.repositories import MongoProductRepository, MongoKitRepository
+
+    create_app()
+    if arguments.replace:
+        for collection in ['kits', 'products']:
+            connections.mongo_kit_db[collection].delete_many({'sku': {'$regex': '^{}'.format(SKU_PREFIX)}})
+
+    catalog = generate_from(arguments)
+    fill(MongoProductRepository(connections.mongo_kit_db), MongoKitRepository(connections.mongo_kit_db), catalog)
+    components = sum(len(kit.kit_products) for kit in catalog['kits'])
+    print('added {} products and {} kits ({} components, {:.1f} per kit)'.format(
+        len(catalog['products']), len(catalog['kits']), components, components / max(len(catalog['kits']), 1)
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Measures throughput and latency of a running kit-api deployment at increasing concurrency levels.
+Run it once against the flask deployment and once against the asgi one, both with a single worker
+and the same local mongod:
+
+    $ flask run --port 8007
+    $ python -m benchmarks.concurrency --url http://localhost:8007
+
+    $ uvicorn src.initialize_asgi:asgi_app --port 8008 --workers 1
+    $ python -m benchmarks.concurrency --url http://localhost:8008
+"""
+import argparse
+import json
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from urllib.parse import urlparse
+
+CONCURRENCY_LEVELS = [1, 8, 32, 64]
+ENDPOINTS = {
+    'products': '/api/products',
+    'product': '/api/products/{product_id}',
+    'kit': '/api/kits/{kit_id}',
+    'calculated-kit': '/api/calculated-kits/{kit_id}',
+}
+
+
+def request(url: str, method: str, path: str, payload: dict = None):
+    parsed_url = urlparse(url)
+    connection = HTTPConnection(parsed_url.hostname, parsed_url.port, timeout=30)
+    try:
+        body = json.dumps(payload) if payload is not None else None
+        connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        data = response.read()
+        return response.status, json.loads(data) if data else None
+    finally:
+        connection.close()
+
+
+def seed(url: str, kits: int, components: int) -> dict:
+    run_id = uuid.uuid4().hex[:8]
+    product_skus = []
+    product_ids = []
+    for index in range(components):
+        sku = 'BENCH-{}-P{}'.format(run_id, index)
+        _, product = request(url, 'POST', '/api/products', {
+            'name': 'Bench Product {}'.format(index),
+            'sku': sku,
+            'cost': 10.0,
+            'price': 20.0,
+            'inventoryQuantity': 100
+        })
+        product_skus.append(sku)
+        product_ids.append(product['id'])
+
+    kit_ids = []
+    for index in range(kits):
+        _, kit = request(url, 'POST', '/api/kits', {
+            'name': 'Bench Kit {}'.format(index),
+            'sku': 'BENCH-{}-K{}'.format(run_id, index),
+            'kitProducts': [
+                {'productSku': sku, 'quantity': 1, 'discountPercentage': 5.0}
+                for sku in product_skus
+            ]
+        })
+        kit_ids.append(kit['id'])
+    return {'product_ids': product_ids, 'kit_ids': kit_ids}
+
+
+def timed_request(url: str, path: str) -> float:
+    started_at = time.perf_counter()
+    status, _ = request(url, 'GET', path)
+    if status != 200:
+        raise RuntimeError('{} answered {}'.format(path, status))
+    return time.perf_counter() - started_at
+
+
+def run(url: str, requests_per_level: int, seeded: dict, endpoint: str = 'calculated-kit') -> list:
+    results = []
+    product_ids = seeded['product_ids']
+    kit_ids = seeded['kit_ids']
+    paths = [
+        ENDPOINTS[endpoint].format(product_id=product_ids[index % len(product_ids)], kit_id=kit_ids[index % len(kit_ids)])
+        for index in range(requests_per_level)
+    ]
+    for concurrency in CONCURRENCY_LEVELS:
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = sorted(executor.map(lambda path: timed_request(url, path), paths))
+        elapsed = time.perf_counter() - started_at
+        results.append({
+            'concurrency': concurrency,
+            'requests_per_second': requests_per_level / elapsed,
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8007')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--kits', type=int, default=50)
+    parser.add_argument('--components', type=int, default=5)
+    parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS), help='default: calculated-kit')
+    arguments = parser.parse_args()
+
+    seeded = seed(arguments.url, arguments.kits, arguments.components)
+    print('{:<16} {:>12} {:>10} {:>10} {:>10}'.format('endpoint', 'concurrency', 'req/s', 'p50 ms', 'p99 ms'))
+    for endpoint in arguments.endpoint or ['calculated-kit']:
+        for result in run(arguments.url, arguments.requests, seeded, endpoint):
+            print('{:<16} {concurrency:>12} {requests_per_second:>10.1f} {p50_ms:>10.2f} {p99_ms:>10.2f}'.format(endpoint, **result))
+
+
+if __name__ == '__main__':
+    main()
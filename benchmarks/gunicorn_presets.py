@@ -0,0 +1,73 @@
+"""
+Load tests each gunicorn preset (src/gunicorn_config.py) against the existing read endpoints. Every preset gets its
+own gunicorn, started with the current environment and a local mongod, and is stopped before the next one starts.
+The in memory backend is not meaningful here, every worker would hold its own catalog.
+
+    $ export $(cat .env | xargs)
+    $ flask create-indexes
+    $ python -m benchmarks.gunicorn_presets --workers 2
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks import concurrency
+
+PRESETS = ['sync', 'gthread', 'gevent']
+
+
+def wait_until_ready(url: str, seconds: int = 30) -> None:
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        try:
+            if concurrency.request(url, 'GET', '/api/health/ready')[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('{} did not get ready in {}s'.format(url, seconds))
+
+
+def run_preset(preset: str, workers: int, port: int, requests: int, endpoints: list) -> list:
+    url = 'http://127.0.0.1:{}'.format(port)
+    environment = dict(os.environ, GUNICORN_PRESET=preset, GUNICORN_BIND='127.0.0.1:{}'.format(port))
+    if workers:
+        environment['GUNICORN_WORKERS'] = str(workers)
+
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'python:src.gunicorn_config', 'src.wsgi:application'],
+        env=environment,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_ready(url)
+        seeded = concurrency.seed(url, kits=50, components=5)
+        return [
+            dict(result, preset=preset, endpoint=endpoint)
+            for endpoint in endpoints
+            for result in concurrency.run(url, requests, seeded, endpoint)
+        ]
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=0, help='default: the preset value')
+    parser.add_argument('--port', type=int, default=8107)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--preset', action='append', choices=PRESETS, help='default: all presets')
+    arguments = parser.parse_args()
+
+    print('{:<8} {:<16} {:>12} {:>10} {:>10} {:>10}'.format('preset', 'endpoint', 'concurrency', 'req/s', 'p50 ms', 'p99 ms'))
+    for preset in arguments.preset or PRESETS:
+        for result in run_preset(preset, arguments.workers, arguments.port, arguments.requests, sorted(concurrency.ENDPOINTS)):
+            print('{preset:<8} {endpoint:<16} {concurrency:>12} {requests_per_second:>10.1f} {p50_ms:>10.2f} {p99_ms:>10.2f}'.format(**result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+Replays a mix of requests against the api and reports throughput and p50/p95/p99 latency per endpoint. By default the
+app runs in process (werkzeug test client) with the backend given by --backend, and a synthetic catalog
+(benchmarks.catalog) is seeded through the api first. With --url it targets a running deployment instead.
+
+    $ export $(cat .env | xargs)
+    $ python -m benchmarks.load --backend memory --products 2000 --kits 500 --requests 20000 --concurrency 8
+    $ python -m benchmarks.load --backend mongo --existing --mix get-product=50,calculated-kit=50
+
+Kits and products are requested following the zipf popularity of the catalog. Deleted kits are taken from the least
+popular ones and never requested otherwise, so deletes don't turn later requests into 404s.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from benchmarks import catalog as catalog_module
+from benchmarks import concurrency
+
+DEFAULT_MIX = 'get-product=30,get-kit=20,calculated-kit=35,put-product=8,put-kit=5,delete-kit=2'
+OPERATIONS = ['get-product', 'get-kit', 'calculated-kit', 'put-product', 'put-kit', 'delete-kit']
+EXPECTED_STATUS = {'delete-kit': 204}
+
+Request = Tuple[str, str, str, dict]
+
+
+class InProcessClient(object):
+
+    def __init__(self, backend: str):
+        os.environ['REPOSITORY_BACKEND'] = backend
+        from src.initialize import create_app
+
+        self.__web_app = create_app()
+        self.__local = threading.local()
+
+    def request(self, method: str, path: str, payload: dict = None):
+        if not hasattr(self.__local, 'client'):
+            self.__local.client = self.__web_app.test_client()
+        response = self.__local.client.open(path, method=method, json=payload)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient(object):
+
+    def __init__(self, url: str):
+        self.__url = url
+
+    def request(self, method: str, path: str, payload: dict = None):
+        return concurrency.request(self.__url, method, path, payload)
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for pair in text.split(','):
+        operation, weight = pair.split('=')
+        if operation not in OPERATIONS:
+            raise ValueError('unknown operation {}, use one of {}'.format(operation, ', '.join(OPERATIONS)))
+        mix[operation] = float(weight)
+    return mix
+
+
+def seed(client, catalog: dict) -> Tuple[List[dict], List[dict]]:
+    products = []
+    for product in catalog['products']:
+        status, data = client.request('POST', '/api/products', {
+            'name': product.name,
+            'sku': product.sku,
+            'cost': product.cost,
+            'price': product.price,
+            'inventoryQuantity': product.inventory_quantity
+        })
+        if status != 201:
+            raise RuntimeError('could not seed {}: {} {}'.format(product.sku, status, data))
+        products.append(data)
+
+    kits = []
+    for kit in catalog['kits']:
+        status, data = client.request('POST', '/api/kits', {
+            'name': kit.name,
+            'sku': kit.sku,
+            'kitProducts': [
+                {
+                    'productSku': kit_product.product_sku,
+                    'quantity': kit_product.quantity,
+                    'discountPercentage': kit_product.discount_percentage
+                }
+                for kit_product in kit.kit_products
+            ]
+        })
+        if status != 201:
+            raise RuntimeError('could not seed {}: {} {}'.format(kit.sku, status, data))
+        kits.append(data)
+    return products, kits
+
+
+def discover(client) -> Tuple[List[dict], List[dict]]:
+    '''
+        Finds a catalog generated by benchmarks.catalog, ordered by popularity rank
+    :return:
+    '''
+    _, products = client.request('GET', '/api/products')
+    _, kits = client.request('GET', '/api/kits')
+    products = [product for product in products if product['sku'].startswith(catalog_module.SKU_PREFIX)]
+    kits = [kit for kit in kits if kit['sku'].startswith(catalog_module.SKU_PREFIX)]
+    if not products or not kits:
+        raise RuntimeError('no synthetic catalog found, run python -m benchmarks.catalog first')
+    return (
+        sorted(products, key=lambda product: catalog_module.rank_of(product['sku'])),
+        sorted(kits, key=lambda kit: catalog_module.rank_of(kit['sku']))
+    )
+
+
+def plan(products: List[dict], kits: List[dict], mix: Dict[str, float], requests: int, skew: float,
+         seed: int) -> List[Request]:
+    '''
+        Builds the whole request sequence up front, so the timed part only sends requests
+    :return: (operation, method, path, payload) tuples
+    '''
+    random_generator = random.Random(seed)
+    operations = random_generator.choices(list(mix), list(mix.values()), k=requests)
+    deletes = operations.count('delete-kit')
+    if deletes >= len(kits):
+        raise ValueError('{} deletes need more than the {} kits of the catalog'.format(deletes, len(kits)))
+
+    deletable_kits = kits[len(kits) - deletes:]
+    kits = kits[:len(kits) - deletes]
+    product_weights = catalog_module.zipf_weights(len(products), skew)
+    kit_weights = catalog_module.zipf_weights(len(kits), skew)
+
+    sequence = []
+    for operation in operations:
+        if operation == 'delete-kit':
+            sequence.append((operation, 'DELETE', '/api/kits/{}'.format(deletable_kits.pop()['id']), None))
+        elif operation in ('get-product', 'put-product'):
+            product = random_generator.choices(products, product_weights)[0]
+            path = '/api/products/{}'.format(product['id'])
+            if operation == 'get-product':
+                sequence.append((operation, 'GET', path, None))
+            else:
+                sequence.append((operation, 'PUT', path, {
+                    'name': product['name'],
+                    'cost': product['cost'],
+                    'price': round(product['price'] * random_generator.uniform(0.9, 1.1), 2),
+                    'inventoryQuantity': random_generator.randint(0, 5000)
+                }))
+        else:
+            kit = random_generator.choices(kits, kit_weights)[0]
+            if operation == 'get-kit':
+                sequence.append((operation, 'GET', '/api/kits/{}'.format(kit['id']), None))
+            elif operation == 'calculated-kit':
+                sequence.append((operation, 'GET', '/api/calculated-kits/{}'.format(kit['id']), None))
+            else:
+                sequence.append((operation, 'PUT', '/api/kits/{}'.format(kit['id']), {
+                    'name': kit['name'],
+                    'kitProducts': kit['kitProducts']
+                }))
+    return sequence
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    return sorted_values[max(int(round(fraction * len(sorted_values))) - 1, 0)]
+
+
+def run(client, sequence: List[Request], concurrency_level: int) -> dict:
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    errors_lock = threading.Lock()
+
+    def send(request: Request) -> None:
+        operation, method, path, payload = request
+        started_at = time.perf_counter()
+        status, _ = client.request(method, path, payload)
+        latencies[operation].append(time.perf_counter() - started_at)
+        if status != EXPECTED_STATUS.get(operation, 200):
+            with errors_lock:
+                errors[operation] += 1
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency_level) as executor:
+        list(executor.map(send, sequence))
+    elapsed = time.perf_counter() - started_at
+
+    report = {}
+    for operation in sorted(latencies, key=lambda operation: -len(latencies[operation])):
+        values = sorted(latencies[operation])
+        report[operation] = summarize(values, errors[operation], elapsed)
+    report['total'] = summarize(sorted(sum(latencies.values(), [])), sum(errors.values()), elapsed)
+    return report
+
+
+def summarize(sorted_latencies: List[float], errors: int, elapsed: float) -> dict:
+    return {
+        'requests': len(sorted_latencies),
+        'errors': errors,
+        'requests_per_second': len(sorted_latencies) / elapsed,
+        'mean_ms': statistics.mean(sorted_latencies) * 1000,
+        'p50_ms': percentile(sorted_latencies, 0.50) * 1000,
+        'p95_ms': percentile(sorted_latencies, 0.95) * 1000,
+        'p99_ms': percentile(sorted_latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['memory', 'mongo'], default='memory', help='in process backend')
+    parser.add_argument('--url', help='target a running deployment instead of the in process app')
+    parser.add_argument('--existing', action='store_true', help='use a catalog added by benchmarks.catalog')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='operation=weight pairs of {}'.format(', '.join(OPERATIONS)))
+    parser.add_argument('--output', help='also save the report as JSON')
+    catalog_module.add_arguments(parser)
+    arguments = parser.parse_args()
+
+    client = HttpClient(arguments.url) if arguments.url else InProcessClient(arguments.backend)
+    if arguments.existing:
+        products, kits = discover(client)
+    else:
+        started_at = time.perf_counter()
+        products, kits = seed(client, catalog_module.generate_from(arguments))
+        print('seeded {} products and {} kits in {:.1f}s'.format(len(products), len(kits), time.perf_counter() - started_at))
+
+    sequence = plan(products, kits, parse_mix(arguments.mix), arguments.requests, arguments.skew, arguments.seed)
+    report = run(client, sequence, arguments.concurrency)
+
+    print('{:<16} {:>9} {:>7} {:>10} {:>9} {:>9} {:>9}'.format('endpoint', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for operation, result in report.items():
+        print('{:<16} {requests:>9} {errors:>7} {requests_per_second:>10.1f} {p50_ms:>9.2f} {p95_ms:>9.2f} {p99_ms:>9.2f}'.format(operation, **result))
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump({'arguments': vars(arguments), 'report': report}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Compares JSON and MessagePack encoding time and payload size for marshalled kits.
+
+    $ export $(cat .env | xargs)
+    $ python -m benchmarks.msgpack_vs_json
+"""
+import json
+import random
+import timeit
+
+import msgpack
+from flask_restx import marshal
+
+from src.kitmanagement import serialization
+from src.kitmanagement.domain import Kit, KitProduct
+
+SCENARIOS = [
+    ('single kit, 3 components', 1, 3),
+    ('single kit, 100 components', 1, 100),
+    ('list of 100 kits, 5 components', 100, 5),
+    ('list of 1000 kits, 20 components', 1000, 20),
+]
+
+
+def build_kits(amount: int, components: int):
+    random_generator = random.Random(amount * components)
+    return [
+        Kit(
+            id='5f566e9c1022bd08188d{:04x}'.format(kit_index),
+            name='Gaming Pack {}'.format(kit_index),
+            sku='KIT-{:06d}'.format(kit_index),
+            kit_products=[
+                KitProduct(
+                    product_sku='PROD-{:06d}'.format(random_generator.randrange(100000)),
+                    quantity=random_generator.randint(1, 10),
+                    discount_percentage=round(random_generator.uniform(0, 40), 2)
+                )
+                for _ in range(components)
+            ]
+        )
+        for kit_index in range(amount)
+    ]
+
+
+def run(repeat: int = 5, number: int = 20) -> list:
+    results = []
+    for name, amount, components in SCENARIOS:
+        kits = build_kits(amount, components)
+        data = marshal(kits if amount > 1 else kits[0], serialization.kit_model)
+        json_body = json.dumps(data).encode()
+        msgpack_body = msgpack.packb(data, use_bin_type=True)
+        json_seconds = min(timeit.repeat(lambda: json.dumps(data), repeat=repeat, number=number)) / number
+        msgpack_seconds = min(timeit.repeat(lambda: msgpack.packb(data, use_bin_type=True), repeat=repeat, number=number)) / number
+        results.append({
+            'scenario': name,
+            'json_bytes': len(json_body),
+            'msgpack_bytes': len(msgpack_body),
+            'json_encode_us': json_seconds * 1e6,
+            'msgpack_encode_us': msgpack_seconds * 1e6,
+        })
+    return results
+
+
+def main():
+    print('{:<36} {:>12} {:>14} {:>16} {:>18}'.format('scenario', 'json bytes', 'msgpack bytes', 'json encode us', 'msgpack encode us'))
+    for result in run():
+        print('{scenario:<36} {json_bytes:>12} {msgpack_bytes:>14} {json_encode_us:>16.1f} {msgpack_encode_us:>18.1f}'.format(**result))
+
+
+if __name__ == '__main__':
+    main()
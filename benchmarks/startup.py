@@ -0,0 +1,55 @@
+"""
+Measures cold start of a fresh process: importing the application factory, building the app and serving the first
+request (GET /api/products through the werkzeug test client). Each run is a new interpreter, so nothing is cached
+in sys.modules.
+
+    $ export $(cat .env | xargs)
+    $ python -m benchmarks.startup --runs 10
+    $ REPOSITORY_BACKEND=memory python -m benchmarks.startup
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = '''
+import json, time
+started_at = time.perf_counter()
+from src.initialize import create_app
+imported_at = time.perf_counter()
+web_app = create_app()
+created_at = time.perf_counter()
+response = web_app.test_client().get('/api/products')
+answered_at = time.perf_counter()
+print(json.dumps({
+    'status': response.status_code,
+    'import_ms': (imported_at - started_at) * 1000,
+    'create_app_ms': (created_at - imported_at) * 1000,
+    'first_request_ms': (answered_at - created_at) * 1000,
+    'time_to_first_request_ms': (answered_at - started_at) * 1000,
+}))
+'''
+
+MEASURES = ['import_ms', 'create_app_ms', 'first_request_ms', 'time_to_first_request_ms']
+
+
+def run(runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE], check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {measure: statistics.median(sample[measure] for sample in samples) for measure in MEASURES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    arguments = parser.parse_args()
+
+    for measure, value in run(arguments.runs).items():
+        print('{:<28} {:>10.1f}'.format(measure, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+"""
+Benchmark suite for repositories, domain math, serialization and endpoints. `run` saves the results as JSON, `compare`
+flags the benchmarks that got slower than a stored baseline and exits with 1 when there is any:
+
+    $ export $(cat .env | xargs)
+    $ python -m benchmarks.suite run --output benchmarks/results/baseline.json
+    $ python -m benchmarks.suite run --output benchmarks/results/current.json
+    $ python -m benchmarks.suite compare benchmarks/results/baseline.json benchmarks/results/current.json
+
+Mongo repositories are measured against a scratch database on MONGO_HOST, which is dropped afterwards, and are
+skipped when no server answers. Endpoints go through the werkzeug test client with the configured REPOSITORY_BACKEND.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import timeit
+import uuid
+from datetime import datetime
+from typing import Callable, Iterator, List, Tuple
+
+from flask_restx import marshal
+from pymongo.errors import PyMongoError
+
+from src.base.serialization import CaseStyleConverter
+from src.kitmanagement import serialization
+from src.kitmanagement.domain import Product, Kit, KitProduct, CalculatedKit
+from src.kitmanagement.repositories import InMemoryProductRepository, InMemoryKitRepository, \
+    MongoProductRepository, MongoKitRepository, create_mongo_product_from_product, create_mongo_kit_from_kit
+
+GROUPS = ['repositories', 'domain', 'serialization', 'endpoints']
+BACKENDS = ['memory', 'mongo']
+SIZES = [1000, 100000, 1000000]
+BUNDLE_SIZES = [3, 20, 200]
+COMPONENTS_PER_KIT = 5
+# INFO: listing materializes every entity, above this size one call takes seconds
+MAX_LIST_SIZE = 100000
+BENCHMARK_DATABASE = 'kit-api-benchmarks'
+DEFAULT_THRESHOLD = 0.10
+
+Benchmark = Tuple[str, Callable]
+
+
+def measure(function: Callable, repeat: int) -> dict:
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    samples = [seconds / number * 1e6 for seconds in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'min_us': min(samples),
+        'median_us': statistics.median(samples),
+        'number': number,
+        'repeat': repeat,
+    }
+
+
+def build_products(size: int) -> List[Product]:
+    return [
+        Product(
+            id=str(index + 1),
+            name='Product {}'.format(index),
+            sku='SKU-{:07d}'.format(index),
+            cost=10.0 + index % 90,
+            price=20.0 + index % 180,
+            inventory_quantity=index % 1000
+        )
+        for index in range(size)
+    ]
+
+
+def build_kits(size: int, products: List[Product]) -> List[Kit]:
+    random_generator = random.Random(size)
+    # INFO: kit products are immutable value objects, sharing them keeps 1M kits in memory
+    kit_products = [
+        KitProduct(product_sku=product.sku, quantity=1 + index % 4, discount_percentage=float(index % 30))
+        for index, product in enumerate(products[:1000])
+    ]
+    return [
+        Kit(
+            id=str(index + 1),
+            name='Kit {}'.format(index),
+            sku='KIT-{:07d}'.format(index),
+            kit_products=random_generator.sample(kit_products, COMPONENTS_PER_KIT)
+        )
+        for index in range(size)
+    ]
+
+
+def new_product() -> Product:
+    return Product(name='New Product', sku='NEW-{}'.format(uuid.uuid4().hex), cost=10.0, price=20.0, inventory_quantity=10)
+
+
+def repository_benchmarks(prefix: str, size: int, product_repository, kit_repository, products: List[Product],
+                          kits: List[Kit]) -> Iterator[Benchmark]:
+    last_product = products[-1]
+    last_kit = kits[-1]
+    skus = [product.sku for product in products[-10:]]
+    shared_sku = kits[0].kit_products[0].product_sku
+
+    yield '{}.product.get_by_id[{}]'.format(prefix, size), lambda: product_repository.get_by_id(last_product.id)
+    yield '{}.product.get_by_sku[{}]'.format(prefix, size), lambda: product_repository.get_by_sku(last_product.sku)
+    yield '{}.product.list_with_skus[{}]'.format(prefix, size), lambda: product_repository.list_with_skus(skus)
+    yield '{}.product.update[{}]'.format(prefix, size), lambda: product_repository.update(last_product)
+    yield '{}.product.add[{}]'.format(prefix, size), lambda: product_repository.add(new_product())
+    if size <= MAX_LIST_SIZE:
+        yield '{}.product.list[{}]'.format(prefix, size), product_repository.list
+        yield '{}.kit.list[{}]'.format(prefix, size), kit_repository.list
+    yield '{}.kit.get_by_id[{}]'.format(prefix, size), lambda: kit_repository.get_by_id(last_kit.id)
+    yield '{}.kit.list_with_product[{}]'.format(prefix, size), lambda: kit_repository.list_with_product(shared_sku)
+    yield '{}.kit.update[{}]'.format(prefix, size), lambda: kit_repository.update(last_kit)
+
+
+def in_memory_benchmarks(size: int, products: List[Product], kits: List[Kit]) -> Iterator[Benchmark]:
+    product_repository = InMemoryProductRepository()
+    kit_repository = InMemoryKitRepository()
+    # INFO: add is O(n) per call (next id and sku check), so the repositories are filled through the list they return
+    product_repository.list().extend(products)
+    kit_repository.list().extend(kits)
+    yield from repository_benchmarks('repositories.memory', size, product_repository, kit_repository, products, kits)
+
+
+def mongo_benchmarks(size: int, products: List[Product], kits: List[Kit]) -> Iterator[Benchmark]:
+    from src import connections
+
+    database = connections.get_mongo_client().get_database(BENCHMARK_DATABASE)
+    connections.get_mongo_client().drop_database(BENCHMARK_DATABASE)
+    database['products'].create_index('sku', unique=True)
+    database['products'].create_index('searchTokens')
+    database['kits'].create_index('sku', unique=True)
+    database['kits'].create_index('kitProducts.productSku')
+    mongo_products = insert_all(database['products'], products, create_mongo_product_from_product)
+    mongo_kits = insert_all(database['kits'], kits, create_mongo_kit_from_kit)
+    product_repository = MongoProductRepository(database)
+    kit_repository = MongoKitRepository(database)
+    shared_skus = [kit_product.product_sku for kit_product in kits[0].kit_products]
+    try:
+        yield from repository_benchmarks(
+            'repositories.mongo', size, product_repository, kit_repository, mongo_products, mongo_kits
+        )
+        # INFO: the in memory repositories are filled around add, so their search, reverse and id indexes are empty
+        yield 'repositories.mongo.product.search[{}]'.format(size), lambda: product_repository.search('product 42', 0, 20)
+        yield 'repositories.mongo.kit.list_with_products[{}]'.format(size), \
+            lambda: kit_repository.list_with_products(shared_skus, 0, 100)
+        basket_ids = [product.id for product in mongo_products[-50:]]
+        yield 'repositories.mongo.product.get_many_by_ids[{}]'.format(size), \
+            lambda: product_repository.get_many_by_ids(basket_ids)
+        last_price = mongo_products[-1].price
+        yield 'repositories.mongo.product.patch[{}]'.format(size), \
+            lambda: product_repository.patch(mongo_products[-1].id, {'price': last_price})
+        last_kit_product = mongo_kits[-1].kit_products[0]
+        yield 'repositories.mongo.kit.patch_kit_products[{}]'.format(size), \
+            lambda: kit_repository.patch_kit_products(mongo_kits[-1].id, [], [last_kit_product], [])
+    finally:
+        connections.get_mongo_client().drop_database(BENCHMARK_DATABASE)
+
+
+def insert_all(collection, entities: list, to_mongo: Callable, chunk_size: int = 10000) -> list:
+    '''
+        Bulk inserts the entities, returning copies of them carrying the ObjectIds given by the server
+    :return:
+    '''
+    inserted = []
+    for start in range(0, len(entities), chunk_size):
+        chunk = entities[start:start + chunk_size]
+        inserted_ids = collection.insert_many([to_mongo(entity) for entity in chunk], ordered=False).inserted_ids
+        inserted.extend(with_id(entity, str(inserted_id)) for entity, inserted_id in zip(chunk, inserted_ids))
+    return inserted
+
+
+def with_id(entity, entity_id: str):
+    if isinstance(entity, Kit):
+        return Kit(id=entity_id, name=entity.name, sku=entity.sku, kit_products=entity.kit_products)
+    return Product(
+        id=entity_id, name=entity.name, sku=entity.sku, cost=entity.cost, price=entity.price,
+        inventory_quantity=entity.inventory_quantity
+    )
+
+
+def domain_benchmarks() -> Iterator[Benchmark]:
+    for bundle_size in BUNDLE_SIZES:
+        products = build_products(bundle_size)
+        kit = Kit(
+            id='1',
+            name='Bundle',
+            sku='KIT-BUNDLE',
+            kit_products=[KitProduct(product_sku=product.sku, quantity=2, discount_percentage=10.0) for product in products]
+        )
+        calculated_kit = CalculatedKit(kit, products)
+        yield 'domain.calculated_kit.cost[{}]'.format(bundle_size), lambda c=calculated_kit: c.cost
+        yield 'domain.calculated_kit.price[{}]'.format(bundle_size), lambda c=calculated_kit: c.price
+        yield 'domain.calculated_kit.inventory_quantity[{}]'.format(bundle_size), lambda c=calculated_kit: c.inventory_quantity
+
+
+def serialization_benchmarks() -> Iterator[Benchmark]:
+    converter = CaseStyleConverter()
+    for bundle_size in BUNDLE_SIZES:
+        kit_command = {
+            'name': 'Bundle',
+            'sku': 'KIT-BUNDLE',
+            'kitProducts': [
+                {'productSku': 'SKU-{:07d}'.format(index), 'quantity': 1, 'discountPercentage': 5.0}
+                for index in range(bundle_size)
+            ]
+        }
+        yield 'serialization.camel_to_snake.kit[{}]'.format(bundle_size), \
+            lambda command=kit_command: converter.camel_to_snake(command)
+
+    products = build_products(1000)
+    kits = build_kits(100, products)
+    calculated_kit = CalculatedKit(kits[0], products)
+    yield 'serialization.marshal.product[1]', lambda: marshal(products[0], serialization.product_model)
+    yield 'serialization.marshal.product[1000]', lambda: marshal(products, serialization.product_model)
+    yield 'serialization.marshal.kit[1]', lambda: marshal(kits[0], serialization.kit_model)
+    yield 'serialization.marshal.kit[100]', lambda: marshal(kits, serialization.kit_model)
+    yield 'serialization.marshal.calculated_kit[1]', lambda: marshal(calculated_kit, serialization.calculated_kit_model)
+
+
+def endpoint_benchmarks() -> Iterator[Benchmark]:
+    from src.initialize import create_app
+
+    client = create_app().test_client()
+    run_id = uuid.uuid4().hex[:8]
+    product_skus = []
+    product_ids = []
+    for index in range(100):
+        response = client.post('/api/products', json={
+            'name': 'Bench Product {}'.format(index),
+            'sku': 'BENCH-{}-P{}'.format(run_id, index),
+            'cost': 10.0,
+            'price': 20.0,
+            'inventoryQuantity': 100
+        })
+        product_skus.append(response.json['sku'])
+        product_ids.append(response.json['id'])
+    kit_ids = []
+    for index in range(50):
+        response = client.post('/api/kits', json={
+            'name': 'Bench Kit {}'.format(index),
+            'sku': 'BENCH-{}-K{}'.format(run_id, index),
+            'kitProducts': [
+                {'productSku': sku, 'quantity': 1, 'discountPercentage': 5.0}
+                for sku in product_skus[index % 20:index % 20 + COMPONENTS_PER_KIT]
+            ]
+        })
+        kit_ids.append(response.json['id'])
+
+    product_update = {'name': 'Bench Product', 'cost': 10.0, 'price': 25.0, 'inventoryQuantity': 50}
+    yield 'endpoints.get_products', lambda: client.get('/api/products')
+    yield 'endpoints.get_product', lambda: client.get('/api/products/{}'.format(product_ids[-1]))
+    yield 'endpoints.put_product', lambda: client.put('/api/products/{}'.format(product_ids[-1]), json=product_update)
+    yield 'endpoints.get_kits', lambda: client.get('/api/kits')
+    yield 'endpoints.get_kit', lambda: client.get('/api/kits/{}'.format(kit_ids[-1]))
+    yield 'endpoints.get_calculated_kit', lambda: client.get('/api/calculated-kits/{}'.format(kit_ids[-1]))
+
+
+def benchmarks_for(groups: List[str], backends: List[str], sizes: List[int]) -> Iterator[Benchmark]:
+    if 'repositories' in groups:
+        for size in sizes:
+            products = build_products(size)
+            kits = build_kits(size, products)
+            if 'memory' in backends:
+                yield from in_memory_benchmarks(size, products, kits)
+            if 'mongo' in backends:
+                yield from mongo_benchmarks(size, products, kits)
+    if 'domain' in groups:
+        yield from domain_benchmarks()
+    if 'serialization' in groups:
+        yield from serialization_benchmarks()
+    if 'endpoints' in groups:
+        yield from endpoint_benchmarks()
+
+
+def mongo_is_available() -> bool:
+    from src import connections
+
+    try:
+        connections.ping()
+        return True
+    except PyMongoError as error:
+        print('skipping the mongo benchmarks, no server answered: {}'.format(error), file=sys.stderr)
+        return False
+
+
+def run(groups: List[str], backends: List[str], sizes: List[int], repeat: int) -> dict:
+    if 'repositories' in groups and 'mongo' in backends and not mongo_is_available():
+        backends = [backend for backend in backends if backend != 'mongo']
+
+    results = {}
+    for name, function in benchmarks_for(groups, backends, sizes):
+        results[name] = measure(function, repeat)
+        print('{:<56} {:>14.2f} us'.format(name, results[name]['min_us']), flush=True)
+    return results
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[dict]:
+    '''
+        Compares the fastest sample of each benchmark present in both runs
+    :return: one row per benchmark, flagged as a regression when it got more than threshold slower
+    '''
+    rows = []
+    for name in sorted(set(baseline['results']) & set(current['results'])):
+        baseline_us = baseline['results'][name]['min_us']
+        current_us = current['results'][name]['min_us']
+        change = current_us / baseline_us - 1
+        rows.append({
+            'name': name,
+            'baseline_us': baseline_us,
+            'current_us': current_us,
+            'change': change,
+            'regression': change > threshold,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run')
+    run_parser.add_argument('--output', default='benchmarks/results/latest.json')
+    run_parser.add_argument('--group', action='append', choices=GROUPS, help='default: all groups')
+    run_parser.add_argument('--backend', action='append', choices=BACKENDS, help='default: all backends')
+    run_parser.add_argument('--size', action='append', type=int, help='default: {}'.format(SIZES))
+    run_parser.add_argument('--repeat', type=int, default=5)
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help='relative slowdown flagged as a regression, default: 0.10')
+    arguments = parser.parse_args()
+
+    if arguments.command == 'run':
+        results = run(arguments.group or GROUPS, arguments.backend or BACKENDS, arguments.size or SIZES, arguments.repeat)
+        os.makedirs(os.path.dirname(arguments.output) or '.', exist_ok=True)
+        with open(arguments.output, 'w') as output:
+            json.dump({
+                'created_at': datetime.utcnow().isoformat(),
+                'python': platform.python_version(),
+                'machine': platform.platform(),
+                'repository_backend': os.environ.get('REPOSITORY_BACKEND', 'mongo'),
+                'results': results,
+            }, output, indent=2)
+        print('saved {} results to {}'.format(len(results), arguments.output))
+        return
+
+    with open(arguments.baseline) as baseline, open(arguments.current) as current:
+        rows = compare(json.load(baseline), json.load(current), arguments.threshold)
+    print('{:<56} {:>14} {:>14} {:>8}'.format('benchmark', 'baseline us', 'current us', 'change'))
+    for row in rows:
+        print('{name:<56} {baseline_us:>14.2f} {current_us:>14.2f} {change:>+8.1%}{flag}'.format(
+            flag='  REGRESSION' if row['regression'] else '', **row
+        ))
+    regressions = [row for row in rows if row['regression']]
+    print('{} of {} benchmarks regressed more than {:.0%}'.format(len(regressions), len(rows), arguments.threshold))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+A minimal ASGI application that serves the original product, kit and calculated kit resources of the flask-restx api,
+with the same models and error payloads. Routes, methods and query arguments it doesn't serve are answered with a
+404, 405 or 400 instead of being ignored, see the README."""
+import json
+import logging
+from typing import Callable, List
+
+import msgpack
+from flask_restx import Api, marshal
+from jsonschema import RefResolver
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.exceptions import HTTPException, BadRequest, InternalServerError
+from werkzeug.http import parse_accept_header, parse_options_header
+from werkzeug.routing import Map, Rule
+from werkzeug.urls import url_decode
+
+from src.base.representations import MSGPACK_MEDIATYPE
+from src.base.serialization import CaseStyleConverter
+
+JSON_MEDIATYPE = 'application/json'
+HTTP_METHODS = ['get', 'post', 'put', 'patch', 'delete']
+
+logger = logging.getLogger(__name__)
+
+
+class AsgiRequest(object):
+
+    def __init__(self, scope: dict, body: bytes):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        self.args = url_decode(scope.get('query_string', b''))
+        self.body = body
+
+    @property
+    def mimetype(self) -> str:
+        return parse_options_header(self.headers.get('content-type', ''))[0]
+
+    def get_json(self):
+        try:
+            if self.mimetype == MSGPACK_MEDIATYPE:
+                return msgpack.unpackb(self.body, raw=False)
+            if self.mimetype == JSON_MEDIATYPE or self.mimetype.endswith('+json'):
+                return json.loads(self.body)
+        except ValueError:
+            raise BadRequest('Failed to decode JSON object')
+        return None
+
+    def best_mediatype(self) -> str:
+        accept = parse_accept_header(self.headers.get('accept', ''), MIMEAccept)
+        return accept.best_match([JSON_MEDIATYPE, MSGPACK_MEDIATYPE], default=JSON_MEDIATYPE)
+
+
+class AsyncResourceBase(object):
+    # INFO: the query arguments the resource serves, any other one is a 400 rather than silently ignored
+    query_arguments = ()
+
+    def __init__(self, api: Api):
+        self._converter = CaseStyleConverter()
+        self.__resolver = RefResolver.from_schema({
+            'definitions': {name: model.__schema__ for name, model in api.models.items()}
+        })
+
+    def _serialize_in(self, request: AsgiRequest, model) -> dict:
+        payload = request.get_json()
+        model.validate(payload, self.__resolver)
+        return self._converter.camel_to_snake(marshal(payload, model))
+
+
+class AsgiApp(object):
+
+    def __init__(self):
+        self.__url_map = Map()
+        self.__resources = {}
+        self.__startup_handlers: List[Callable] = []
+        self.__shutdown_handlers: List[Callable] = []
+
+    def add_resource(self, resource: AsyncResourceBase, rule: str) -> None:
+        endpoint = type(resource).__name__
+        methods = [method.upper() for method in HTTP_METHODS if hasattr(resource, method)]
+        self.__url_map.add(Rule(rule, endpoint=endpoint, methods=methods))
+        self.__resources[endpoint] = resource
+
+    def on_startup(self, handler: Callable) -> Callable:
+        self.__startup_handlers.append(handler)
+        return handler
+
+    def on_shutdown(self, handler: Callable) -> Callable:
+        self.__shutdown_handlers.append(handler)
+        return handler
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope['type'] == 'lifespan':
+            await self.__handle_lifespan(receive, send)
+        elif scope['type'] == 'http':
+            request = AsgiRequest(scope, await self.__read_body(receive))
+            data, code = await self.__dispatch(request)
+            await self.__send_response(send, request, data, code)
+
+    async def __dispatch(self, request: AsgiRequest):
+        try:
+            endpoint, view_args = self.__url_map.bind('localhost').match(request.path, request.method)
+            resource = self.__resources[endpoint]
+            unsupported_arguments = sorted(set(request.args) - set(resource.query_arguments))
+            if unsupported_arguments:
+                return {
+                    'message': 'Query arguments not supported by the ASGI deployment.',
+                    'arguments': unsupported_arguments
+                }, 400
+            method = getattr(resource, request.method.lower(), None) or getattr(resource, 'get')
+            response = await method(request, **view_args)
+            if isinstance(response, tuple):
+                return response
+            return response, 200
+        except HTTPException as error:
+            return getattr(error, 'data', None) or {'message': error.description}, error.code
+        except Exception:
+            logger.exception('Unhandled exception on %s %s', request.method, request.path)
+            return {'message': InternalServerError.description}, 500
+
+    async def __send_response(self, send: Callable, request: AsgiRequest, data, code: int) -> None:
+        mediatype = request.best_mediatype()
+        body = b''
+        if code != 204 and request.method != 'HEAD':
+            if mediatype == MSGPACK_MEDIATYPE:
+                body = msgpack.packb(data, use_bin_type=True)
+            else:
+                body = (json.dumps(data) + '\n').encode()
+
+        await send({
+            'type': 'http.response.start',
+            'status': code,
+            'headers': [
+                (b'content-type', mediatype.encode()),
+                (b'content-length', str(len(body)).encode()),
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    async def __read_body(receive: Callable) -> bytes:
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        return b''.join(chunks)
+
+    async def __handle_lifespan(self, receive: Callable, send: Callable) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                for handler in self.__startup_handlers:
+                    await handler()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for handler in self.__shutdown_handlers:
+                    await handler()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,130 @@
+import itertools
+from typing import List
+from urllib.parse import urlsplit
+
+from flask import Flask, Response, current_app, request
+from flask_restx import fields
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+
+from src.base.endpoints import ResourceBase, responses_doc_for
+from src.base.loading import BatchLoader
+from src.base.representations import MSGPACK_MEDIATYPE
+from src.web_app import get_api
+
+api = get_api()
+
+BATCH_METHODS = ['GET', 'POST', 'PUT', 'PATCH', 'DELETE']
+# INFO: a batch can't contain another batch, nor the admin endpoints
+EXCLUDED_PATH_PREFIXES = ('/api/batch', '/api/admin')
+# INFO: the body of the batch request, replaced by the one of each sub-request
+BODY_ENVIRON_KEYS = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_TRANSFER_ENCODING', 'wsgi.input', 'wsgi.input_terminated')
+
+batch_sub_request_model = api.model('BatchSubRequest', {
+    'method': fields.String(required=True, enum=BATCH_METHODS),
+    'path': fields.String(required=True, description='Path and query string, e.g. /api/products/1?fields=sku,price'),
+    'body': fields.Raw(description='JSON body of a POST, PUT or PATCH')
+})
+
+batch_request_model = api.model('BatchRequest', {
+    'requests': fields.List(fields.Nested(batch_sub_request_model), required=True)
+})
+
+
+def sub_request_environ(sub_request: dict) -> dict:
+    '''
+        The environ of the batch request, so its headers (Accept, authorization, request id, ...) apply to the
+        sub-request, with the method, path, query string and body of the sub-request
+    :return:
+    '''
+    builder = EnvironBuilder(
+        path=sub_request['path'], base_url=request.url_root, method=sub_request['method'], json=sub_request.get('body')
+    )
+    try:
+        environ = {
+            key: value for key, value in request.environ.items()
+            if key not in BODY_ENVIRON_KEYS and not key.startswith('werkzeug.')
+        }
+        environ.update(builder.get_environ())
+    finally:
+        builder.close()
+    return environ
+
+
+def body_of(response: Response):
+    if response.mimetype == MSGPACK_MEDIATYPE:
+        import msgpack
+
+        return msgpack.unpackb(response.get_data(), raw=False)
+    return response.get_json(silent=True)
+
+
+def dispatch(web_app: Flask, sub_request: dict) -> dict:
+    '''
+        Runs a sub-request like a request of its own, before and after request hooks included, so it is timed,
+        logged and traced (as a child span of the batch). Its round trips also count for the batch. It gets its own
+        app context, so nothing it puts in g leaks.
+    :return:
+    '''
+    method, path = sub_request['method'], sub_request['path']
+    if not path.startswith('/api/') or path.startswith(EXCLUDED_PATH_PREFIXES):
+        return {'status': 400, 'body': {'message': 'This path cant be part of a batch.', 'path': path}}
+
+    environ = sub_request_environ(sub_request)
+    with web_app.app_context(), web_app.request_context(environ):
+        try:
+            response = web_app.full_dispatch_request()
+        except Exception:
+            web_app.logger.exception('batch sub-request %s %s failed', method, path)
+            response = web_app.finalize_request(({'message': 'Internal Server Error'}, 500), from_error_handler=True)
+    body = body_of(response)
+    if body is None and response.status_code >= 400:
+        body = {'message': response.status}
+    return {'status': response.status_code, 'body': body}
+
+
+@api.doc()
+class BatchResource(ResourceBase):
+
+    def __init__(self, *args, **kwargs):
+        super(BatchResource, self).__init__(*args, **kwargs)
+        self.__batch_loader = kwargs['batch_loader']
+        self.__max_size = kwargs['max_size']
+
+    @api.expect(batch_request_model, validate=True)
+    @api.doc(responses=responses_doc_for(200, 400, 500))
+    def post(self):
+        '''
+            Runs the requests in order and answers {"responses": [{"status": 200, "body": ...}, ...]}
+        :return:
+        '''
+        sub_requests = request.json['requests']
+        if not 0 < len(sub_requests) <= self.__max_size:
+            api.abort(400, 'A batch takes 1 to {} requests.'.format(self.__max_size), size=len(sub_requests))
+
+        web_app = current_app._get_current_object()
+        responses = []
+        for is_read, group in itertools.groupby(sub_requests, key=lambda sub_request: sub_request['method'] == 'GET'):
+            group = list(group)
+            if not is_read:
+                responses.extend(dispatch(web_app, sub_request) for sub_request in group)
+                continue
+            # INFO: consecutive GETs don't depend on each other, a write in between starts another group
+            with self.__batch_loader.loading(self.__view_args_of(web_app, group)):
+                responses.extend(dispatch(web_app, sub_request) for sub_request in group)
+        return {'responses': responses}
+
+    def __view_args_of(self, web_app: Flask, sub_requests: List[dict]) -> List[dict]:
+        url_adapter = web_app.url_map.bind('')
+        view_args_list = []
+        for sub_request in sub_requests:
+            try:
+                _, view_args = url_adapter.match(urlsplit(sub_request['path']).path, method='GET')
+            except HTTPException:
+                continue
+            view_args_list.append(view_args)
+        return view_args_list
+
+
+def register(batch_loader: BatchLoader, max_size: int) -> None:
+    api.add_resource(BatchResource, '/api/batch', resource_class_kwargs={'batch_loader': batch_loader, 'max_size': max_size})
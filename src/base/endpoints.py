@@ -1,7 +1,11 @@
+from typing import List
+
 from flask import request
-from flask_restx import Resource, marshal
+from flask_restx import Resource, abort, marshal
+from flask_restx.mask import Mask, MaskError
 
 from src.base.serialization import CaseStyleConverter
+from src.instrumentation import tracing
 
 RESPONSES_DOC = {
     200: 'OK. Standard response for successful HTTP requests. The actual response will depend on the request method used. In a GET request, the response will contain an entity corresponding to the requested resource. In a POST request, the response will contain an entity describing or containing the result of the action',
@@ -11,7 +15,16 @@ RESPONSES_DOC = {
     403: 'Forbidden. The request contained valid data and was understood by the server, but the server is refusing action. This may be due to the user not having the necessary permissions for a resource or needing an account of some sort, or attempting a prohibited action (e.g. creating a duplicate record where only one is allowed). This code is also typically used if the request provided authentication by answering the WWW-Authenticate header field challenge, but the server did not accept that authentication. The request should not be repeated.',
     404: 'Not Found. The requested resource could not be found but may be available in the future. Subsequent requests by the client are permissible.',
     405: 'Method Not Allowed. A request method is not supported for the requested resource; for example, a GET request on a form that requires data to be presented via POST, or a PUT request on a read-only resource.',
-    500: 'Internal Server Error. A generic error message, given when an unexpected condition was encountered and no more specific message is suitable.'
+    409: 'Conflict. The request could not be processed because of a conflict with the current state of the resource, e.g. a concurrent update. The request can be repeated.',
+    500: 'Internal Server Error. A generic error message, given when an unexpected condition was encountered and no more specific message is suitable.',
+    503: 'Service Unavailable. The server cannot handle the request (because it is overloaded or a dependency is down). Generally, this is a temporary state.'
+}
+
+
+FIELDS_ARGUMENT = 'fields'
+FIELDS_DOC = {
+    FIELDS_ARGUMENT: 'Comma separated fields to return, e.g. sku,price,inventoryQuantity, and of nested ones in braces, '
+                     'e.g. sku,kitProducts{productSku}. Default: every field'
 }
 
 
@@ -33,4 +46,46 @@ class ResourceBase(Resource):
         self._converter = CaseStyleConverter()
 
     def _serialize_in(self, model):
-        return self._converter.camel_to_snake(marshal(request.json, model))
+        with tracing.span('serialize_in'):
+            return self._converter.camel_to_snake(marshal(request.json, model))
+
+    def _serialize_patch_in(self, model):
+        '''
+            Like _serialize_in, with only the attributes the body has
+        :return:
+        '''
+        with tracing.span('serialize_in'):
+            return self._converter.camel_to_snake(marshal(request.json, model, skip_none=True))
+
+    def _fields(self, model) -> List[str]:
+        '''
+            The attributes of the model the fields argument selects, for the repositories to read only those,
+            None without fields
+        :return:
+        '''
+        mask = self.__fields_mask()
+        if mask is None:
+            return None
+        unknown_fields = [name for name in mask if name not in model]
+        if unknown_fields:
+            abort(400, 'Invalid fields.', fields=unknown_fields, valid_fields=list(model))
+        # INFO: fields declared as classes, e.g. fields.String, have no attribute of their own
+        return [getattr(model[name], 'attribute', None) or name for name in mask]
+
+    def _marshal(self, data, model):
+        '''
+            Marshals only the fields the fields argument selects, every field without it
+        :return:
+        '''
+        try:
+            return marshal(data, model, mask=self.__fields_mask())
+        except MaskError as error:
+            abort(400, 'Invalid fields.', fields=request.args[FIELDS_ARGUMENT], error=str(error))
+
+    def __fields_mask(self) -> Mask:
+        if not request.args.get(FIELDS_ARGUMENT):
+            return None
+        try:
+            return Mask(request.args[FIELDS_ARGUMENT])
+        except MaskError as error:
+            abort(400, 'Invalid fields.', fields=request.args[FIELDS_ARGUMENT], error=str(error))
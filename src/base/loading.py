@@ -0,0 +1,77 @@
+import threading
+from contextlib import contextmanager
+from typing import List
+
+from src.exceptions import NotFound
+
+PRODUCT = 'product'
+KIT = 'kit'
+
+
+class BatchLoader(object):
+    '''
+        Coalesces the get_by_id of the consecutive GETs of a batch: the ids in their paths are read up front with
+        one get_many_by_ids per repository. The services given a loader ask it for their repository, which is the
+        repository itself, or inside loading a LoadingRepository answering get_by_id from what was read.
+    '''
+
+    def __init__(self):
+        self.__local = threading.local()
+        self.__repositories = {}
+
+    def register(self, kind: str, repository, id_argument: str) -> None:
+        '''
+            Loads the entities of kind (e.g. product) from the repository, for the routes with an id_argument
+            (e.g. product_id)
+        :return:
+        '''
+        self.__repositories[kind] = (repository, id_argument)
+
+    @contextmanager
+    def loading(self, view_args_list: List[dict]):
+        ids_by_kind = {}
+        for view_args in view_args_list:
+            for kind, (_, id_argument) in self.__repositories.items():
+                if id_argument in view_args:
+                    ids_by_kind.setdefault(kind, {})[view_args[id_argument]] = None
+
+        self.__local.loaded = {
+            kind: dict(zip(entity_ids, self.__repositories[kind][0].get_many_by_ids(list(entity_ids))))
+            for kind, entity_ids in ids_by_kind.items()
+        }
+        try:
+            yield
+        finally:
+            self.__local.loaded = None
+
+    def repository(self, kind: str, repository):
+        '''
+            The repository a service reads entities of kind from on the current thread
+        :return:
+        '''
+        loaded = getattr(self.__local, 'loaded', None)
+        if not loaded or kind not in loaded:
+            return repository
+        return LoadingRepository(repository, kind, loaded[kind])
+
+
+class LoadingRepository(object):
+    '''
+        Wraps a ProductRepository or KitRepository for one batch, answering get_by_id from the loaded entities
+    '''
+
+    def __init__(self, repository, kind: str, loaded: dict):
+        self.__repository = repository
+        self.__kind = kind
+        self.__loaded = loaded
+
+    def get_by_id(self, entity_id: str, fields: List[str] = None):
+        if entity_id not in self.__loaded:
+            return self.__repository.get_by_id(entity_id, fields=fields)
+        entity = self.__loaded[entity_id]
+        if entity is None:
+            raise NotFound(f'{self.__kind} id: {entity_id} not found')
+        return entity
+
+    def __getattr__(self, name: str):
+        return getattr(self.__repository, name)
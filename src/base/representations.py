@@ -0,0 +1,41 @@
+from flask import Request, make_response
+
+MSGPACK_MEDIATYPE = 'application/msgpack'
+
+
+def output_msgpack(data, code, headers=None):
+    """Makes a Flask response with a MessagePack encoded body"""
+    import msgpack
+
+    resp = make_response(msgpack.packb(data, use_bin_type=True), code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
+class MsgpackAwareRequest(Request):
+    '''
+        Decodes application/msgpack bodies through get_json, so payload validation and
+        ResourceBase._serialize_in work the same way for JSON and MessagePack clients.
+    '''
+
+    __msgpack_payload = Ellipsis
+
+    def get_json(self, force=False, silent=False, cache=True):
+        if self.mimetype != MSGPACK_MEDIATYPE:
+            return super(MsgpackAwareRequest, self).get_json(force=force, silent=silent, cache=cache)
+
+        if cache and self.__msgpack_payload is not Ellipsis:
+            return self.__msgpack_payload
+
+        import msgpack
+
+        try:
+            payload = msgpack.unpackb(self.get_data(cache=cache), raw=False)
+        except ValueError as error:
+            if silent:
+                return None
+            payload = self.on_json_loading_failed(error)
+
+        if cache:
+            self.__msgpack_payload = payload
+        return payload
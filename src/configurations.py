@@ -4,23 +4,86 @@ from importlib import import_module
 from src import exceptions
 
 
+def optional_int(name: str):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
 class Config(object):
     DEBUG = False
     TESTING = False
     DEVELOPMENT = False
     PRODUCTION = False
+    ADMIN_ENDPOINTS_ENABLED = os.environ.get('ADMIN_ENDPOINTS_ENABLED', 'false') == 'true'
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true') == 'true'
+    # INFO: profiles a sample of the kit management requests and keeps the ones slower than the threshold
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'false') == 'true'
+    PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', 0.01))
+    PROFILER_SLOW_REQUEST_MS = float(os.environ.get('PROFILER_SLOW_REQUEST_MS', 500))
+    PROFILER_MAX_PROFILES = int(os.environ.get('PROFILER_MAX_PROFILES', 50))
+    # INFO: tracemalloc snapshots around a sample of the requests, tracing slows every allocation down
+    ALLOCATION_PROFILER_ENABLED = os.environ.get('ALLOCATION_PROFILER_ENABLED', 'false') == 'true'
+    ALLOCATION_PROFILER_SAMPLE_RATE = float(os.environ.get('ALLOCATION_PROFILER_SAMPLE_RATE', 0.01))
+    ALLOCATION_PROFILER_FRAMES = int(os.environ.get('ALLOCATION_PROFILER_FRAMES', 1))
+    # INFO: adds X-Repository-Calls and X-Mongo-Commands headers, and logs requests over the budget or repeating calls
+    QUERY_COUNTING_ENABLED = os.environ.get('QUERY_COUNTING_ENABLED', 'false') == 'true'
+    QUERY_BUDGET = optional_int('QUERY_BUDGET')
+    QUERY_N_PLUS_ONE_THRESHOLD = int(os.environ.get('QUERY_N_PLUS_ONE_THRESHOLD', 5))
+    # INFO: lets GET requests add ?explain=1 to get the Mongo query plans along with the response, for admins only:
+    # the requests must send EXPLAIN_ADMIN_TOKEN in the X-Admin-Token header, nothing is explained without one
+    EXPLAIN_ENABLED = os.environ.get('EXPLAIN_ENABLED', 'false') == 'true'
+    EXPLAIN_ADMIN_TOKEN = os.environ.get('EXPLAIN_ADMIN_TOKEN', '')
+    # INFO: off when empty, file (OTLP JSON lines in TRACING_FILE) or otlp (POST to TRACING_OTLP_ENDPOINT)
+    TRACING_EXPORTER = os.environ.get('TRACING_EXPORTER', '')
+    TRACING_FILE = os.environ.get('TRACING_FILE', 'traces.jsonl')
+    TRACING_OTLP_ENDPOINT = os.environ.get('TRACING_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+    TRACING_SAMPLE_RATE = float(os.environ.get('TRACING_SAMPLE_RATE', 1.0))
+    # INFO: approximate top product and kit keys by access count, in bounded memory (count-min sketch)
+    HOT_KEYS_ENABLED = os.environ.get('HOT_KEYS_ENABLED', 'false') == 'true'
+    HOT_KEYS_CAPACITY = int(os.environ.get('HOT_KEYS_CAPACITY', 100))
+    HOT_KEYS_SKETCH_WIDTH = int(os.environ.get('HOT_KEYS_SKETCH_WIDTH', 2048))
+    HOT_KEYS_SKETCH_DEPTH = int(os.environ.get('HOT_KEYS_SKETCH_DEPTH', 4))
+    # INFO: one JSON line per request, written by a background thread, sampled per status class (e.g. 2xx=0.1,5xx=1)
+    ACCESS_LOG_ENABLED = os.environ.get('ACCESS_LOG_ENABLED', 'false') == 'true'
+    ACCESS_LOG_SAMPLE_RATES = os.environ.get('ACCESS_LOG_SAMPLE_RATES', '')
+    ACCESS_LOG_FILE = os.environ.get('ACCESS_LOG_FILE', '')
+    # INFO: encodes every Mongo command and reply again to measure them, on all requests, sampled out or not
+    ACCESS_LOG_MONGO_BYTES_ENABLED = os.environ.get('ACCESS_LOG_MONGO_BYTES_ENABLED', 'false') == 'true'
+    # INFO: most sub-requests a POST /api/batch can run
+    BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 50))
+    # INFO: mongo or memory, if you dont like databases just use the inmemory repositories
+    REPOSITORY_BACKEND = os.environ.get('REPOSITORY_BACKEND', 'mongo')
     MONGO_HOST = os.environ['MONGO_HOST']
     MONGO_PORT = int(os.environ['MONGO_PORT'])
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = optional_int('MONGO_WAIT_QUEUE_TIMEOUT_MS')
+    MONGO_SOCKET_TIMEOUT_MS = optional_int('MONGO_SOCKET_TIMEOUT_MS')
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000))
+    # INFO: comma separated, in order of preference, e.g. zstd,snappy,zlib
+    MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')
+    MONGO_WRITE_CONCERN = os.environ.get('MONGO_WRITE_CONCERN', '1')
+    # INFO: used by read only queries (lists and calculated kits), e.g. secondaryPreferred
+    MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+    MONGO_READ_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_READ_MAX_STALENESS_SECONDS', -1))
 
 
 class ProductionConfig(Config):
     PRODUCTION = True
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 10))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = optional_int('MONGO_WAIT_QUEUE_TIMEOUT_MS') or 1000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+    MONGO_WRITE_CONCERN = os.environ.get('MONGO_WRITE_CONCERN', 'majority')
+    ACCESS_LOG_ENABLED = os.environ.get('ACCESS_LOG_ENABLED', 'true') == 'true'
+    ACCESS_LOG_SAMPLE_RATES = os.environ.get('ACCESS_LOG_SAMPLE_RATES', '2xx=0.1,3xx=0.1')
 
 
 class DevelopmentConfig(Config):
     ENVIRONMENT = 'development'
     DEBUG = True
     DEVELOPMENT = True
+    ADMIN_ENDPOINTS_ENABLED = os.environ.get('ADMIN_ENDPOINTS_ENABLED', 'true') == 'true'
+    QUERY_COUNTING_ENABLED = os.environ.get('QUERY_COUNTING_ENABLED', 'true') == 'true'
 
 
 class TestingConfig(Config):
@@ -1,24 +1,215 @@
 """"
 This module hold all the applications connections as databases"""
+import os
+import threading
+import time
+from typing import List
+
 import pymongo
 from flask import Flask
+from pymongo import read_preferences
+from pymongo.collection import Collection
+from pymongo.write_concern import WriteConcern
 
 from src import configurations
+from src.instrumentation.commands import CommandCounter
+from src.instrumentation.explain import QueryExplainer
+from src.instrumentation.metrics import CommandTimingListener
+from src.instrumentation.pool import PoolCheckoutListener
 
-config = configurations.get_config()
+pool_listener = PoolCheckoutListener()
+command_listener = CommandTimingListener()
+command_counter = CommandCounter()
+query_explainer = QueryExplainer()
 mongo_client = None
+mongo_client_pid = None
+mongo_client_lock = threading.Lock()
 mongo_kit_db = None
+mongo_kit_read_db = None
+motor_client = None
+motor_kit_db = None
+motor_kit_read_db = None
+
+# INFO: the single index policy of both deployments, created by flask create-indexes and checked by the readiness
+# endpoint: each collection's (field, unique) indexes
+INDEXES = {
+    'products': [
+        ('sku', True), ('searchTokens', False), ('price', False), ('cost', False), ('inventoryQuantity', False)
+    ],
+    'kits': [('sku', True), ('kitProducts.productSku', False)],
+    'kitAvailability': [('inventoryQuantity', False)],
+}
+
+READ_PREFERENCES = {
+    'primary': read_preferences.Primary,
+    'primaryPreferred': read_preferences.PrimaryPreferred,
+    'secondary': read_preferences.Secondary,
+    'secondaryPreferred': read_preferences.SecondaryPreferred,
+    'nearest': read_preferences.Nearest,
+}
+
+
+def get_mongo_client_options() -> dict:
+    config = configurations.get_config()
+    options = {
+        'maxPoolSize': config.MONGO_MAX_POOL_SIZE,
+        'minPoolSize': config.MONGO_MIN_POOL_SIZE,
+        'waitQueueTimeoutMS': config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        'socketTimeoutMS': config.MONGO_SOCKET_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'event_listeners': [pool_listener, command_listener, command_counter, query_explainer],
+    }
+    if config.MONGO_COMPRESSORS:
+        options['compressors'] = config.MONGO_COMPRESSORS
+    return options
+
+
+def get_write_concern() -> WriteConcern:
+    config = configurations.get_config()
+    write_concern = config.MONGO_WRITE_CONCERN
+    return WriteConcern(w=int(write_concern) if write_concern.isdigit() else write_concern)
+
+
+def get_read_preference():
+    config = configurations.get_config()
+    read_preference_class = READ_PREFERENCES[config.MONGO_READ_PREFERENCE]
+    if read_preference_class is read_preferences.Primary:
+        return read_preference_class()
+    return read_preference_class(max_staleness=config.MONGO_READ_MAX_STALENESS_SECONDS)
+
+
+class LazyMongoDatabase(object):
+    '''
+        Stands in for a pymongo Database until the first query of the current process, so no MongoClient (and its
+        monitor threads) exists before a pre-fork server forks its workers.
+    '''
+
+    def __init__(self, name: str, **options):
+        self.__name = name
+        self.__options = options
+        self.__client = None
+        self.__database = None
+
+    def __getitem__(self, collection_name: str) -> Collection:
+        client = get_mongo_client()
+        if client is not self.__client:
+            self.__database = client.get_database(self.__name, **self.__options)
+            self.__client = client
+        return self.__database[collection_name]
+
+
+def get_mongo_client() -> pymongo.MongoClient:
+    '''
+        Returns the MongoClient of the current process, creating it on first use. A client inherited through fork
+        is discarded, since its sockets and monitor threads are not safe to use in the child.
+    :return:
+    '''
+    global mongo_client
+    global mongo_client_pid
+    if mongo_client is None or mongo_client_pid != os.getpid():
+        with mongo_client_lock:
+            if mongo_client is None or mongo_client_pid != os.getpid():
+                config = configurations.get_config()
+                mongo_client = pymongo.MongoClient(config.MONGO_HOST, config.MONGO_PORT, **get_mongo_client_options())
+                mongo_client_pid = os.getpid()
+    return mongo_client
 
 
 def register(web_app: Flask) -> None:
     '''
-        The initializer class should call this method to create the connections
+        The initializer class should call this method to declare the connections. No connection is opened here,
+        the client is created by the first query of each process (or by connect, from a post fork hook).
     :param web_app:
     :return:
     '''
-    global mongo_client
     global mongo_kit_db
-    mongo_client = pymongo.MongoClient(config.MONGO_HOST, config.MONGO_PORT)
-    mongo_kit_db = mongo_client['local']
-    mongo_kit_db.products.create_index("sku", unique=True)
-    mongo_kit_db.kits.create_index("sku", unique=True)
+    global mongo_kit_read_db
+    mongo_kit_db = LazyMongoDatabase('local', write_concern=get_write_concern())
+    mongo_kit_read_db = LazyMongoDatabase('local', read_preference=get_read_preference())
+
+
+def connect() -> None:
+    '''
+        Creates the client of the current process right away, meant for post fork hooks of pre-fork servers
+    :return:
+    '''
+    get_mongo_client()
+
+
+def ping() -> float:
+    '''
+        Round trips to the server through the pool of the current process
+    :return: the round trip time in milliseconds
+    '''
+    started_at = time.perf_counter()
+    get_mongo_client().admin.command('ping')
+    return (time.perf_counter() - started_at) * 1000
+
+
+def create_indexes() -> None:
+    '''
+        Startup task, run once per deployment (flask create-indexes) instead of on every process start, for the flask
+        and the ASGI deployments alike
+    :return:
+    '''
+    for collection_name, indexes in INDEXES.items():
+        for field, unique in indexes:
+            mongo_kit_db[collection_name].create_index(field, unique=unique)
+
+
+def missing_indexes() -> List[str]:
+    '''
+        The indexes of INDEXES that don't exist, or aren't unique when they should be, as collection.field
+    :return:
+    '''
+    missing = []
+    for collection_name, indexes in INDEXES.items():
+        existing = {
+            tuple(index['key']): index.get('unique', False)
+            for index in mongo_kit_db[collection_name].index_information().values()
+        }
+        for field, unique in indexes:
+            index_unique = existing.get(((field, 1),))
+            if index_unique is None or (unique and not index_unique):
+                missing.append(f'{collection_name}.{field}')
+    return missing
+
+
+def backfill_search_tokens() -> None:
+    '''
+        Startup task (flask backfill-search-tokens), adds the search tokens to the products written before product
+        search existed. Products get them on every add and update.
+    :return:
+    '''
+    from src.kitmanagement.repositories import create_product_from_mongo, product_search_tokens
+
+    products = mongo_kit_db['products']
+    updates = []
+    for mongo_product in products.find({'searchTokens': {'$exists': False}}):
+        product = create_product_from_mongo(mongo_product)
+        updates.append(pymongo.UpdateOne(
+            {'_id': mongo_product['_id']}, {'$set': {'searchTokens': product_search_tokens(product)}}
+        ))
+        if len(updates) == 1000:
+            products.bulk_write(updates, ordered=False)
+            updates = []
+    if updates:
+        products.bulk_write(updates, ordered=False)
+
+
+async def register_async() -> None:
+    '''
+        The asgi initializer should call this method on startup, inside the running event loop, to create the
+        motor connections. Motor is imported here so the wsgi deployment does not depend on it. Like the wsgi
+        deployment, no index is created here, they are created by flask create-indexes.
+    :return:
+    '''
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    global motor_client
+    global motor_kit_db
+    global motor_kit_read_db
+    config = configurations.get_config()
+    motor_client = AsyncIOMotorClient(config.MONGO_HOST, config.MONGO_PORT, **get_mongo_client_options())
+    motor_kit_db = motor_client.get_database('local', write_concern=get_write_concern())
+    motor_kit_read_db = motor_client.get_database('local', read_preference=get_read_preference())
@@ -16,3 +16,11 @@ class skuExistsError(Exception):
 
 class ProductInUseError(Exception):
     pass
+
+
+class KitProductExistsError(Exception):
+    pass
+
+
+class ConcurrentUpdateError(Exception):
+    pass
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn settings, selected by GUNICORN_PRESET (sync, gthread or gevent). Any value can be overridden through the
+GUNICORN_* environment variables below or through gunicorn's own command line flags.
+
+    $ GUNICORN_PRESET=gthread gunicorn -c python:src.gunicorn_config src.wsgi:application
+"""
+import multiprocessing
+import os
+
+CPUS = multiprocessing.cpu_count()
+
+PRESETS = {
+    # INFO: one request per process, the most predictable under cpu bound load (calculated kits with huge bundles)
+    'sync': {
+        'worker_class': 'sync',
+        'workers': CPUS * 2 + 1,
+        'threads': 1,
+        'worker_connections': 1000,
+        'preload_app': True,
+    },
+    # INFO: threads overlap the mongo round trips, keep MONGO_MAX_POOL_SIZE >= threads
+    'gthread': {
+        'worker_class': 'gthread',
+        'workers': CPUS,
+        'threads': 8,
+        'worker_connections': 1000,
+        'preload_app': True,
+    },
+    # INFO: the app is not preloaded, so gevent monkey patches threading and sockets before pymongo is imported.
+    # Concurrent greenlets above MONGO_MAX_POOL_SIZE queue on the pool, see /api/admin/mongo-pool
+    'gevent': {
+        'worker_class': 'gevent',
+        'workers': CPUS,
+        'threads': 1,
+        'worker_connections': 256,
+        'preload_app': False,
+    },
+}
+
+preset = PRESETS[os.environ.get('GUNICORN_PRESET', 'gthread')]
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8007')
+worker_class = preset['worker_class']
+workers = int(os.environ.get('GUNICORN_WORKERS', preset['workers']))
+threads = int(os.environ.get('GUNICORN_THREADS', preset['threads']))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', preset['worker_connections']))
+preload_app = preset['preload_app']
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# INFO: recycles workers to bound slow memory growth, the jitter avoids restarting all of them at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+accesslog = os.environ.get('GUNICORN_ACCESSLOG')
+
+
+def post_fork(server, worker):
+    '''
+        Each worker opens its own MongoClient right after the fork, so the first request does not pay for it
+    '''
+    from src import configurations, connections
+
+    if configurations.get_config().REPOSITORY_BACKEND != 'memory':
+        connections.connect()
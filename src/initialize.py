@@ -1,30 +1,200 @@
 # -*- coding: utf-8 -*-
+import logging
+import sys
+
+from flask import Flask
 
 from src import configurations, web_app as web_app_module
-from src import connections
-from src.kitmanagement import endpoints as kitmanagement_endpoints
-from src.kitmanagement.application_services import ProductsService, KitsService, CalculatedKitsService
-from src.kitmanagement.repositories import InMemoryProductRepository, InMemoryKitRepository, MongoProductRepository, MongoKitRepository
 
-config = configurations.get_config()
-web_app = web_app_module.get_web_app()
-api = web_app_module.get_api()
 
-connections.register(web_app)
+def create_app() -> Flask:
+    '''
+        Application factory (FLASK_APP=src.initialize:create_app()). Nothing here opens a connection, so it is safe
+        to call before a pre-fork server forks: each worker creates its MongoClient on its first query, or in a
+        post fork hook through connections.connect. Indexes are created by the `flask create-indexes` startup task.
+    :return:
+    '''
+    config = configurations.get_config()
+    web_app = web_app_module.get_web_app()
+    if web_app.extensions.get('kit_api_initialized'):
+        return web_app
+
+    from src.kitmanagement import endpoints as kitmanagement_endpoints
+    from src.kitmanagement.application_services import ProductsService, KitsService, CalculatedKitsService, \
+        KitAvailabilityService
+
+    if config.REPOSITORY_BACKEND == 'memory':
+        from src.kitmanagement.repositories import InMemoryProductRepository, InMemoryKitRepository, \
+            InMemoryKitAvailabilityRepository
+
+        product_repository = read_product_repository = primary_product_repository = InMemoryProductRepository()
+        kit_repository = read_kit_repository = primary_kit_repository = InMemoryKitRepository()
+        kit_availability_repository = InMemoryKitAvailabilityRepository()
+        pool_listener = None
+        command_listener = None
+        command_counter = None
+        ping = None
+        missing_indexes = None
+    else:
+        from src import connections
+        from src.kitmanagement.repositories import MongoProductRepository, MongoKitRepository, \
+            MongoKitAvailabilityRepository
+
+        connections.register(web_app)
+        web_app.cli.command('create-indexes')(connections.create_indexes)
+        web_app.cli.command('backfill-search-tokens')(connections.backfill_search_tokens)
+        if config.EXPLAIN_ENABLED:
+            connections.query_explainer.init_app(web_app, connections.get_mongo_client, config.EXPLAIN_ADMIN_TOKEN)
+
+        product_repository = MongoProductRepository(connections.mongo_kit_db, connections.mongo_kit_read_db)
+        kit_repository = MongoKitRepository(connections.mongo_kit_db, connections.mongo_kit_read_db)
+        # INFO: calculated kits are read only, so they can be served by the read preference (e.g. secondaries)
+        read_product_repository = MongoProductRepository(connections.mongo_kit_read_db)
+        read_kit_repository = MongoKitRepository(connections.mongo_kit_read_db)
+        # INFO: the kit availability is computed right after writes, from the primary, a stale secondary would oversell
+        primary_product_repository = MongoProductRepository(connections.mongo_kit_db)
+        primary_kit_repository = MongoKitRepository(connections.mongo_kit_db)
+        kit_availability_repository = MongoKitAvailabilityRepository(
+            connections.mongo_kit_db, connections.mongo_kit_read_db
+        )
+        pool_listener = connections.pool_listener
+        command_listener = connections.command_listener
+        command_counter = connections.command_counter
+        ping = connections.ping
+        missing_indexes = connections.missing_indexes
+
+    if config.ACCESS_LOG_ENABLED:
+        # INFO: registered before the profilers, so its after_request runs after theirs and sees what they recorded
+        from src.instrumentation.access_log import AccessLog, parse_sample_rates
+
+        mongo_bytes = bool(command_counter) and config.ACCESS_LOG_MONGO_BYTES_ENABLED
+        if mongo_bytes:
+            command_counter.measure_bytes()
+        handler = logging.FileHandler(config.ACCESS_LOG_FILE) if config.ACCESS_LOG_FILE else logging.StreamHandler(sys.stdout)
+        AccessLog(
+            handler, parse_sample_rates(config.ACCESS_LOG_SAMPLE_RATES), command_counter, mongo_bytes
+        ).init_app(web_app)
+
+    if config.QUERY_COUNTING_ENABLED:
+        from src.instrumentation.queries import RepositoryCallCounter, CountingRepository, QueryCounter
+        from src.kitmanagement.domain import ProductRepository, KitRepository, KitAvailabilityRepository
+
+        repository_counter = RepositoryCallCounter()
+        product_repository = CountingRepository(product_repository, ProductRepository, repository_counter)
+        kit_repository = CountingRepository(kit_repository, KitRepository, repository_counter)
+        read_product_repository = CountingRepository(read_product_repository, ProductRepository, repository_counter)
+        read_kit_repository = CountingRepository(read_kit_repository, KitRepository, repository_counter)
+        primary_product_repository = CountingRepository(primary_product_repository, ProductRepository, repository_counter)
+        primary_kit_repository = CountingRepository(primary_kit_repository, KitRepository, repository_counter)
+        kit_availability_repository = CountingRepository(
+            kit_availability_repository, KitAvailabilityRepository, repository_counter
+        )
+        QueryCounter(
+            repository_counter, command_counter, config.QUERY_BUDGET, config.QUERY_N_PLUS_ONE_THRESHOLD
+        ).init_app(web_app)
+
+    tracer = None
+    if config.TRACING_EXPORTER:
+        # INFO: nothing is wrapped when tracing is off, so it costs nothing
+        from src.base.endpoints import ResourceBase
+        from src.instrumentation import tracing
+
+        if config.TRACING_EXPORTER == 'otlp':
+            exporter = tracing.OtlpHttpSpanExporter(config.TRACING_OTLP_ENDPOINT)
+        else:
+            exporter = tracing.FileSpanExporter(config.TRACING_FILE)
+        tracer = tracing.Tracer(exporter, config.TRACING_SAMPLE_RATE)
+        tracing.install(tracer)
+        tracer.init_app(web_app)
+        ResourceBase.method_decorators = [tracer.trace_resource_method]
+        product_repository = tracing.TracingProxy(product_repository, 'ProductRepository', tracer)
+        kit_repository = tracing.TracingProxy(kit_repository, 'KitRepository', tracer)
+        read_product_repository = tracing.TracingProxy(read_product_repository, 'ProductRepository', tracer)
+        read_kit_repository = tracing.TracingProxy(read_kit_repository, 'KitRepository', tracer)
+        primary_product_repository = tracing.TracingProxy(primary_product_repository, 'ProductRepository', tracer)
+        primary_kit_repository = tracing.TracingProxy(primary_kit_repository, 'KitRepository', tracer)
+        kit_availability_repository = tracing.TracingProxy(
+            kit_availability_repository, 'KitAvailabilityRepository', tracer
+        )
+
+    # INFO: loads from the outermost repositories, so the get_by_id answered from what it loaded aren't counted or traced
+    from src.base import batch, loading
+
+    batch_loader = loading.BatchLoader()
+    batch_loader.register(loading.PRODUCT, product_repository, 'product_id')
+    batch_loader.register(loading.KIT, kit_repository, 'kit_id')
+
+    access_statistics = None
+    record_products = None
+    if config.HOT_KEYS_ENABLED:
+        from functools import partial
+        from src.instrumentation import hot_keys
+
+        access_statistics = hot_keys.AccessStatistics(
+            config.HOT_KEYS_CAPACITY, config.HOT_KEYS_SKETCH_WIDTH, config.HOT_KEYS_SKETCH_DEPTH
+        )
+        hot_keys.install(access_statistics)
+        record_products = partial(access_statistics.record, hot_keys.PRODUCT)
+
+    kit_availability_service = KitAvailabilityService(
+        primary_kit_repository, primary_product_repository, kit_availability_repository
+    )
+    if tracer:
+        kit_availability_service = tracing.TracingProxy(kit_availability_service, 'KitAvailabilityService', tracer)
+    if config.REPOSITORY_BACKEND != 'memory':
+        web_app.cli.command('rebuild-kit-availability')(kit_availability_service.rebuild)
+    products_service = ProductsService(product_repository, kit_repository, kit_availability_service, batch_loader)
+    kits_service = KitsService(kit_repository, product_repository, kit_availability_service, batch_loader)
+    calculated_kits_service = CalculatedKitsService(
+        read_kit_repository, read_product_repository, batch_loader, record_products
+    )
+    if tracer:
+        products_service = tracing.TracingProxy(products_service, 'ProductsService', tracer)
+        kits_service = tracing.TracingProxy(kits_service, 'KitsService', tracer)
+        calculated_kits_service = tracing.TracingProxy(calculated_kits_service, 'CalculatedKitsService', tracer)
+
+    kitmanagement_endpoints.register(
+        products_service=products_service,
+        kits_service=kits_service,
+        calculated_kits_service=calculated_kits_service,
+        kit_availability_service=kit_availability_service
+    )
+    batch.register(batch_loader, config.BATCH_MAX_SIZE)
+
+    from src.instrumentation import endpoints as instrumentation_endpoints
+
+    instrumentation_endpoints.register_health(ping=ping, pool_listener=pool_listener, missing_indexes=missing_indexes)
+    if config.METRICS_ENABLED:
+        from src.instrumentation.metrics import RequestMetrics
 
-# INFO: If you dont like databases, just use an inmemory repository
-# product_repository = InMemoryProductRepository()
-# kit_repository = InMemoryKitRepository()
+        request_metrics = RequestMetrics()
+        request_metrics.init_app(web_app)
+        instrumentation_endpoints.register_metrics(web_app, request_metrics, command_listener, pool_listener)
+    profiler = None
+    if config.PROFILER_ENABLED:
+        from src.instrumentation.profiler import SlowRequestProfiler
 
-product_repository = MongoProductRepository(connections.mongo_kit_db)
-kit_repository = MongoKitRepository(connections.mongo_kit_db)
+        profiler = SlowRequestProfiler(
+            config.PROFILER_SAMPLE_RATE,
+            config.PROFILER_SLOW_REQUEST_MS,
+            config.PROFILER_MAX_PROFILES,
+            resource_modules=[kitmanagement_endpoints.__name__],
+            command_counter=command_counter
+        )
+        profiler.init_app(web_app)
+    allocation_profiler = None
+    if config.ALLOCATION_PROFILER_ENABLED:
+        from src.instrumentation.allocations import AllocationProfiler
 
-products_service = ProductsService(product_repository, kit_repository)
-kits_service = KitsService(kit_repository, product_repository)
-calculated_kits_service = CalculatedKitsService(kit_repository, product_repository)
+        allocation_profiler = AllocationProfiler(config.ALLOCATION_PROFILER_SAMPLE_RATE, config.ALLOCATION_PROFILER_FRAMES)
+        allocation_profiler.init_app(web_app)
+    if config.ADMIN_ENDPOINTS_ENABLED:
+        instrumentation_endpoints.register(
+            pool_listener=pool_listener,
+            profiler=profiler,
+            allocation_profiler=allocation_profiler,
+            access_statistics=access_statistics
+        )
 
-kitmanagement_endpoints.register(
-    products_service=products_service,
-    kits_service=kits_service,
-    calculated_kits_service=calculated_kits_service
-)
+    web_app.extensions['kit_api_initialized'] = True
+    return web_app
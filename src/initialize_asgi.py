@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+from src import configurations
+from src import connections
+from src.base.asgi import AsgiApp
+from src.kitmanagement import asgi_endpoints
+from src.kitmanagement.application_services import AsyncProductsService, AsyncKitsService, AsyncCalculatedKitsService, \
+    AsyncKitAvailabilityService
+from src.kitmanagement.repositories import AsyncMongoProductRepository, AsyncMongoKitRepository, \
+    AsyncMongoKitAvailabilityRepository
+
+config = configurations.get_config()
+asgi_app = AsgiApp()
+
+
+@asgi_app.on_startup
+async def register_kitmanagement() -> None:
+    await connections.register_async()
+
+    product_repository = AsyncMongoProductRepository(connections.motor_kit_db, connections.motor_kit_read_db)
+    kit_repository = AsyncMongoKitRepository(connections.motor_kit_db, connections.motor_kit_read_db)
+    read_product_repository = AsyncMongoProductRepository(connections.motor_kit_read_db)
+    read_kit_repository = AsyncMongoKitRepository(connections.motor_kit_read_db)
+    # INFO: the kit availability is computed right after writes, from the primary, a stale secondary would oversell
+    kit_availability_service = AsyncKitAvailabilityService(
+        AsyncMongoKitRepository(connections.motor_kit_db), AsyncMongoProductRepository(connections.motor_kit_db),
+        AsyncMongoKitAvailabilityRepository(connections.motor_kit_db)
+    )
+
+    asgi_endpoints.register(
+        asgi_app,
+        products_service=AsyncProductsService(product_repository, kit_repository, kit_availability_service),
+        kits_service=AsyncKitsService(kit_repository, product_repository, kit_availability_service),
+        calculated_kits_service=AsyncCalculatedKitsService(read_kit_repository, read_product_repository)
+    )
+
+
+@asgi_app.on_shutdown
+async def close_connections() -> None:
+    connections.motor_client.close()
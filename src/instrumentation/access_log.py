@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict
+
+from flask import Flask, g, request
+
+from src.instrumentation.commands import CommandCounter
+
+logger = logging.getLogger('kit_api.access')
+
+
+def parse_sample_rates(text: str) -> Dict[str, float]:
+    '''
+        Parses status_class=rate pairs, e.g. 2xx=0.1,4xx=1,5xx=1. Missing classes are always logged.
+    :return:
+    '''
+    sample_rates = {}
+    for pair in filter(None, text.split(',')):
+        status_class, rate = pair.split('=')
+        sample_rates[status_class.strip()] = float(rate)
+    return sample_rates
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.access, separators=(',', ':'))
+
+
+class DroppingQueueHandler(QueueHandler):
+    '''
+        Hands records over as they are, formatting happens on the listener thread, and drops them when the queue is
+        full instead of blocking the request.
+    '''
+
+    def __init__(self, record_queue: queue.Queue):
+        super(DroppingQueueHandler, self).__init__(record_queue)
+        self.dropped_records = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_records += 1
+
+
+class AccessLog(object):
+    '''
+        Logs one JSON record per request: route, status, latency, Mongo round trips, request and response bytes and,
+        when the allocation profiler sampled the request, its peak traced bytes. With mongo_bytes, the command counter
+        measures the Mongo bytes of every request, sampled out or not, so that is opt-in. The request thread only
+        builds a dict and puts it on a queue, a QueueListener thread formats and writes it. Each status class (2xx,
+        4xx, ...) is sampled at its own rate.
+    '''
+
+    def __init__(self, handler: logging.Handler, sample_rates: Dict[str, float], command_counter: CommandCounter = None,
+                 mongo_bytes: bool = False, max_queue_size: int = 10000):
+        handler.setFormatter(JsonFormatter())
+        self.__handler = handler
+        self.__sample_rates = sample_rates
+        self.__command_counter = command_counter
+        self.__mongo_bytes = mongo_bytes
+        self.__queue = queue.Queue(maxsize=max_queue_size)
+        self.__queue_handler = DroppingQueueHandler(self.__queue)
+        self.__listener = None
+        self.__listener_pid = None
+        self.__listener_lock = threading.Lock()
+
+    @property
+    def dropped_records(self) -> int:
+        return self.__queue_handler.dropped_records
+
+    def init_app(self, web_app: Flask) -> None:
+        logger.addHandler(self.__queue_handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        web_app.before_request(self.__start)
+        web_app.after_request(self.__finish)
+
+    def stop(self) -> None:
+        '''
+            Writes out the queued records, stops the listener thread and detaches from the access logger
+        :return:
+        '''
+        logger.removeHandler(self.__queue_handler)
+        if self.__listener and self.__listener_pid == os.getpid():
+            self.__listener.stop()
+            self.__listener = None
+            self.__listener_pid = None
+
+    def __start(self) -> None:
+        g.access_log_started_at = time.perf_counter()
+        if self.__command_counter:
+            g.access_log_mongo = (
+                self.__command_counter.count(), self.__command_counter.bytes_sent(), self.__command_counter.bytes_received()
+            )
+
+    def __finish(self, response):
+        started_at = g.pop('access_log_started_at', None)
+        if started_at is None:
+            return response
+        latency_ms = (time.perf_counter() - started_at) * 1000
+
+        status_class = '{}xx'.format(response.status_code // 100)
+        if random.random() >= self.__sample_rates.get(status_class, 1.0):
+            return response
+
+        access = {
+            'time': datetime.utcnow().isoformat(),
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'path': request.path,
+            'status': response.status_code,
+            'latency_ms': round(latency_ms, 3),
+            'request_bytes': request.content_length or 0,
+            'response_bytes': response.calculate_content_length(),
+            'memory_peak_bytes': g.get('memory_peak_bytes'),
+        }
+        if self.__command_counter:
+            commands, bytes_sent, bytes_received = g.pop('access_log_mongo')
+            access['mongo_round_trips'] = self.__command_counter.count() - commands
+            if self.__mongo_bytes:
+                access['mongo_bytes_out'] = self.__command_counter.bytes_sent() - bytes_sent
+                access['mongo_bytes_in'] = self.__command_counter.bytes_received() - bytes_received
+
+        self.__start_listener()
+        logger.info('%s %s %s', request.method, request.path, response.status_code, extra={'access': access})
+        return response
+
+    def __start_listener(self) -> None:
+        # INFO: threads don't survive a fork, so each worker process starts its own listener
+        if self.__listener_pid == os.getpid():
+            return
+        with self.__listener_lock:
+            if self.__listener_pid != os.getpid():
+                self.__listener = QueueListener(self.__queue, self.__handler)
+                self.__listener.start()
+                self.__listener_pid = os.getpid()
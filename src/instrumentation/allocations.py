@@ -0,0 +1,139 @@
+import os
+import random
+import threading
+import tracemalloc
+from collections import Counter
+from typing import List
+
+from flask import Flask, g, request
+
+# INFO: keeps the per route site counters bounded, the smallest sites are dropped first
+MAX_SITES_PER_ROUTE = 200
+
+
+def allocation_site(statistic_diff) -> str:
+    frame = statistic_diff.traceback[0]
+    return '{}:{}'.format(frame.filename, frame.lineno)
+
+
+def exclude_tracemalloc(snapshot: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+    return snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+
+
+def top_sites(after: tracemalloc.Snapshot, before: tracemalloc.Snapshot, limit: int) -> List[dict]:
+    return [
+        {'site': allocation_site(statistic), 'size_diff_bytes': statistic.size_diff, 'count_diff': statistic.count_diff}
+        for statistic in exclude_tracemalloc(after).compare_to(exclude_tracemalloc(before), 'lineno')[:limit]
+    ]
+
+
+class AllocationProfiler(object):
+    '''
+        Opt-in tracemalloc mode. Takes a snapshot before and after a sample of the requests and accumulates the top
+        allocation sites and the peak traced bytes per route, and diffs the process memory against a baseline.
+        Snapshots are process wide, so with several threads per worker other requests' allocations get mixed in.
+    '''
+
+    def __init__(self, sample_rate: float, frames: int = 1, top_sites_per_request: int = 10):
+        self.__sample_rate = sample_rate
+        self.__frames = frames
+        self.__top_sites_per_request = top_sites_per_request
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__routes = {}
+        self.__baseline = None
+        self.__tracing_pid = None
+
+    def init_app(self, web_app: Flask) -> None:
+        web_app.before_request(self.__start)
+        web_app.after_request(self.__finish)
+        web_app.teardown_request(self.__teardown)
+
+    def routes(self, limit: int = 20) -> dict:
+        with self.__lock:
+            return {
+                route: {
+                    'sampled_requests': stats['requests'],
+                    'peak_bytes_max': stats['peak_bytes_max'],
+                    'peak_bytes_mean': stats['peak_bytes_total'] / stats['requests'],
+                    'top_sites': [
+                        {'site': site, 'size_diff_bytes': size, 'count_diff': stats['counts'][site]}
+                        for site, size in stats['sizes'].most_common(limit)
+                    ],
+                }
+                for route, stats in self.__routes.items()
+            }
+
+    def diff(self, limit: int = 20) -> dict:
+        '''
+            Compares the memory traced now with the baseline, taken on the first request or by reset_baseline
+        :return:
+        '''
+        self.__start_tracing()
+        snapshot = tracemalloc.take_snapshot()
+        baseline = self.__baseline or snapshot
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        return {
+            'traced_bytes': current_bytes,
+            'traced_peak_bytes': peak_bytes,
+            'top_sites': top_sites(snapshot, baseline, limit),
+        }
+
+    def reset_baseline(self) -> None:
+        self.__start_tracing()
+        self.__baseline = tracemalloc.take_snapshot()
+        with self.__lock:
+            self.__routes = {}
+
+    def __start_tracing(self) -> None:
+        # INFO: started lazily in each process, so a pre-fork master doesn't pay for tracing
+        if self.__tracing_pid == os.getpid():
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.__frames)
+        self.__tracing_pid = os.getpid()
+        self.__baseline = tracemalloc.take_snapshot()
+
+    def __start(self) -> None:
+        self.__start_tracing()
+        # INFO: a request run inside a sampled one (a batch sub-request) would reset its peak
+        if getattr(self.__local, 'sampling', False) or random.random() >= self.__sample_rate:
+            return
+        self.__local.sampling = True
+        g.allocations_sampled = True
+        g.allocations_before = tracemalloc.take_snapshot()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        g.allocations_started_bytes = tracemalloc.get_traced_memory()[0]
+
+    def __finish(self, response):
+        before = g.pop('allocations_before', None)
+        if before is None:
+            return response
+
+        # INFO: without reset_peak (python < 3.9) this is the process peak, an upper bound
+        g.memory_peak_bytes = tracemalloc.get_traced_memory()[1] - g.pop('allocations_started_bytes')
+        sites = top_sites(tracemalloc.take_snapshot(), before, self.__top_sites_per_request)
+        route = '{} {}'.format(request.method, request.url_rule.rule if request.url_rule else 'unmatched')
+        with self.__lock:
+            stats = self.__routes.setdefault(route, {
+                'requests': 0, 'peak_bytes_max': 0, 'peak_bytes_total': 0, 'sizes': Counter(), 'counts': Counter()
+            })
+            stats['requests'] += 1
+            stats['peak_bytes_max'] = max(stats['peak_bytes_max'], g.memory_peak_bytes)
+            stats['peak_bytes_total'] += g.memory_peak_bytes
+            for site in sites:
+                stats['sizes'][site['site']] += site['size_diff_bytes']
+                stats['counts'][site['site']] += site['count_diff']
+            if len(stats['sizes']) > MAX_SITES_PER_ROUTE:
+                kept = dict(stats['sizes'].most_common(MAX_SITES_PER_ROUTE))
+                stats['sizes'] = Counter(kept)
+                stats['counts'] = Counter({site: stats['counts'][site] for site in kept})
+        return response
+
+    def __teardown(self, error=None) -> None:
+        if g.pop('allocations_sampled', False):
+            self.__local.sampling = False
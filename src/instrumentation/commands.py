@@ -0,0 +1,42 @@
+import threading
+
+import bson
+from pymongo import monitoring
+
+
+class CommandCounter(monitoring.CommandListener):
+    '''
+        Counts the Mongo commands started by the current thread (a greenlet once gevent patched threading).
+        pymongo publishes command events on the thread running the command, so the count of a request is the
+        difference between two reads taken on the request thread.
+        With measure_bytes, it also adds up the BSON size of the commands sent and of the replies received. The
+        driver doesn't expose wire sizes, so they are encoded again, which costs about as much as decoding them.
+    '''
+
+    def __init__(self):
+        self.__local = threading.local()
+        self.__measure_bytes = False
+
+    def measure_bytes(self, enabled: bool = True) -> None:
+        self.__measure_bytes = enabled
+
+    def count(self) -> int:
+        return getattr(self.__local, 'count', 0)
+
+    def bytes_sent(self) -> int:
+        return getattr(self.__local, 'bytes_sent', 0)
+
+    def bytes_received(self) -> int:
+        return getattr(self.__local, 'bytes_received', 0)
+
+    def started(self, event):
+        self.__local.count = self.count() + 1
+        if self.__measure_bytes:
+            self.__local.bytes_sent = self.bytes_sent() + len(bson.encode(event.command))
+
+    def succeeded(self, event):
+        if self.__measure_bytes:
+            self.__local.bytes_received = self.bytes_received() + len(bson.encode(event.reply))
+
+    def failed(self, event):
+        pass
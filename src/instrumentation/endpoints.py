@@ -0,0 +1,199 @@
+from typing import Callable
+
+from flask import Flask, Response, request
+from pymongo.errors import PyMongoError
+
+from src.web_app import get_api
+
+from src.base.endpoints import ResourceBase, responses_doc_for
+from src.instrumentation import metrics
+from src.instrumentation.allocations import AllocationProfiler
+from src.instrumentation.hot_keys import AccessStatistics
+from src.instrumentation.pool import PoolCheckoutListener
+from src.instrumentation.profiler import SlowRequestProfiler
+
+
+api = get_api()
+
+
+@api.doc()
+class ReadinessResource(ResourceBase):
+
+    def __init__(self, *args, **kwargs):
+        super(ReadinessResource, self).__init__(*args, **kwargs)
+        self.__ping = kwargs['ping']
+        self.__pool_listener = kwargs['pool_listener']
+        self.__missing_indexes = kwargs['missing_indexes']
+
+    @api.doc(responses=responses_doc_for(200, 500, 503))
+    def get(self):
+        '''
+            Not ready while Mongo can't be reached or indexes are missing (flask create-indexes)
+        :return:
+        '''
+        if not self.__ping:
+            return {'status': 'ready'}
+
+        try:
+            ping_ms = self.__ping()
+            missing_indexes = self.__missing_indexes() if self.__missing_indexes else []
+        except PyMongoError as error:
+            return {'status': 'unavailable', 'mongo': {'error': str(error)}}, 503
+
+        pool = self.__pool_listener.snapshot()
+        mongo = {
+            'ping_ms': ping_ms,
+            'open_connections': pool['open_connections'],
+            'checked_out_connections': pool['checked_out_connections'],
+            'checkout_failures': pool['checkout_failures'],
+            'missing_indexes': missing_indexes,
+        }
+        if missing_indexes:
+            return {'status': 'unavailable', 'mongo': mongo}, 503
+        return {'status': 'ready', 'mongo': mongo}
+
+
+@api.doc()
+class MongoPoolResource(ResourceBase):
+
+    def __init__(self, *args, **kwargs):
+        super(MongoPoolResource, self).__init__(*args, **kwargs)
+        self.__pool_listener = kwargs['pool_listener']
+
+    @api.doc(responses=responses_doc_for(200, 500))
+    def get(self):
+        return self.__pool_listener.snapshot()
+
+
+@api.doc()
+class ProfilesResource(ResourceBase):
+
+    def __init__(self, *args, **kwargs):
+        super(ProfilesResource, self).__init__(*args, **kwargs)
+        self.__profiler = kwargs['profiler']
+
+    @api.doc(responses=responses_doc_for(200, 500))
+    def get(self):
+        return self.__profiler.list()
+
+
+@api.doc(params={'format': 'prof (default), a pstats dump, or text'})
+class ProfileResource(ResourceBase):
+
+    def __init__(self, *args, **kwargs):
+        super(ProfileResource, self).__init__(*args, **kwargs)
+        self.__profiler = kwargs['profiler']
+
+    @api.doc(responses=responses_doc_for(200, 404, 500))
+    def get(self, profile_id: str):
+        profile = self.__profiler.get(profile_id)
+        if not profile:
+            api.abort(404, 'Profile Not Found.', profile_id=profile_id)
+
+        if request.args.get('format') == 'text':
+            return Response(profile['summary'], mimetype='text/plain')
+        return Response(profile['stats'], mimetype='application/octet-stream', headers={
+            'Content-Disposition': 'attachment; filename=profile-{}.prof'.format(profile_id)
+        })
+
+
+@api.doc(params={'limit': 'top allocation sites per route, default 20'})
+class AllocationsResource(ResourceBase):
+
+    def __init__(self, *args, **kwargs):
+        super(AllocationsResource, self).__init__(*args, **kwargs)
+        self.__allocation_profiler = kwargs['allocation_profiler']
+
+    @api.doc(responses=responses_doc_for(200, 500))
+    def get(self):
+        return self.__allocation_profiler.routes(request.args.get('limit', 20, type=int))
+
+
+@api.doc(params={'limit': 'top allocation sites, default 20'})
+class AllocationsDiffResource(ResourceBase):
+
+    def __init__(self, *args, **kwargs):
+        super(AllocationsDiffResource, self).__init__(*args, **kwargs)
+        self.__allocation_profiler = kwargs['allocation_profiler']
+
+    @api.doc(responses=responses_doc_for(200, 500))
+    def get(self):
+        return self.__allocation_profiler.diff(request.args.get('limit', 20, type=int))
+
+
+@api.doc()
+class AllocationsBaselineResource(ResourceBase):
+
+    def __init__(self, *args, **kwargs):
+        super(AllocationsBaselineResource, self).__init__(*args, **kwargs)
+        self.__allocation_profiler = kwargs['allocation_profiler']
+
+    @api.doc(responses=responses_doc_for(204, 500))
+    def post(self):
+        self.__allocation_profiler.reset_baseline()
+        return {}, 204
+
+
+@api.doc(params={'limit': 'top keys per kind, default 20'})
+class HotKeysResource(ResourceBase):
+
+    def __init__(self, *args, **kwargs):
+        super(HotKeysResource, self).__init__(*args, **kwargs)
+        self.__access_statistics = kwargs['access_statistics']
+
+    @api.doc(responses=responses_doc_for(200, 500))
+    def get(self):
+        return self.__access_statistics.top(request.args.get('limit', 20, type=int))
+
+    @api.doc(responses=responses_doc_for(204, 500))
+    def delete(self):
+        self.__access_statistics.reset()
+        return {}, 204
+
+
+def register_health(ping: Callable = None, pool_listener: PoolCheckoutListener = None,
+                    missing_indexes: Callable = None):
+    api.add_resource(
+        ReadinessResource, '/api/health/ready',
+        resource_class_kwargs={'ping': ping, 'pool_listener': pool_listener, 'missing_indexes': missing_indexes}
+    )
+
+
+def register_metrics(web_app: Flask, request_metrics: metrics.RequestMetrics,
+                     command_listener: metrics.CommandTimingListener = None, pool_listener: PoolCheckoutListener = None):
+    # INFO: a plain flask route, the prometheus text format is not one of the api representations
+    def get_metrics():
+        lines = request_metrics.render()
+        if command_listener:
+            lines += command_listener.render()
+        if pool_listener:
+            lines += metrics.render_pool(pool_listener.snapshot())
+        return Response('\n'.join(lines) + '\n', mimetype=metrics.PROMETHEUS_MEDIATYPE)
+
+    web_app.add_url_rule('/metrics', 'metrics', get_metrics)
+
+
+def register(pool_listener: PoolCheckoutListener = None, profiler: SlowRequestProfiler = None,
+             allocation_profiler: AllocationProfiler = None, access_statistics: AccessStatistics = None):
+    if pool_listener:
+        api.add_resource(
+            MongoPoolResource, '/api/admin/mongo-pool', resource_class_kwargs={'pool_listener': pool_listener}
+        )
+    if profiler:
+        api.add_resource(ProfilesResource, '/api/admin/profiles', resource_class_kwargs={'profiler': profiler})
+        api.add_resource(
+            ProfileResource, '/api/admin/profiles/<string:profile_id>', resource_class_kwargs={'profiler': profiler}
+        )
+    if allocation_profiler:
+        resource_class_kwargs = {'allocation_profiler': allocation_profiler}
+        api.add_resource(AllocationsResource, '/api/admin/allocations', resource_class_kwargs=resource_class_kwargs)
+        api.add_resource(
+            AllocationsDiffResource, '/api/admin/allocations/diff', resource_class_kwargs=resource_class_kwargs
+        )
+        api.add_resource(
+            AllocationsBaselineResource, '/api/admin/allocations/baseline', resource_class_kwargs=resource_class_kwargs
+        )
+    if access_statistics:
+        api.add_resource(
+            HotKeysResource, '/api/admin/hot-keys', resource_class_kwargs={'access_statistics': access_statistics}
+        )
@@ -0,0 +1,135 @@
+import hmac
+import json
+import threading
+import time
+from typing import Callable, List
+
+from bson import json_util
+from flask import Flask, g, request
+from pymongo import monitoring
+
+EXPLAIN_ARGUMENT = 'explain'
+ADMIN_TOKEN_HEADER = 'X-Admin-Token'
+# INFO: the commands issued by repository reads, getMore only continues a find that is already explained
+EXPLAINABLE_COMMANDS = {'find', 'aggregate', 'count', 'distinct'}
+# INFO: session, cluster time and routing fields the driver adds, which explain doesn't accept
+DRIVER_FIELDS = {'lsid', 'txnNumber', 'autocommit', 'startTransaction'}
+
+
+def winning_stages(plan: dict) -> List[dict]:
+    stages = []
+    while plan:
+        stages.append(plan)
+        plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0]
+    return stages
+
+
+def summarize(explain_result: dict) -> dict:
+    query_planner = explain_result.get('queryPlanner', {})
+    execution_stats = explain_result.get('executionStats', {})
+    stages = winning_stages(query_planner.get('winningPlan', {}).get('queryPlan') or query_planner.get('winningPlan', {}))
+    index_names = [stage['indexName'] for stage in stages if 'indexName' in stage]
+    return {
+        'stages': [stage.get('stage') for stage in stages],
+        'index': index_names[0] if index_names else None,
+        'collection_scan': any(stage.get('stage') == 'COLLSCAN' for stage in stages),
+        'returned': execution_stats.get('nReturned'),
+        'keys_examined': execution_stats.get('totalKeysExamined'),
+        'docs_examined': execution_stats.get('totalDocsExamined'),
+        'execution_time_ms': execution_stats.get('executionTimeMillis'),
+    }
+
+
+class QueryExplainer(monitoring.CommandListener):
+    '''
+        For GET requests with ?explain=1, records the read commands the repositories issue and, once the response is
+        built, runs explain (executionStats) for each one. The JSON body becomes {"data": ..., "explain": ...}, with
+        the plan summary of every query and a timing breakdown. Other requests only pay for a thread local lookup.
+        Explaining reruns every read and shows the query plans, so it needs the admin token in the X-Admin-Token
+        header, and without an admin token nothing is explained.
+    '''
+
+    def __init__(self):
+        self.__local = threading.local()
+        self.__get_client = None
+        self.__admin_token = ''
+
+    def init_app(self, web_app: Flask, get_client: Callable, admin_token: str) -> None:
+        self.__get_client = get_client
+        self.__admin_token = admin_token
+        web_app.before_request(self.__start)
+        web_app.after_request(self.__finish)
+
+    def started(self, event):
+        commands = getattr(self.__local, 'commands', None)
+        if commands is None or event.command_name not in EXPLAINABLE_COMMANDS:
+            return
+        commands[event.request_id] = {
+            'database': event.database_name,
+            'command_name': event.command_name,
+            'command': {
+                key: value for key, value in event.command.items()
+                if not key.startswith('$') and key not in DRIVER_FIELDS
+            },
+            'duration_ms': None,
+        }
+
+    def succeeded(self, event):
+        self.__record_duration(event)
+
+    def failed(self, event):
+        self.__record_duration(event)
+
+    def __record_duration(self, event) -> None:
+        commands = getattr(self.__local, 'commands', None)
+        if commands is not None and event.request_id in commands:
+            commands[event.request_id]['duration_ms'] = event.duration_micros / 1000
+
+    def __start(self) -> None:
+        if request.method != 'GET' or request.args.get(EXPLAIN_ARGUMENT) != '1' or not self.__is_admin():
+            return
+        self.__local.commands = {}
+        g.explain_started_at = time.perf_counter()
+
+    def __is_admin(self) -> bool:
+        return bool(self.__admin_token) and hmac.compare_digest(
+            request.headers.get(ADMIN_TOKEN_HEADER, '').encode(), self.__admin_token.encode()
+        )
+
+    def __finish(self, response):
+        started_at = g.pop('explain_started_at', None)
+        if started_at is None:
+            return response
+        total_ms = (time.perf_counter() - started_at) * 1000
+        commands = list(self.__local.commands.values())
+        self.__local.commands = None
+        if not response.is_json:
+            return response
+
+        queries = [self.__explain(command) for command in commands]
+        mongo_ms = sum(command['duration_ms'] or 0 for command in commands)
+        response.set_data(json.dumps({
+            'data': response.get_json(),
+            'explain': {
+                'queries': queries,
+                'timing': {'total_ms': total_ms, 'mongo_ms': mongo_ms, 'app_ms': total_ms - mongo_ms},
+            },
+        }))
+        return response
+
+    def __explain(self, command: dict) -> dict:
+        explained = {
+            'command': command['command_name'],
+            'collection': command['command'].get(command['command_name']),
+            'query': json.loads(json_util.dumps(command['command'])),
+            'duration_ms': command['duration_ms'],
+        }
+        try:
+            explain_result = self.__get_client()[command['database']].command(
+                'explain', command['command'], verbosity='executionStats'
+            )
+        except Exception as error:
+            explained['error'] = str(error)
+            return explained
+        explained.update(summarize(explain_result))
+        return explained
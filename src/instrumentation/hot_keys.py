@@ -0,0 +1,141 @@
+import hashlib
+import threading
+from typing import Iterable, List
+
+# INFO: the access statistics in use, None when they are off so record() costs a global lookup
+access_statistics = None
+
+# INFO: products are counted by id, whether read on their own or as part of a calculated kit
+PRODUCT = 'product'
+KIT = 'kit'
+CALCULATED_KIT = 'calculated_kit'
+KINDS = (PRODUCT, KIT, CALCULATED_KIT)
+
+
+def install(new_access_statistics) -> None:
+    global access_statistics
+    access_statistics = new_access_statistics
+
+
+def record(kind: str, key: str) -> None:
+    '''
+        Counts an access to a product id, kit id or calculated kit id
+    :return:
+    '''
+    if access_statistics is not None:
+        access_statistics.record(kind, (key,))
+
+
+def record_many(kind: str, keys: Iterable[str]) -> None:
+    if access_statistics is not None:
+        access_statistics.record(kind, keys)
+
+
+class CountMinSketch(object):
+    '''
+        Approximate counts in depth x width counters. An estimate is never below the real count and, with
+        probability 1 - 0.5 ** depth, over it by at most 2 / width of all the counted accesses.
+        That bound needs independent hashes per row, so each row hashes with blake2b salted by its row number.
+    '''
+
+    def __init__(self, width: int, depth: int):
+        self.__width = width
+        # INFO: fixed salts, so the counters and the estimates don't depend on PYTHONHASHSEED
+        self.__salts = [row.to_bytes(hashlib.blake2b.SALT_SIZE, 'little') for row in range(depth)]
+        self.__rows = [[0] * width for _ in self.__salts]
+
+    def add(self, key: str) -> int:
+        '''
+            Conservative update: only the counters at the current minimum grow, which keeps the overestimate lower
+        :return: the new estimate of the key
+        '''
+        columns = self.__columns(key)
+        estimate = min(row[column] for row, column in zip(self.__rows, columns)) + 1
+        for row, column in zip(self.__rows, columns):
+            if row[column] < estimate:
+                row[column] = estimate
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        return min(row[column] for row, column in zip(self.__rows, self.__columns(key)))
+
+    def __columns(self, key: str) -> List[int]:
+        encoded_key = key.encode()
+        return [
+            int.from_bytes(hashlib.blake2b(encoded_key, digest_size=8, salt=salt).digest(), 'little') % self.__width
+            for salt in self.__salts
+        ]
+
+
+class HeavyHitters(object):
+    '''
+        Top keys by access count: a count-min sketch counts every key and the keys with the highest estimates are
+        kept, at most capacity of them, so memory doesn't grow with the catalog.
+    '''
+
+    def __init__(self, capacity: int, width: int, depth: int):
+        self.__capacity = capacity
+        self.__sketch = CountMinSketch(width, depth)
+        self.__top = {}
+        # INFO: kept counts only grow, so an old minimum is still a lower bound and most keys are skipped without a scan
+        self.__floor = 0
+        self.accesses = 0
+
+    def add(self, key: str) -> None:
+        self.accesses += 1
+        estimate = self.__sketch.add(key)
+        if key in self.__top or len(self.__top) < self.__capacity:
+            self.__top[key] = estimate
+            return
+        if estimate <= self.__floor:
+            return
+        coldest_key = min(self.__top, key=self.__top.get)
+        self.__floor = self.__top[coldest_key]
+        if estimate > self.__floor:
+            del self.__top[coldest_key]
+            self.__top[key] = estimate
+
+    def estimate(self, key: str) -> int:
+        return self.__sketch.estimate(key)
+
+    def top(self, limit: int) -> List[dict]:
+        return [
+            {'key': key, 'count': count}
+            for key, count in sorted(self.__top.items(), key=lambda item: item[1], reverse=True)[:limit]
+        ]
+
+
+class AccessStatistics(object):
+    '''
+        Approximate access counts per product id, kit id and calculated kit id, in bounded memory, to
+        decide what to cache, pre-warm or precompute. Counts start over with reset.
+    '''
+
+    def __init__(self, capacity: int = 100, width: int = 2048, depth: int = 4):
+        self.__capacity = capacity
+        self.__width = width
+        self.__depth = depth
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def record(self, kind: str, keys: Iterable[str]) -> None:
+        heavy_hitters = self.__heavy_hitters[kind]
+        with self.__lock:
+            for key in keys:
+                heavy_hitters.add(key)
+
+    def estimate(self, kind: str, key: str) -> int:
+        with self.__lock:
+            return self.__heavy_hitters[kind].estimate(key)
+
+    def top(self, limit: int = 20) -> dict:
+        with self.__lock:
+            return {
+                kind: {'accesses': heavy_hitters.accesses, 'top': heavy_hitters.top(limit)}
+                for kind, heavy_hitters in self.__heavy_hitters.items()
+            }
+
+    def reset(self) -> None:
+        heavy_hitters = {kind: HeavyHitters(self.__capacity, self.__width, self.__depth) for kind in KINDS}
+        with self.__lock:
+            self.__heavy_hitters = heavy_hitters
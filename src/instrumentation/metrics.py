@@ -0,0 +1,207 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import List, Tuple
+
+from flask import Flask, g, request
+from pymongo import monitoring
+
+# INFO: upper bounds, in seconds, of the latency histogram buckets
+REQUEST_LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, float('inf')]
+MONGO_COMMAND_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, float('inf')]
+PROMETHEUS_MEDIATYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_labels(label_names: Tuple[str, ...], labels: tuple, **extra) -> str:
+    pairs = list(zip(label_names, labels)) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, escape(value)) for name, value in pairs) + '}'
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_bound(upper_bound: float) -> str:
+    return '+Inf' if upper_bound == float('inf') else repr(upper_bound)
+
+
+class Counter(object):
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...]):
+        self.__name = name
+        self.__documentation = documentation
+        self.__label_names = label_names
+        self.__lock = threading.Lock()
+        self.__values = {}
+
+    def inc(self, labels: tuple, amount: float = 1) -> None:
+        with self.__lock:
+            self.__values[labels] = self.__values.get(labels, 0) + amount
+
+    def value(self, labels: tuple) -> float:
+        return self.__values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = ['# HELP {} {}'.format(self.__name, self.__documentation), '# TYPE {} counter'.format(self.__name)]
+        with self.__lock:
+            for labels, value in sorted(self.__values.items()):
+                lines.append('{}{} {}'.format(self.__name, format_labels(self.__label_names, labels), value))
+        return lines
+
+
+class Histogram(object):
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...], buckets: List[float]):
+        self.__name = name
+        self.__documentation = documentation
+        self.__label_names = label_names
+        self.__buckets = buckets
+        self.__lock = threading.Lock()
+        # INFO: labels -> [bucket counts (not cumulative), sum, count]
+        self.__series = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        index = bisect_left(self.__buckets, value)
+        with self.__lock:
+            series = self.__series.get(labels)
+            if series is None:
+                series = self.__series[labels] = [[0] * len(self.__buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, labels: tuple) -> int:
+        series = self.__series.get(labels)
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = ['# HELP {} {}'.format(self.__name, self.__documentation), '# TYPE {} histogram'.format(self.__name)]
+        with self.__lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in sorted(self.__series.items())]
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.__buckets, counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{} {}'.format(
+                    self.__name, format_labels(self.__label_names, labels, le=format_bound(upper_bound)), cumulative
+                ))
+            lines.append('{}_sum{} {}'.format(self.__name, format_labels(self.__label_names, labels), total))
+            lines.append('{}_count{} {}'.format(self.__name, format_labels(self.__label_names, labels), count))
+        return lines
+
+
+class RequestMetrics(object):
+    '''
+        Times every request by flask-restx resource and method (e.g. ProductsResource.get) and counts error
+        responses by status. The work per request is two perf_counter calls, a dict lookup and a locked update.
+    '''
+
+    def __init__(self):
+        self.__durations = Histogram(
+            'kit_api_request_duration_seconds', 'Request latency by resource and method.',
+            ('resource', 'method'), REQUEST_LATENCY_BUCKETS
+        )
+        self.__errors = Counter(
+            'kit_api_request_errors_total', 'Error responses by resource, method and status.',
+            ('resource', 'method', 'status')
+        )
+        self.__resources = {}
+        self.__web_app = None
+
+    def init_app(self, web_app: Flask) -> None:
+        self.__web_app = web_app
+        web_app.before_request(self.__start)
+        web_app.after_request(self.__finish)
+
+    def render(self) -> List[str]:
+        return self.__durations.render() + self.__errors.render()
+
+    def __start(self) -> None:
+        g.request_started_at = time.perf_counter()
+
+    def __finish(self, response):
+        started_at = g.pop('request_started_at', None)
+        if started_at is None:
+            return response
+
+        labels = (self.__resource_of(request.endpoint), request.method.lower())
+        self.__durations.observe(labels, time.perf_counter() - started_at)
+        if response.status_code >= 400:
+            self.__errors.inc(labels + (response.status_code,))
+        return response
+
+    def __resource_of(self, endpoint: str) -> str:
+        resource = self.__resources.get(endpoint)
+        if resource is None:
+            view_function = self.__web_app.view_functions.get(endpoint)
+            view_class = getattr(view_function, 'view_class', None)
+            resource = view_class.__name__ if view_class else (endpoint or 'unmatched')
+            self.__resources[endpoint] = resource
+        return resource
+
+
+class CommandTimingListener(monitoring.CommandListener):
+    '''
+        Keeps a duration histogram per Mongo command (find, insert, update, ...), using the duration measured by
+        the driver, and counts failed commands.
+    '''
+
+    def __init__(self):
+        self.__durations = Histogram(
+            'kit_api_mongo_command_duration_seconds', 'Mongo command duration by command.',
+            ('command',), MONGO_COMMAND_BUCKETS
+        )
+        self.__failures = Counter(
+            'kit_api_mongo_command_failures_total', 'Failed Mongo commands by command.', ('command',)
+        )
+
+    def render(self) -> List[str]:
+        return self.__durations.render() + self.__failures.render()
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.__durations.observe((event.command_name,), event.duration_micros / 1e6)
+
+    def failed(self, event):
+        self.__durations.observe((event.command_name,), event.duration_micros / 1e6)
+        self.__failures.inc((event.command_name,))
+
+
+def render_pool(snapshot: dict) -> List[str]:
+    '''
+        Renders a PoolCheckoutListener snapshot in the prometheus text format
+    :return:
+    '''
+    lines = [
+        '# HELP kit_api_mongo_pool_checkouts_total Connections checked out of the pool.',
+        '# TYPE kit_api_mongo_pool_checkouts_total counter',
+        'kit_api_mongo_pool_checkouts_total {}'.format(snapshot['checkouts']),
+        '# HELP kit_api_mongo_pool_checkout_failures_total Failed checkouts by reason.',
+        '# TYPE kit_api_mongo_pool_checkout_failures_total counter',
+    ]
+    for reason, count in sorted(snapshot['checkout_failures'].items()):
+        lines.append('kit_api_mongo_pool_checkout_failures_total{{reason="{}"}} {}'.format(escape(reason), count))
+
+    lines += [
+        '# HELP kit_api_mongo_pool_checkout_wait_seconds Time waited for a pooled connection.',
+        '# TYPE kit_api_mongo_pool_checkout_wait_seconds histogram',
+    ]
+    cumulative = 0
+    for bucket in snapshot['wait_buckets']:
+        cumulative += bucket['count']
+        upper_bound = '+Inf' if bucket['le_ms'] == '+Inf' else repr(bucket['le_ms'] / 1000)
+        lines.append('kit_api_mongo_pool_checkout_wait_seconds_bucket{{le="{}"}} {}'.format(upper_bound, cumulative))
+    lines.append('kit_api_mongo_pool_checkout_wait_seconds_sum {}'.format(snapshot['wait_total_ms'] / 1000))
+    lines.append('kit_api_mongo_pool_checkout_wait_seconds_count {}'.format(cumulative))
+
+    for gauge, documentation in [('open_connections', 'Open connections by server.'),
+                                 ('checked_out_connections', 'Checked out connections by server.')]:
+        lines.append('# HELP kit_api_mongo_pool_{} {}'.format(gauge, documentation))
+        lines.append('# TYPE kit_api_mongo_pool_{} gauge'.format(gauge))
+        for address, count in sorted(snapshot[gauge].items()):
+            lines.append('kit_api_mongo_pool_{}{{address="{}"}} {}'.format(gauge, escape(address), count))
+    return lines
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import defaultdict
+
+from pymongo import monitoring
+
+# INFO: upper bounds, in milliseconds, of the checkout wait histogram buckets
+CHECKOUT_WAIT_BUCKETS_MS = [0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, float('inf')]
+
+
+class PoolCheckoutListener(monitoring.ConnectionPoolListener):
+    '''
+        Measures how long requests wait to check a connection out of the pymongo pool,
+        and keeps pool gauges (open and checked out connections) per server address.
+    '''
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__started_at = threading.local()
+        self.__checkouts = 0
+        self.__checkout_failures = defaultdict(int)
+        self.__wait_total_ms = 0.0
+        self.__wait_max_ms = 0.0
+        self.__wait_buckets = [0] * len(CHECKOUT_WAIT_BUCKETS_MS)
+        self.__open_connections = defaultdict(int)
+        self.__checked_out_connections = defaultdict(int)
+
+    def snapshot(self) -> dict:
+        with self.__lock:
+            return {
+                'checkouts': self.__checkouts,
+                'checkout_failures': dict(self.__checkout_failures),
+                'wait_total_ms': self.__wait_total_ms,
+                'wait_max_ms': self.__wait_max_ms,
+                'wait_mean_ms': self.__wait_total_ms / self.__checkouts if self.__checkouts else 0.0,
+                'wait_buckets': [
+                    {'le_ms': upper_bound if upper_bound != float('inf') else '+Inf', 'count': count}
+                    for upper_bound, count in zip(CHECKOUT_WAIT_BUCKETS_MS, self.__wait_buckets)
+                ],
+                'open_connections': self.__by_address(self.__open_connections),
+                'checked_out_connections': self.__by_address(self.__checked_out_connections),
+            }
+
+    def connection_check_out_started(self, event):
+        setattr(self.__started_at, self.__key(event.address), time.perf_counter())
+
+    def connection_checked_out(self, event):
+        wait_ms = self.__pop_wait_ms(event.address)
+        with self.__lock:
+            self.__checkouts += 1
+            self.__checked_out_connections[event.address] += 1
+            if wait_ms is None:
+                return
+            self.__wait_total_ms += wait_ms
+            self.__wait_max_ms = max(self.__wait_max_ms, wait_ms)
+            for index, upper_bound in enumerate(CHECKOUT_WAIT_BUCKETS_MS):
+                if wait_ms <= upper_bound:
+                    self.__wait_buckets[index] += 1
+                    break
+
+    def connection_check_out_failed(self, event):
+        self.__pop_wait_ms(event.address)
+        with self.__lock:
+            self.__checkout_failures[event.reason] += 1
+
+    def connection_checked_in(self, event):
+        with self.__lock:
+            self.__checked_out_connections[event.address] -= 1
+
+    def connection_created(self, event):
+        with self.__lock:
+            self.__open_connections[event.address] += 1
+
+    def connection_closed(self, event):
+        with self.__lock:
+            self.__open_connections[event.address] -= 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self.__lock:
+            self.__open_connections.pop(event.address, None)
+            self.__checked_out_connections.pop(event.address, None)
+
+    def __pop_wait_ms(self, address):
+        key = self.__key(address)
+        started_at = getattr(self.__started_at, key, None)
+        if started_at is None:
+            return None
+        delattr(self.__started_at, key)
+        return (time.perf_counter() - started_at) * 1000
+
+    @staticmethod
+    def __key(address) -> str:
+        return '{}:{}'.format(*address)
+
+    @staticmethod
+    def __by_address(counters: dict) -> dict:
+        return {'{}:{}'.format(*address): count for address, count in counters.items()}
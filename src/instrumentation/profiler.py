@@ -0,0 +1,106 @@
+import cProfile
+import io
+import itertools
+import marshal
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import List
+
+from flask import Flask, g, request
+
+from src.instrumentation.commands import CommandCounter
+
+
+class SlowRequestProfiler(object):
+    '''
+        Profiles a sample of the requests to the given resource modules with cProfile and keeps the profiles of the
+        ones slower than the threshold, along with their route, parameters and Mongo command count. Requests out of
+        the sample only pay for a random() call.
+    '''
+
+    def __init__(self, sample_rate: float, slow_request_ms: float, max_profiles: int, resource_modules: List[str],
+                 command_counter: CommandCounter = None):
+        self.__sample_rate = sample_rate
+        self.__slow_request_ms = slow_request_ms
+        self.__resource_modules = set(resource_modules)
+        self.__command_counter = command_counter
+        self.__lock = threading.Lock()
+        self.__ids = itertools.count(1)
+        self.__profiles = deque(maxlen=max_profiles)
+        self.__web_app = None
+
+    def init_app(self, web_app: Flask) -> None:
+        self.__web_app = web_app
+        web_app.before_request(self.__start)
+        web_app.after_request(self.__finish)
+
+    def list(self) -> List[dict]:
+        with self.__lock:
+            return [
+                {key: value for key, value in profile.items() if key not in ('stats', 'summary')}
+                for profile in reversed(self.__profiles)
+            ]
+
+    def get(self, profile_id: str) -> dict:
+        with self.__lock:
+            for profile in self.__profiles:
+                if profile['id'] == profile_id:
+                    return profile
+        return None
+
+    def __start(self) -> None:
+        if random.random() >= self.__sample_rate or not self.__is_profiled(request.endpoint):
+            return
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # INFO: another profiler is active (e.g. on python 3.12+, where only one can run at a time)
+            return
+        g.profiler = profiler
+        g.profile_started_at = time.perf_counter()
+        g.profile_commands = self.__command_counter.count() if self.__command_counter else 0
+
+    def __finish(self, response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+
+        profiler.disable()
+        duration_ms = (time.perf_counter() - g.pop('profile_started_at')) * 1000
+        if duration_ms < self.__slow_request_ms:
+            return response
+
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        # INFO: the same format pstats.Stats.dump_stats writes, so it loads in pstats, snakeviz, etc.
+        dumped_stats = marshal.dumps(stats.stats)
+        stats.sort_stats('cumulative').print_stats(40)
+        view_class = self.__web_app.view_functions[request.endpoint].view_class
+        profile = {
+            'id': str(next(self.__ids)),
+            'created_at': datetime.utcnow().isoformat(),
+            'resource': '{}.{}'.format(view_class.__name__, request.method.lower()),
+            'route': request.url_rule.rule,
+            'path': request.path,
+            'view_args': request.view_args,
+            'query_args': request.args.to_dict(),
+            'status': response.status_code,
+            'duration_ms': duration_ms,
+            'mongo_commands': self.__command_counter.count() - g.pop('profile_commands') if self.__command_counter else None,
+            'stats': dumped_stats,
+            'summary': summary.getvalue(),
+        }
+        with self.__lock:
+            self.__profiles.append(profile)
+        return response
+
+    def __is_profiled(self, endpoint: str) -> bool:
+        view_function = self.__web_app.view_functions.get(endpoint)
+        view_class = getattr(view_function, 'view_class', None)
+        return view_class is not None and view_class.__module__ in self.__resource_modules
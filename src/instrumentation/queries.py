@@ -0,0 +1,126 @@
+import logging
+import threading
+from collections import Counter
+from typing import Dict
+
+from flask import Flask, g, request
+
+from src.instrumentation.commands import CommandCounter
+
+logger = logging.getLogger(__name__)
+
+REPOSITORY_CALLS_HEADER = 'X-Repository-Calls'
+REPOSITORY_CALLS_BY_METHOD_HEADER = 'X-Repository-Calls-By-Method'
+MONGO_COMMANDS_HEADER = 'X-Mongo-Commands'
+
+
+class RepositoryCallCounter(object):
+    '''
+        Counts repository calls by method (e.g. ProductRepository.get_by_sku) on the current thread
+    '''
+
+    def __init__(self):
+        self.__local = threading.local()
+
+    def reset(self) -> None:
+        self.__local.calls = Counter()
+
+    def start(self) -> bool:
+        '''
+            Starts counting on the current thread, False when it already is (e.g. for a batch running its sub-requests)
+        :return:
+        '''
+        if getattr(self.__local, 'calls', None) is not None:
+            return False
+        self.reset()
+        return True
+
+    def stop(self) -> None:
+        self.__local.calls = None
+
+    def record(self, method: str) -> None:
+        calls = getattr(self.__local, 'calls', None)
+        if calls is not None:
+            calls[method] += 1
+
+    def calls(self) -> Dict[str, int]:
+        return dict(getattr(self.__local, 'calls', None) or {})
+
+
+class CountingRepository(object):
+    '''
+        Wraps a ProductRepository or KitRepository, recording every call of its public methods
+    '''
+
+    def __init__(self, repository, interface: type, counter: RepositoryCallCounter):
+        self.__repository = repository
+        self.__interface_name = interface.__name__
+        self.__counter = counter
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.__repository, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        method = '{}.{}'.format(self.__interface_name, name)
+        counter = self.__counter
+
+        def counted(*args, **kwargs):
+            counter.record(method)
+            return attribute(*args, **kwargs)
+        return counted
+
+
+class QueryCounter(object):
+    '''
+        Counts the repository calls and Mongo commands of each request and returns them in debug headers.
+        Requests over the budget, or calling one repository method more than n_plus_one_threshold times
+        (e.g. one get_by_sku per kit component), are logged as warnings.
+    '''
+
+    def __init__(self, repository_counter: RepositoryCallCounter, command_counter: CommandCounter = None,
+                 budget: int = None, n_plus_one_threshold: int = None):
+        self.__repository_counter = repository_counter
+        self.__command_counter = command_counter
+        self.__budget = budget
+        self.__n_plus_one_threshold = n_plus_one_threshold
+
+    def init_app(self, web_app: Flask) -> None:
+        web_app.before_request(self.__start)
+        web_app.after_request(self.__finish)
+
+    def __start(self) -> None:
+        # INFO: nested requests (batch sub-requests) count the difference, and still count for the outer request
+        g.query_counter_started = self.__repository_counter.start()
+        g.query_counter_calls = self.__repository_counter.calls()
+        g.query_counter_commands = self.__command_counter.count() if self.__command_counter else 0
+
+    def __finish(self, response):
+        if 'query_counter_calls' not in g:
+            return response
+        calls_before = g.pop('query_counter_calls')
+        calls = {
+            method: count - calls_before.get(method, 0)
+            for method, count in self.__repository_counter.calls().items() if count > calls_before.get(method, 0)
+        }
+        if g.pop('query_counter_started'):
+            self.__repository_counter.stop()
+        total_calls = sum(calls.values())
+        response.headers[REPOSITORY_CALLS_HEADER] = str(total_calls)
+        response.headers[REPOSITORY_CALLS_BY_METHOD_HEADER] = ', '.join(
+            '{}={}'.format(method, count) for method, count in sorted(calls.items())
+        )
+        round_trips = total_calls
+        if self.__command_counter:
+            round_trips = self.__command_counter.count() - g.pop('query_counter_commands', 0)
+            response.headers[MONGO_COMMANDS_HEADER] = str(round_trips)
+
+        if self.__budget is not None and round_trips > self.__budget:
+            logger.warning(
+                '%s %s made %s round trips, over the budget of %s', request.method, request.path, round_trips, self.__budget
+            )
+        if self.__n_plus_one_threshold is not None:
+            for method, count in calls.items():
+                if count > self.__n_plus_one_threshold:
+                    logger.warning('possible n+1: %s %s called %s %s times', request.method, request.path, method, count)
+        return response
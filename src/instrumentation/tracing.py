@@ -0,0 +1,282 @@
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from urllib import request as urllib_request
+
+from flask import Flask, g, request
+
+# INFO: the tracer in use, None when tracing is off so span() costs a global lookup
+tracer = None
+NO_SPAN = nullcontext()
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+
+def install(new_tracer) -> None:
+    global tracer
+    tracer = new_tracer
+
+
+def span(name: str, **attributes):
+    '''
+        Child span of the current request, for code that is not a wrapped service or repository method
+    :return: a context manager
+    '''
+    if tracer is None:
+        return NO_SPAN
+    return tracer.span(name, **attributes)
+
+
+class Span(object):
+    __slots__ = ('trace_id', 'span_id', 'parent_span_id', 'name', 'kind', 'start_ns', 'end_ns', 'attributes')
+
+    def __init__(self, trace_id: str, parent_span_id: str, name: str, kind: int, attributes: dict):
+        self.trace_id = trace_id
+        self.span_id = '{:016x}'.format(random.getrandbits(64))
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+
+    def to_otlp(self) -> dict:
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_span_id or '',
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [{'key': key, 'value': otlp_value(value)} for key, value in self.attributes.items()],
+        }
+
+
+def otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp_request(spans: list, service_name: str) -> dict:
+    '''
+        Builds an OTLP ExportTraceServiceRequest in its JSON encoding
+    :return:
+    '''
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': service_name}}]},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': [span.to_otlp() for span in spans]}],
+        }]
+    }
+
+
+class FileSpanExporter(object):
+    '''
+        Appends one OTLP JSON request per batch to a file, the format read by the collector otlpjsonfile receiver
+    '''
+
+    def __init__(self, path: str):
+        self.__path = path
+
+    def export(self, otlp_request: dict) -> None:
+        with open(self.__path, 'a') as output:
+            output.write(json.dumps(otlp_request, separators=(',', ':')) + '\n')
+
+
+class OtlpHttpSpanExporter(object):
+    '''
+        Posts OTLP JSON to a collector, e.g. http://localhost:4318/v1/traces
+    '''
+
+    def __init__(self, endpoint: str, timeout: float = 5):
+        self.__endpoint = endpoint
+        self.__timeout = timeout
+
+    def export(self, otlp_request: dict) -> None:
+        body = json.dumps(otlp_request, separators=(',', ':')).encode()
+        exporter_request = urllib_request.Request(
+            self.__endpoint, data=body, headers={'Content-Type': 'application/json'}, method='POST'
+        )
+        urllib_request.urlopen(exporter_request, timeout=self.__timeout).close()
+
+
+class Tracer(object):
+    '''
+        Records a span per request, with child spans for wrapped methods (see TracingProxy) and span(), and hands
+        finished traces to a background thread that exports them in batches. A sampled out request records nothing.
+    '''
+
+    def __init__(self, exporter, sample_rate: float = 1.0, service_name: str = 'kit-api', batch_size: int = 64,
+                 max_queue_size: int = 2048, flush_interval: float = 1.0):
+        self.__exporter = exporter
+        self.__sample_rate = sample_rate
+        self.__service_name = service_name
+        self.__batch_size = batch_size
+        self.__flush_interval = flush_interval
+        self.__local = threading.local()
+        self.__queue = queue.Queue(maxsize=max_queue_size)
+        self.__worker_pid = None
+        self.__worker_lock = threading.Lock()
+        self.dropped_spans = 0
+
+    def init_app(self, web_app: Flask) -> None:
+        web_app.before_request(self.__start_request)
+        web_app.after_request(self.__finish_request)
+        web_app.teardown_request(self.__teardown_request)
+
+    @contextmanager
+    def span(self, name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+        spans = getattr(self.__local, 'spans', None)
+        if spans is None:
+            yield None
+            return
+
+        stack = self.__local.stack
+        new_span = Span(stack[0].trace_id, stack[-1].span_id, name, kind, attributes)
+        stack.append(new_span)
+        try:
+            yield new_span
+        except Exception as error:
+            new_span.attributes['error'] = repr(error)
+            raise
+        finally:
+            new_span.end_ns = time.time_ns()
+            stack.pop()
+            spans.append(new_span)
+
+    def traced(self, function, name: str):
+        def traced_function(*args, **kwargs):
+            with self.span(name):
+                return function(*args, **kwargs)
+        return traced_function
+
+    def trace_resource_method(self, method):
+        '''
+            Resource method decorator (ResourceBase.method_decorators), the span covers the method and its marshalling
+        :return:
+        '''
+        return self.traced(method, '{}.{}'.format(type(method.__self__).__name__, method.__name__))
+
+    def flush(self) -> None:
+        self.__queue.join()
+
+    def __start_request(self) -> None:
+        depth = getattr(self.__local, 'depth', 0)
+        self.__local.depth = depth + 1
+        g.tracing_started = True
+        if depth:
+            self.__start_nested_request()
+            return
+        if random.random() >= self.__sample_rate:
+            return
+        root = Span('{:032x}'.format(random.getrandbits(128)), None, request.method, SPAN_KIND_SERVER, {
+            'http.method': request.method,
+            'http.target': request.full_path.rstrip('?'),
+        })
+        self.__local.spans = []
+        self.__local.stack = [root]
+        g.tracing_root = root
+
+    def __start_nested_request(self) -> None:
+        '''
+            A request run inside another one (a batch sub-request) is a child span of it, when it is sampled
+        :return:
+        '''
+        stack = getattr(self.__local, 'stack', None)
+        if not stack:
+            return
+        child = Span(stack[0].trace_id, stack[-1].span_id, request.method, SPAN_KIND_INTERNAL, {
+            'http.method': request.method,
+            'http.target': request.full_path.rstrip('?'),
+        })
+        stack.append(child)
+        g.tracing_root = child
+
+    def __finish_request(self, response):
+        root = g.get('tracing_root')
+        if root is not None:
+            root.attributes['http.status_code'] = response.status_code
+        return response
+
+    def __teardown_request(self, error=None) -> None:
+        if not g.pop('tracing_started', False):
+            return
+        self.__local.depth -= 1
+        root = g.pop('tracing_root', None)
+        if root is None:
+            return
+
+        root.end_ns = time.time_ns()
+        if request.url_rule is not None:
+            root.name = '{} {}'.format(request.method, request.url_rule.rule)
+            root.attributes['http.route'] = request.url_rule.rule
+        if error is not None:
+            root.attributes['error'] = repr(error)
+        if self.__local.depth:
+            self.__local.stack.pop()
+            self.__local.spans.append(root)
+            return
+        spans = self.__local.spans + [root]
+        self.__local.spans = None
+        self.__local.stack = None
+        self.__enqueue(spans)
+
+    def __enqueue(self, spans: list) -> None:
+        self.__start_worker()
+        try:
+            self.__queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped_spans += len(spans)
+
+    def __start_worker(self) -> None:
+        # INFO: threads don't survive a fork, so each worker process starts its own exporting thread
+        if self.__worker_pid == os.getpid():
+            return
+        with self.__worker_lock:
+            if self.__worker_pid != os.getpid():
+                threading.Thread(target=self.__export_loop, name='span-exporter', daemon=True).start()
+                self.__worker_pid = os.getpid()
+
+    def __export_loop(self) -> None:
+        while True:
+            batch = [self.__queue.get()]
+            deadline = time.monotonic() + self.__flush_interval
+            while len(batch) < self.__batch_size:
+                try:
+                    batch.append(self.__queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self.__exporter.export(to_otlp_request([span for spans in batch for span in spans], self.__service_name))
+            except Exception:
+                self.dropped_spans += sum(len(spans) for spans in batch)
+            finally:
+                for _ in batch:
+                    self.__queue.task_done()
+
+
+class TracingProxy(object):
+    '''
+        Wraps a service or repository, recording a span per call of its public methods (e.g. KitsService.update_kit)
+    '''
+
+    def __init__(self, target, name: str, tracer: Tracer):
+        self.__target = target
+        self.__name = name
+        self.__tracer = tracer
+
+    def __getattr__(self, attribute_name: str):
+        attribute = getattr(self.__target, attribute_name)
+        if attribute_name.startswith('_') or not callable(attribute):
+            return attribute
+        return self.__tracer.traced(attribute, '{}.{}'.format(self.__name, attribute_name))
@@ -1,15 +1,119 @@
+import asyncio
 from copy import deepcopy
-from typing import List
+from typing import Callable, Iterable, List
+from src.base import loading
 from src.base.application_services import ApplicationService
-from src.exceptions import ProductInUseError
-from src.kitmanagement.domain import Product, Kit, KitProduct, ProductRepository, KitRepository, CalculatedKit
+from src.base.loading import BatchLoader
+from src.exceptions import ProductInUseError, NotFound
+from src.kitmanagement.domain import Product, Kit, KitProduct, ProductRepository, KitRepository, CalculatedKit, \
+    AsyncProductRepository, AsyncKitRepository, ProductFilter, SortKey, KitAvailability, KitAvailabilityRepository, \
+    ExpandedKit, AsyncKitAvailabilityRepository
+
+
+# INFO: the CalculatedKit attributes that don't need the kit's products
+CALCULATED_KIT_FIELDS_OF_THE_KIT = {'name', 'sku'}
+
+
+def kit_availability_of(kit: Kit, products: List[Product]) -> KitAvailability:
+    '''
+        None for a kit without products, which has no inventory quantity
+    :return:
+    '''
+    calculated_kit = CalculatedKit(kit, products)
+    inventory_quantity = calculated_kit.inventory_quantity
+    if inventory_quantity is None:
+        return None
+    return KitAvailability(
+        kit_id=kit.id,
+        kit_sku=kit.sku,
+        kit_name=kit.name,
+        inventory_quantity=inventory_quantity,
+        limiting_product_sku=calculated_kit.limiting_product_sku
+    )
+
+
+def kit_availabilities_of(kits: List[Kit], products: List[Product]) -> tuple:
+    '''
+        The availabilities to save and the ids of the kits without products, whose availabilities must be removed
+    :return:
+    '''
+    kit_availabilities = []
+    stale_kit_ids = []
+    for kit in kits:
+        kit_availability = kit_availability_of(kit, products)
+        if kit_availability:
+            kit_availabilities.append(kit_availability)
+        else:
+            stale_kit_ids.append(kit.id)
+    return kit_availabilities, stale_kit_ids
+
+
+def skus_to_read_for(kits: List[Kit], updated_products: List[Product]) -> List[str]:
+    updated_skus = {product.sku for product in updated_products}
+    return list({kit_product.product_sku for kit in kits for kit_product in kit.kit_products} - updated_skus)
+
+
+class KitAvailabilityService(ApplicationService):
+    '''
+        Keeps the buildable inventory quantity of every kit precomputed, so low availability kits are an indexed
+        query. Products and kits services refresh it on every change that can move a kit inventory quantity. Its
+        repositories must read from the primary, see create_app.
+    '''
+
+    def __init__(self, kit_repository: KitRepository, product_repository: ProductRepository,
+                 kit_availability_repository: KitAvailabilityRepository):
+        self.__kit_repository = kit_repository
+        self.__product_repository = product_repository
+        self.__kit_availability_repository = kit_availability_repository
+
+    def list_low_availability(self, max_inventory_quantity: int) -> List[KitAvailability]:
+        return self.__kit_availability_repository.list_at_most(max_inventory_quantity)
+
+    def refresh_kit(self, kit: Kit, products: List[Product]) -> None:
+        kit_availability = kit_availability_of(kit, products)
+        if kit_availability:
+            self.__kit_availability_repository.save(kit_availability)
+        else:
+            self.__kit_availability_repository.remove(kit.id)
+
+    def refresh_kits(self, kits: List[Kit], updated_products: List[Product] = ()) -> None:
+        '''
+            Recomputes the kits, reading their products except the updated ones given, which may not have reached
+            the read preference of list_with_skus yet
+        :return:
+        '''
+        products = self.__product_repository.list_with_skus(skus_to_read_for(kits, updated_products))
+        kit_availabilities, stale_kit_ids = kit_availabilities_of(kits, products + list(updated_products))
+        if stale_kit_ids:
+            self.__kit_availability_repository.remove_many(stale_kit_ids)
+        self.__kit_availability_repository.save_all(kit_availabilities)
+
+    def refresh_kits_with_product(self, product: Product) -> None:
+        kits = self.__kit_repository.list_with_product(product.sku)
+        if kits:
+            self.refresh_kits(kits, [product])
+
+    def remove_kit(self, kit_id: str) -> None:
+        self.__kit_availability_repository.remove(kit_id)
+
+    def rebuild(self, batch_size: int = 1000) -> None:
+        '''
+            Recomputes every kit, for data written before kit availability existed
+        :return:
+        '''
+        kits = self.__kit_repository.list()
+        for start in range(0, len(kits), batch_size):
+            self.refresh_kits(kits[start:start + batch_size])
 
 
 class ProductsService(ApplicationService):
 
-    def __init__(self, product_repository: ProductRepository, kit_repository: KitRepository):
+    def __init__(self, product_repository: ProductRepository, kit_repository: KitRepository,
+                 kit_availability_service: KitAvailabilityService = None, batch_loader: BatchLoader = None):
         self.__product_repository = product_repository
         self.__kit_repository = kit_repository
+        self.__kit_availability_service = kit_availability_service
+        self.__batch_loader = batch_loader
 
     def create_product(self, product_creation_command: dict) -> Product:
         product = Product(**product_creation_command)
@@ -17,11 +121,26 @@ class ProductsService(ApplicationService):
         product.define_id(product_id)
         return product
 
-    def list_products(self) -> List[Product]:
-        return self.__product_repository.list()
+    def list_products(self, product_filter: ProductFilter = None, sort_keys: List[SortKey] = None,
+                      fields: List[str] = None) -> List[Product]:
+        if product_filter is None and not sort_keys:
+            return self.__product_repository.list(fields=fields)
+        return self.__product_repository.list_filtered(product_filter or ProductFilter(), sort_keys or [], fields=fields)
+
+    def search_products(self, query: str, offset: int, limit: int, fields: List[str] = None) -> List[Product]:
+        return self.__product_repository.search(query, offset, limit, fields=fields)
+
+    def get_product(self, product_id: str, fields: List[str] = None) -> Product:
+        product_repository = self.__product_repository
+        if self.__batch_loader:
+            product_repository = self.__batch_loader.repository(loading.PRODUCT, product_repository)
+        return product_repository.get_by_id(product_id, fields=fields)
 
-    def get_product(self, product_id: str) -> Product:
-        return self.__product_repository.get_by_id(product_id)
+    def get_products(self, product_ids: List[str], fields: List[str] = None) -> List[Product]:
+        return self.__product_repository.get_many_by_ids(product_ids, fields=fields)
+
+    def get_products_by_skus(self, skus: List[str], fields: List[str] = None) -> List[Product]:
+        return self.__product_repository.get_many_by_skus(skus, fields=fields)
 
     def remove_product(self, product_id: str) -> None:
         product = self.__product_repository.get_by_id(product_id)
@@ -32,60 +151,272 @@ class ProductsService(ApplicationService):
 
     def update_product(self, product_id: str, product_update_command: dict) -> Product:
         product = self.__product_repository.get_by_id(product_id)
+        previous_inventory_quantity = product.inventory_quantity
         product.update_infos(**product_update_command)
         self.__product_repository.update(product)
+        if self.__kit_availability_service and product.inventory_quantity != previous_inventory_quantity:
+            self.__kit_availability_service.refresh_kits_with_product(product)
+        return product
+
+    def patch_product(self, product_id: str, product_patch_command: dict) -> Product:
+        product = self.__product_repository.patch(product_id, product_patch_command)
+        # INFO: the previous quantity isn't read, so any patch setting it refreshes the kits
+        if self.__kit_availability_service and 'inventory_quantity' in product_patch_command:
+            self.__kit_availability_service.refresh_kits_with_product(product)
         return product
 
 
 class KitsService(ApplicationService):
 
-    def __init__(self, kit_repository: KitRepository, product_repository: ProductRepository):
+    def __init__(self, kit_repository: KitRepository, product_repository: ProductRepository,
+                 kit_availability_service: KitAvailabilityService = None, batch_loader: BatchLoader = None):
         self.__kit_repository = kit_repository
         self.__product_repository = product_repository
+        self.__kit_availability_service = kit_availability_service
+        self.__batch_loader = batch_loader
 
     def create_kit(self, kit_creation_command: dict) -> Kit:
-        kit_products = []
-        for kit_product_dict in kit_creation_command.pop('kit_products'):
-            self.__product_repository.get_by_sku(kit_product_dict['product_sku'])
-            kit_products.append(KitProduct(**kit_product_dict))
+        kit_products = [KitProduct(**kit_product_dict) for kit_product_dict in kit_creation_command.pop('kit_products')]
+        products = self.__products_of(kit_products)
 
         kit = Kit(**kit_creation_command, kit_products=kit_products)
         kit_id = self.__kit_repository.add(kit)
         kit.define_id(kit_id)
+        if self.__kit_availability_service:
+            self.__kit_availability_service.refresh_kit(kit, products)
         return kit
 
-    def list_kits(self) -> List[Kit]:
-        return self.__kit_repository.list()
+    def list_kits(self, fields: List[str] = None) -> List[Kit]:
+        return self.__kit_repository.list(fields=fields)
+
+    def list_kits_with_products(self, product_skus: List[str], offset: int, limit: int,
+                                fields: List[str] = None) -> List[Kit]:
+        return self.__kit_repository.list_with_products(product_skus, offset, limit, fields=fields)
+
+    def get_kit(self, kit_id: str, fields: List[str] = None) -> Kit:
+        kit_repository = self.__kit_repository
+        if self.__batch_loader:
+            kit_repository = self.__batch_loader.repository(loading.KIT, kit_repository)
+        return kit_repository.get_by_id(kit_id, fields=fields)
 
-    def get_kit(self, kit_id: str) -> Kit:
-        return self.__kit_repository.get_by_id(kit_id)
+    def get_kits(self, kit_ids: List[str], fields: List[str] = None) -> List[Kit]:
+        return self.__kit_repository.get_many_by_ids(kit_ids, fields=fields)
+
+    def get_kits_by_skus(self, skus: List[str], fields: List[str] = None) -> List[Kit]:
+        return self.__kit_repository.get_many_by_skus(skus, fields=fields)
+
+    def expand_products(self, kits: List[Kit]) -> List[ExpandedKit]:
+        '''
+            Inlines the products of the kits, read with one query for all of them
+        :return:
+        '''
+        product_skus = list({kit_product.product_sku: None for kit in kits for kit_product in kit.kit_products})
+        products = self.__product_repository.list_with_skus(product_skus) if product_skus else []
+        products_by_sku = {product.sku: product for product in products}
+        return [ExpandedKit(kit, products_by_sku) for kit in kits]
 
     def update_kit(self, kit_id: str, kit_update_command: dict) -> Kit:
         kit_update_command = deepcopy(kit_update_command)
         kit = self.__kit_repository.get_by_id(kit_id)
 
-        kit_products = []
-        for kit_product_dict in kit_update_command.pop('kit_products'):
-            self.__product_repository.get_by_sku(kit_product_dict['product_sku'])
-            kit_products.append(KitProduct(**kit_product_dict))
+        kit_products = [KitProduct(**kit_product_dict) for kit_product_dict in kit_update_command.pop('kit_products')]
+        products = self.__products_of(kit_products)
 
         kit.update_infos(**kit_update_command, kit_products=kit_products)
         self.__kit_repository.update(kit)
+        if self.__kit_availability_service:
+            self.__kit_availability_service.refresh_kit(kit, products)
+        return kit
+
+    def patch_kit_products(self, kit_id: str, kit_products_patch_command: dict) -> Kit:
+        '''
+            Applies {"add": [kit product], "change": [kit product], "remove": [product sku]}, only the added product
+            skus are checked. The kit availability is recomputed from all the kit's products, the ones not added are
+            read with one query: the stored availability only keeps the limiting product, not enough when that one
+            is removed or changed.
+        :return:
+        '''
+        added = [KitProduct(**kit_product_dict) for kit_product_dict in kit_products_patch_command.get('add') or []]
+        changed = [KitProduct(**kit_product_dict) for kit_product_dict in kit_products_patch_command.get('change') or []]
+        added_products = self.__products_of(added) if added else []
+
+        kit = self.__kit_repository.patch_kit_products(
+            kit_id, added, changed, kit_products_patch_command.get('remove') or []
+        )
+        if self.__kit_availability_service:
+            self.__kit_availability_service.refresh_kits([kit], added_products)
         return kit
 
     def remove_kit(self, kit_id: str) -> None:
         self.__kit_repository.remove(kit_id)
+        if self.__kit_availability_service:
+            self.__kit_availability_service.remove_kit(kit_id)
+
+    def __products_of(self, kit_products: List[KitProduct]) -> List[Product]:
+        skus = [kit_product.product_sku for kit_product in kit_products]
+        products = self.__product_repository.get_many_by_skus(skus)
+        for sku, product in zip(skus, products):
+            if product is None:
+                raise NotFound(f'product sku: {sku} not found')
+        return products
 
 
 class CalculatedKitsService(ApplicationService):
 
-    def __init__(self, kit_repository: KitRepository, product_repository: ProductRepository):
+    def __init__(self, kit_repository: KitRepository, product_repository: ProductRepository,
+                 batch_loader: BatchLoader = None, record_products: Callable[[Iterable[str]], None] = None):
+        '''
+            record_products is handed the ids of the products each calculated kit read, when accesses are counted
+        :return:
+        '''
         self.__kit_repository = kit_repository
         self.__product_repository = product_repository
+        self.__batch_loader = batch_loader
+        self.__record_products = record_products
 
-    def calculate_kit(self, kit_id: str) -> CalculatedKit:
-        kit = self.__kit_repository.get_by_id(kit_id)
-        products = self.__product_repository.list_with_skus([
+    def calculate_kit(self, kit_id: str, fields: List[str] = None) -> CalculatedKit:
+        '''
+            With fields, the kit's products are only read when a field needs them (cost, price, inventory quantity)
+        :return:
+        '''
+        kit_repository = self.__kit_repository
+        if self.__batch_loader:
+            kit_repository = self.__batch_loader.repository(loading.KIT, kit_repository)
+        if fields is not None and set(fields) <= CALCULATED_KIT_FIELDS_OF_THE_KIT:
+            return CalculatedKit(kit_repository.get_by_id(kit_id, fields=fields), [])
+        kit = kit_repository.get_by_id(kit_id)
+        product_skus = [kit_product.product_sku for kit_product in kit.kit_products]
+        products = self.__product_repository.list_with_skus(product_skus)
+        if self.__record_products:
+            self.__record_products([product.id for product in products])
+        return CalculatedKit(kit, products)
+
+
+class AsyncKitAvailabilityService(ApplicationService):
+    '''
+        The writes of KitAvailabilityService, so the ASGI deployment keeps the kit availability up to date too
+    '''
+
+    def __init__(self, kit_repository: AsyncKitRepository, product_repository: AsyncProductRepository,
+                 kit_availability_repository: AsyncKitAvailabilityRepository):
+        self.__kit_repository = kit_repository
+        self.__product_repository = product_repository
+        self.__kit_availability_repository = kit_availability_repository
+
+    async def refresh_kits(self, kits: List[Kit], updated_products: List[Product] = ()) -> None:
+        skus = skus_to_read_for(kits, updated_products)
+        products = await self.__product_repository.list_with_skus(skus) if skus else []
+        kit_availabilities, stale_kit_ids = kit_availabilities_of(kits, products + list(updated_products))
+        await self.__kit_availability_repository.remove_many(stale_kit_ids)
+        await self.__kit_availability_repository.save_all(kit_availabilities)
+
+    async def refresh_kits_with_product(self, product: Product) -> None:
+        kits = await self.__kit_repository.list_with_product(product.sku)
+        if kits:
+            await self.refresh_kits(kits, [product])
+
+    async def remove_kit(self, kit_id: str) -> None:
+        await self.__kit_availability_repository.remove_many([kit_id])
+
+
+class AsyncProductsService(ApplicationService):
+
+    def __init__(self, product_repository: AsyncProductRepository, kit_repository: AsyncKitRepository,
+                 kit_availability_service: AsyncKitAvailabilityService = None):
+        self.__product_repository = product_repository
+        self.__kit_repository = kit_repository
+        self.__kit_availability_service = kit_availability_service
+
+    async def create_product(self, product_creation_command: dict) -> Product:
+        product = Product(**product_creation_command)
+        product_id = await self.__product_repository.add(product)
+        product.define_id(product_id)
+        return product
+
+    async def list_products(self) -> List[Product]:
+        return await self.__product_repository.list()
+
+    async def get_product(self, product_id: str) -> Product:
+        return await self.__product_repository.get_by_id(product_id)
+
+    async def remove_product(self, product_id: str) -> None:
+        product = await self.__product_repository.get_by_id(product_id)
+        kits_using_product = await self.__kit_repository.list_with_product(product.sku)
+        if kits_using_product:
+            raise ProductInUseError('products being used by kits cant be removed')
+        await self.__product_repository.remove(product_id)
+
+    async def update_product(self, product_id: str, product_update_command: dict) -> Product:
+        product = await self.__product_repository.get_by_id(product_id)
+        previous_inventory_quantity = product.inventory_quantity
+        product.update_infos(**product_update_command)
+        await self.__product_repository.update(product)
+        if self.__kit_availability_service and product.inventory_quantity != previous_inventory_quantity:
+            await self.__kit_availability_service.refresh_kits_with_product(product)
+        return product
+
+
+class AsyncKitsService(ApplicationService):
+
+    def __init__(self, kit_repository: AsyncKitRepository, product_repository: AsyncProductRepository,
+                 kit_availability_service: AsyncKitAvailabilityService = None):
+        self.__kit_repository = kit_repository
+        self.__product_repository = product_repository
+        self.__kit_availability_service = kit_availability_service
+
+    async def create_kit(self, kit_creation_command: dict) -> Kit:
+        kit_products, products = await self.__build_kit_products(kit_creation_command.pop('kit_products'))
+        kit = Kit(**kit_creation_command, kit_products=kit_products)
+        kit_id = await self.__kit_repository.add(kit)
+        kit.define_id(kit_id)
+        if self.__kit_availability_service:
+            await self.__kit_availability_service.refresh_kits([kit], products)
+        return kit
+
+    async def list_kits(self) -> List[Kit]:
+        return await self.__kit_repository.list()
+
+    async def get_kit(self, kit_id: str) -> Kit:
+        return await self.__kit_repository.get_by_id(kit_id)
+
+    async def update_kit(self, kit_id: str, kit_update_command: dict) -> Kit:
+        kit_update_command = deepcopy(kit_update_command)
+        kit, (kit_products, products) = await asyncio.gather(
+            self.__kit_repository.get_by_id(kit_id),
+            self.__build_kit_products(kit_update_command.pop('kit_products'))
+        )
+        kit.update_infos(**kit_update_command, kit_products=kit_products)
+        await self.__kit_repository.update(kit)
+        if self.__kit_availability_service:
+            await self.__kit_availability_service.refresh_kits([kit], products)
+        return kit
+
+    async def remove_kit(self, kit_id: str) -> None:
+        await self.__kit_repository.remove(kit_id)
+        if self.__kit_availability_service:
+            await self.__kit_availability_service.remove_kit(kit_id)
+
+    async def __build_kit_products(self, kit_product_dicts: List[dict]) -> tuple:
+        '''
+            The kit products and their products, which the kit availability is computed from
+        :return:
+        '''
+        products = await asyncio.gather(*[
+            self.__product_repository.get_by_sku(kit_product_dict['product_sku'])
+            for kit_product_dict in kit_product_dicts
+        ])
+        return [KitProduct(**kit_product_dict) for kit_product_dict in kit_product_dicts], list(products)
+
+
+class AsyncCalculatedKitsService(ApplicationService):
+
+    def __init__(self, kit_repository: AsyncKitRepository, product_repository: AsyncProductRepository):
+        self.__kit_repository = kit_repository
+        self.__product_repository = product_repository
+
+    async def calculate_kit(self, kit_id: str) -> CalculatedKit:
+        kit = await self.__kit_repository.get_by_id(kit_id)
+        products = await self.__product_repository.list_with_skus([
             kit_product.product_sku
             for kit_product in kit.kit_products
         ])
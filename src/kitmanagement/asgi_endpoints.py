@@ -0,0 +1,129 @@
+from flask_restx import marshal
+from flask_restx.errors import abort
+
+from src.exceptions import NotFound, skuExistsError, ProductInUseError
+from src.web_app import get_api
+
+from src.base.asgi import AsgiApp, AsgiRequest, AsyncResourceBase
+from src.kitmanagement import serialization
+
+
+api = get_api()
+
+
+class ProductsResource(AsyncResourceBase):
+
+    def __init__(self, products_service):
+        super(ProductsResource, self).__init__(api)
+        self.__products_service = products_service
+
+    async def get(self, request: AsgiRequest):
+        return marshal(await self.__products_service.list_products(), serialization.product_model)
+
+    async def post(self, request: AsgiRequest):
+        product_creation_command = self._serialize_in(request, serialization.product_creation_command_model)
+        try:
+            product = await self.__products_service.create_product(product_creation_command)
+            return marshal(product, serialization.product_model), 201
+        except skuExistsError:
+            abort(403, 'The product sku is already being used by another product', sku=product_creation_command['sku'])
+
+
+class ProductResource(AsyncResourceBase):
+
+    def __init__(self, products_service):
+        super(ProductResource, self).__init__(api)
+        self.__products_service = products_service
+
+    async def get(self, request: AsgiRequest, product_id: str):
+        try:
+            return marshal(await self.__products_service.get_product(product_id), serialization.product_model)
+        except NotFound:
+            abort(404, 'Product Not Found.', product_id=product_id)
+
+    async def put(self, request: AsgiRequest, product_id: str):
+        try:
+            product_update_command = self._serialize_in(request, serialization.product_update_command_model)
+            product = await self.__products_service.update_product(product_id, product_update_command)
+            return marshal(product, serialization.product_model), 200
+        except NotFound:
+            abort(404, 'Product Not Found.', product_id=product_id)
+
+    async def delete(self, request: AsgiRequest, product_id: str):
+        try:
+            await self.__products_service.remove_product(product_id)
+            return {}, 204
+        except ProductInUseError:
+            abort(403, 'Product is being used by a kit.', product_id=product_id)
+        except NotFound:
+            abort(404, 'Product Not Found.', product_id=product_id)
+
+
+class KitsResource(AsyncResourceBase):
+
+    def __init__(self, kits_service):
+        super(KitsResource, self).__init__(api)
+        self.__kits_service = kits_service
+
+    async def post(self, request: AsgiRequest):
+        kit_creation_command = self._serialize_in(request, serialization.kit_creation_command_model)
+
+        try:
+            kit = await self.__kits_service.create_kit(kit_creation_command)
+            return marshal(kit, serialization.kit_model), 201
+        except NotFound:
+            abort(404, 'Product Not Found.')
+        except skuExistsError:
+            abort(400, 'The kit sku is already being used by another kit ', sku=kit_creation_command['sku'])
+
+    async def get(self, request: AsgiRequest):
+        return marshal(await self.__kits_service.list_kits(), serialization.kit_model)
+
+
+class KitResource(AsyncResourceBase):
+
+    def __init__(self, kits_service):
+        super(KitResource, self).__init__(api)
+        self.__kits_service = kits_service
+
+    async def get(self, request: AsgiRequest, kit_id: str):
+        try:
+            return marshal(await self.__kits_service.get_kit(kit_id), serialization.kit_model)
+        except NotFound:
+            abort(404, 'Kit Not Found.', kit_id=kit_id)
+
+    async def put(self, request: AsgiRequest, kit_id: str):
+        kit_update_command = self._serialize_in(request, serialization.kit_update_command_model)
+
+        try:
+            return marshal(await self.__kits_service.update_kit(kit_id, kit_update_command), serialization.kit_model)
+        except NotFound:
+            abort(404, 'Kit Not Found.', kit_id=kit_id)
+
+    async def delete(self, request: AsgiRequest, kit_id: str):
+        try:
+            await self.__kits_service.remove_kit(kit_id)
+            return {}, 204
+        except NotFound:
+            abort(404, 'Kit Not Found.', kit_id=kit_id)
+
+
+class CalculatedKitResource(AsyncResourceBase):
+
+    def __init__(self, calculated_kits_service):
+        super(CalculatedKitResource, self).__init__(api)
+        self.__calculated_kits_service = calculated_kits_service
+
+    async def get(self, request: AsgiRequest, kit_id: str):
+        try:
+            return marshal(await self.__calculated_kits_service.calculate_kit(kit_id), serialization.calculated_kit_model)
+        except NotFound:
+            abort(404, 'Kit Not Found.', kit_id=kit_id)
+
+
+def register(asgi_app: AsgiApp, products_service, kits_service, calculated_kits_service):
+    asgi_app.add_resource(ProductResource(products_service), '/api/products/<string:product_id>')
+    asgi_app.add_resource(ProductsResource(products_service), '/api/products')
+    asgi_app.add_resource(KitResource(kits_service), '/api/kits/<string:kit_id>')
+    asgi_app.add_resource(KitsResource(kits_service), '/api/kits')
+    asgi_app.add_resource(CalculatedKitResource(calculated_kits_service), '/api/calculated-kits/<string:kit_id>')
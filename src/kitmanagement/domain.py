@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import List
+from typing import Dict, List
 
 from src.exceptions import IdAlreadyDefined
 from src.base.domain import AggregateRoot, ValueObject
@@ -51,6 +51,15 @@ class Product(AggregateRoot):
         self.__price = price
         self.__inventory_quantity = inventory_quantity
 
+    def patch_infos(self, **changes):
+        self.update_infos(**{
+            'name': self.__name,
+            'cost': self.__cost,
+            'price': self.__price,
+            'inventory_quantity': self.__inventory_quantity,
+            **changes
+        })
+
 
 @dataclass(frozen=True)
 class KitProduct(ValueObject):
@@ -59,6 +68,38 @@ class KitProduct(ValueObject):
     discount_percentage: float
 
 
+@dataclass(frozen=True)
+class ProductFilter(ValueObject):
+    '''
+        Criteria of a product list query, the bounds are inclusive and None means unbounded
+    '''
+    min_price: float = None
+    max_price: float = None
+    min_cost: float = None
+    max_cost: float = None
+    max_inventory_quantity: int = None
+    sku_prefix: str = None
+
+    def matches(self, product: Product) -> bool:
+        return (
+            (self.min_price is None or product.price >= self.min_price)
+            and (self.max_price is None or product.price <= self.max_price)
+            and (self.min_cost is None or product.cost >= self.min_cost)
+            and (self.max_cost is None or product.cost <= self.max_cost)
+            and (self.max_inventory_quantity is None or product.inventory_quantity <= self.max_inventory_quantity)
+            and (self.sku_prefix is None or product.sku.startswith(self.sku_prefix))
+        )
+
+
+@dataclass(frozen=True)
+class SortKey(ValueObject):
+    field: str
+    descending: bool = False
+
+
+PRODUCT_SORT_FIELDS = ('name', 'sku', 'cost', 'price', 'inventory_quantity')
+
+
 class Kit(AggregateRoot):
 
     def __init__(self, name: str, sku: str, kit_products: List[KitProduct], id: str=None):
@@ -98,6 +139,8 @@ class CalculatedKit:
     def __init__(self, kit: Kit, products: List[Product]):
         self.__kit = kit
         self.__products = products
+        self.__products_by_sku = None
+        self.__limiting = None
 
     @property
     def name(self):
@@ -109,20 +152,15 @@ class CalculatedKit:
 
     @property
     def inventory_quantity(self) -> int:
-        inventory_quantity = None
+        return self.__limiting_kit_product()[0]
 
-        for kit_product in self.__kit.kit_products:
-            product = self.__get_product_with(kit_product.product_sku)
-            kit_product_inventory_quantity = int(product.inventory_quantity / kit_product.quantity)
-
-            if not inventory_quantity:
-                inventory_quantity = kit_product_inventory_quantity
-                break
-
-            if kit_product_inventory_quantity < inventory_quantity:
-                inventory_quantity = kit_product_inventory_quantity
-
-        return inventory_quantity
+    @property
+    def limiting_product_sku(self) -> str:
+        '''
+            The component whose inventory allows the fewest kits
+        :return:
+        '''
+        return self.__limiting_kit_product()[1]
 
     @property
     def cost(self) -> float:
@@ -145,38 +183,151 @@ class CalculatedKit:
 
         return price
 
+    def __limiting_kit_product(self) -> tuple:
+        # INFO: computed once, inventory_quantity and limiting_product_sku both need it
+        if self.__limiting is not None:
+            return self.__limiting
+        inventory_quantity = None
+        limiting_product_sku = None
+
+        for kit_product in self.__kit.kit_products:
+            product = self.__get_product_with(kit_product.product_sku)
+            kit_product_inventory_quantity = int(product.inventory_quantity / kit_product.quantity)
+
+            if inventory_quantity is None or kit_product_inventory_quantity < inventory_quantity:
+                inventory_quantity = kit_product_inventory_quantity
+                limiting_product_sku = kit_product.product_sku
+
+        self.__limiting = inventory_quantity, limiting_product_sku
+        return self.__limiting
+
     def __get_product_with(self, sku: str) -> Product:
-        for product in self.__products:
-            if sku == product.sku:
-                return product
-        raise ValueError('Must have one product for each kit.kit_product')
+        if self.__products_by_sku is None:
+            # INFO: the first product of each sku, like the scan it replaces
+            self.__products_by_sku = {}
+            for product in self.__products:
+                self.__products_by_sku.setdefault(product.sku, product)
+        product = self.__products_by_sku.get(sku)
+        if product is None:
+            raise ValueError('Must have one product for each kit.kit_product')
+        return product
 
     def __apply_discount(self, price, discount_percentage):
         return price - (price / 100 * discount_percentage)
 
 
+@dataclass(frozen=True)
+class ExpandedKitProduct(ValueObject):
+    product_sku: str
+    quantity: int
+    discount_percentage: float
+    product: Product = None
+
+
+class ExpandedKit:
+    '''
+        Kit read with the product of each kit product inlined, None for a product that no longer exists
+    '''
+
+    def __init__(self, kit: Kit, products_by_sku: Dict[str, Product]):
+        self.__kit = kit
+        self.__products_by_sku = products_by_sku
+
+    @property
+    def id(self) -> str:
+        return self.__kit.id
+
+    @property
+    def name(self) -> str:
+        return self.__kit.name
+
+    @property
+    def sku(self) -> str:
+        return self.__kit.sku
+
+    @property
+    def kit_products(self) -> List[ExpandedKitProduct]:
+        return [
+            ExpandedKitProduct(
+                product_sku=kit_product.product_sku,
+                quantity=kit_product.quantity,
+                discount_percentage=kit_product.discount_percentage,
+                product=self.__products_by_sku.get(kit_product.product_sku)
+            )
+            for kit_product in self.__kit.kit_products
+        ]
+
+
+@dataclass(frozen=True)
+class KitAvailability(ValueObject):
+    '''
+        How many kits the inventory of their products allows, kept up to date when kits or product inventories change
+    '''
+    kit_id: str
+    kit_sku: str
+    kit_name: str
+    inventory_quantity: int
+    limiting_product_sku: str
+
+
 class ProductRepository(ABC):
+    '''
+        The read methods taking fields may read only those attributes (e.g. ['sku', 'price']) of the products,
+        leaving the others None, for responses that don't show them. None reads every attribute.
+    '''
 
     @abstractmethod
-    def list(self) -> List[Product]:
+    def list(self, fields: List[str] = None) -> List[Product]:
         raise NotImplementedError
 
     @abstractmethod
     def list_with_skus(self, skus: List[str]) -> List[Product]:
         raise NotImplementedError
 
+    @abstractmethod
+    def list_filtered(self, product_filter: ProductFilter, sort_keys: List[SortKey], fields: List[str] = None) -> List[Product]:
+        '''
+            Products matching the filter, ordered by the sort keys (fields of PRODUCT_SORT_FIELDS)
+        :return:
+        '''
+        raise NotImplementedError
+
     @abstractmethod
     def add(self, product: Product) -> str:
         raise NotImplementedError
 
     @abstractmethod
-    def get_by_id(self, product_id: str) -> Product:
+    def search(self, query: str, offset: int, limit: int, fields: List[str] = None) -> List[Product]:
+        '''
+            Products with a name or sku token starting with each of the query tokens, best matches first
+        :return:
+        '''
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_by_id(self, product_id: str, fields: List[str] = None) -> Product:
         raise NotImplementedError
 
     @abstractmethod
     def get_by_sku(self, sku: str) -> Product:
         raise NotImplementedError
 
+    @abstractmethod
+    def get_many_by_ids(self, product_ids: List[str], fields: List[str] = None) -> List[Product]:
+        '''
+            The products in the order of the ids, None for the ids not found
+        :return:
+        '''
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_many_by_skus(self, skus: List[str], fields: List[str] = None) -> List[Product]:
+        '''
+            The products in the order of the skus, None for the skus not found
+        :return:
+        '''
+        raise NotImplementedError
+
     @abstractmethod
     def remove(self, product_id: str) -> None:
         raise NotImplementedError
@@ -185,23 +336,60 @@ class ProductRepository(ABC):
     def update(self, product: Product) -> None:
         raise NotImplementedError
 
+    @abstractmethod
+    def patch(self, product_id: str, changes: dict) -> Product:
+        '''
+            Sets only the given attributes (e.g. {'price': 25.0}) without reading the product first, and returns it
+            updated
+        :return:
+        '''
+        raise NotImplementedError
+
 
 class KitRepository(ABC):
+    '''
+        Like ProductRepository, the read methods taking fields may read only those attributes of the kits
+    '''
 
     @abstractmethod
-    def list(self) -> List[Kit]:
+    def list(self, fields: List[str] = None) -> List[Kit]:
         raise NotImplementedError
 
     @abstractmethod
     def list_with_product(self, product_sku: str) -> List[Kit]:
         raise NotImplementedError
 
+    @abstractmethod
+    def list_with_products(self, product_skus: List[str], offset: int, limit: int,
+                           fields: List[str] = None) -> List[Kit]:
+        '''
+            Page of the kits containing any of the products, in id order
+        :return:
+        '''
+        raise NotImplementedError
+
     @abstractmethod
     def add(self, kit: Kit) -> str:
         raise NotImplementedError
 
     @abstractmethod
-    def get_by_id(self, kit_id: str) -> Kit:
+    def get_by_id(self, kit_id: str, fields: List[str] = None) -> Kit:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_many_by_ids(self, kit_ids: List[str], fields: List[str] = None) -> List[Kit]:
+        '''
+            The kits in the order of the ids, None for the ids not found
+        :return:
+        '''
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_many_by_skus(self, skus: List[str], fields: List[str] = None) -> List[Kit]:
+        '''
+            The kits in the order of the skus, None for the skus not found
+        :return:
+        '''
         raise NotImplementedError
 
     @abstractmethod
@@ -211,3 +399,113 @@ class KitRepository(ABC):
     @abstractmethod
     def update(self, kit: Kit) -> None:
         raise NotImplementedError
+
+    @abstractmethod
+    def patch_kit_products(self, kit_id: str, added: List[KitProduct], changed: List[KitProduct],
+                           removed_skus: List[str]) -> Kit:
+        '''
+            Removes, changes then adds the given kit products only, and returns the kit updated. Raises NotFound when
+            a changed or removed product sku isn't in the kit, KitProductExistsError when an added one already is, and
+            ConcurrentUpdateError when concurrent updates keep the patch from being applied
+        :return:
+        '''
+        raise NotImplementedError
+
+
+class KitAvailabilityRepository(ABC):
+
+    @abstractmethod
+    def save(self, kit_availability: KitAvailability) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_all(self, kit_availabilities: List[KitAvailability]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove(self, kit_id: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_many(self, kit_ids: List[str]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_at_most(self, max_inventory_quantity: int) -> List[KitAvailability]:
+        '''
+            Kits with an inventory quantity at or below the maximum, the lowest first
+        :return:
+        '''
+        raise NotImplementedError
+
+
+class AsyncKitAvailabilityRepository(ABC):
+    '''
+        The writes of KitAvailabilityRepository, for the ASGI deployment to keep the kit availability up to date
+    '''
+
+    @abstractmethod
+    async def save_all(self, kit_availabilities: List[KitAvailability]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def remove_many(self, kit_ids: List[str]) -> None:
+        raise NotImplementedError
+
+
+class AsyncProductRepository(ABC):
+
+    @abstractmethod
+    async def list(self) -> List[Product]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_with_skus(self, skus: List[str]) -> List[Product]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add(self, product: Product) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_by_id(self, product_id: str) -> Product:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_by_sku(self, sku: str) -> Product:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def remove(self, product_id: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update(self, product: Product) -> None:
+        raise NotImplementedError
+
+
+class AsyncKitRepository(ABC):
+
+    @abstractmethod
+    async def list(self) -> List[Kit]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_with_product(self, product_sku: str) -> List[Kit]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add(self, kit: Kit) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_by_id(self, kit_id: str) -> Kit:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def remove(self, kit_id: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update(self, kit: Kit) -> None:
+        raise NotImplementedError
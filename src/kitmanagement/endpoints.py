@@ -1,12 +1,115 @@
-from src.exceptions import NotFound, skuExistsError, ProductInUseError
+from flask import request
+
+from src.exceptions import NotFound, skuExistsError, ProductInUseError, KitProductExistsError, \
+    ConcurrentUpdateError
 from src.web_app import get_api
 
-from src.base.endpoints import ResourceBase, responses_doc_for
+from src.base.endpoints import ResourceBase, responses_doc_for, RESPONSES_DOC, FIELDS_DOC
+from src.instrumentation import hot_keys
 from src.kitmanagement import serialization
+from src.kitmanagement.domain import ProductFilter, SortKey
 
 
 api = get_api()
 
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+KITS_PAGE_SIZE = 100
+MAX_KITS_PAGE_SIZE = 1000
+KIT_EXPANSIONS = ['products']
+MULTI_GET_ARGUMENTS = {'ids': 'id', 'skus': 'sku'}
+MAX_MULTI_GET_SIZE = 100
+PRODUCT_FILTER_ARGUMENTS = {
+    'minPrice': ('min_price', float),
+    'maxPrice': ('max_price', float),
+    'minCost': ('min_cost', float),
+    'maxCost': ('max_cost', float),
+    'maxInventoryQuantity': ('max_inventory_quantity', int),
+    'skuPrefix': ('sku_prefix', str),
+}
+PRODUCT_SORT_ARGUMENTS = {
+    'name': 'name',
+    'sku': 'sku',
+    'cost': 'cost',
+    'price': 'price',
+    'inventoryQuantity': 'inventory_quantity',
+}
+
+
+def product_filter_from(args) -> ProductFilter:
+    '''
+        Builds the filter of the product list query arguments, None when there is none
+    :return:
+    '''
+    criteria = {}
+    for argument, (field, argument_type) in PRODUCT_FILTER_ARGUMENTS.items():
+        if argument in args:
+            try:
+                criteria[field] = argument_type(args[argument])
+            except ValueError:
+                api.abort(400, 'Invalid {} filter.'.format(argument), **{argument: args[argument]})
+    return ProductFilter(**criteria) if criteria else None
+
+
+def sort_keys_from(args) -> list:
+    '''
+        Parses sort=price,-inventoryQuantity, a leading - sorts in descending order
+    :return:
+    '''
+    sort_keys = []
+    for argument in filter(None, args.get('sort', '').split(',')):
+        field = PRODUCT_SORT_ARGUMENTS.get(argument.lstrip('-'))
+        if not field:
+            api.abort(400, 'Invalid sort key.', sort=argument, sort_keys=list(PRODUCT_SORT_ARGUMENTS))
+        sort_keys.append(SortKey(field, descending=argument.startswith('-')))
+    return sort_keys
+
+
+def list_argument(args, name: str) -> list:
+    '''
+        Values of an argument given repeated (sku=A&sku=B) or comma separated (sku=A,B)
+    :return:
+    '''
+    return [value for argument in args.getlist(name) for value in argument.split(',') if value]
+
+
+def multi_get_keys_from(args) -> tuple:
+    '''
+        Parses ids=1,2 or skus=A,B into the key field (id or sku) and the keys, None when there is neither
+    :return:
+    '''
+    arguments = [argument for argument in MULTI_GET_ARGUMENTS if argument in args]
+    if not arguments:
+        return None
+    keys = list_argument(args, arguments[0])
+    if len(arguments) > 1 or not 0 < len(keys) <= MAX_MULTI_GET_SIZE:
+        api.abort(400, 'Either ids or skus, with 1 to {} of them.'.format(MAX_MULTI_GET_SIZE))
+    return MULTI_GET_ARGUMENTS[arguments[0]], keys
+
+
+def with_not_found_markers(key_field: str, keys: list, entities: list, marshalled_entities: list) -> list:
+    '''
+        The marshalled entities found by a multi-get, in the order of the keys, with {key_field: key, notFound: true}
+        for the keys not found
+    :return:
+    '''
+    found = iter(marshalled_entities)
+    return [
+        next(found) if entity is not None else {key_field: key, 'notFound': True}
+        for key, entity in zip(keys, entities)
+    ]
+
+
+def expansions_from(args) -> set:
+    '''
+        Parses expand=products, the related resources to inline in a kit response
+    :return:
+    '''
+    expansions = set(filter(None, args.get('expand', '').split(',')))
+    if not expansions.issubset(KIT_EXPANSIONS):
+        api.abort(400, 'Invalid expand.', expand=args['expand'], expansions=KIT_EXPANSIONS)
+    return expansions
+
 
 @api.doc()
 class ProductsResource(ResourceBase):
@@ -15,11 +118,30 @@ class ProductsResource(ResourceBase):
         super(ProductsResource, self).__init__(*args, **kwargs)
         self.__products_service = kwargs['products_service']
 
-    @api.marshal_list_with(serialization.product_model)
-    @api.doc(responses=responses_doc_for(200, 500))
+    @api.response(200, RESPONSES_DOC[200], [serialization.product_model])
+    @api.doc(params=FIELDS_DOC)
+    @api.doc(params={
+        'minPrice': 'Lowest price, inclusive',
+        'maxPrice': 'Highest price, inclusive',
+        'minCost': 'Lowest cost, inclusive',
+        'maxCost': 'Highest cost, inclusive',
+        'maxInventoryQuantity': 'Highest inventory quantity, inclusive, e.g. for a low stock report',
+        'skuPrefix': 'Beginning of the sku, case sensitive',
+        'sort': 'Comma separated name, sku, cost, price or inventoryQuantity, prefixed by - for descending order',
+        'ids': 'Gets these products instead, comma separated, at most 100, in order, {id, notFound} for the missing ones',
+        'skus': 'Gets these products instead, like ids'
+    })
+    @api.doc(responses=responses_doc_for(400, 500))
     def get(self):
-        zas = self.__products_service.list_products()
-        return self.__products_service.list_products()
+        fields = self._fields(serialization.product_model)
+        multi_get = multi_get_keys_from(request.args)
+        if multi_get:
+            return self.__get_many(*multi_get, fields)
+
+        products = self.__products_service.list_products(
+            product_filter_from(request.args), sort_keys_from(request.args), fields
+        )
+        return self._marshal(products, serialization.product_model)
 
     @api.expect(serialization.product_creation_command_model, validate=True)
     @api.marshal_with(serialization.product_model, code=201)
@@ -32,6 +154,43 @@ class ProductsResource(ResourceBase):
         except skuExistsError:
             api.abort(403, 'The product sku is already being used by another product', sku=product_creation_command['sku'])
 
+    def __get_many(self, key_field: str, keys: list, fields: list) -> list:
+        if key_field == 'id':
+            products = self.__products_service.get_products(keys, fields)
+        else:
+            products = self.__products_service.get_products_by_skus(keys, fields)
+        found_products = [product for product in products if product is not None]
+        hot_keys.record_many(hot_keys.PRODUCT, [product.id for product in found_products])
+        return with_not_found_markers(
+            key_field, keys, products, self._marshal(found_products, serialization.product_model)
+        )
+
+
+@api.doc(params={
+    'q': 'Words, or their beginning, of the product name or sku',
+    'offset': 'Results to skip, default 0',
+    'limit': 'Page size, default 20, at most 100'
+})
+class ProductSearchResource(ResourceBase):
+
+    def __init__(self, *args, **kwargs):
+        super(ProductSearchResource, self).__init__(*args, **kwargs)
+        self.__products_service = kwargs['products_service']
+
+    @api.response(200, RESPONSES_DOC[200], [serialization.product_model])
+    @api.doc(params=FIELDS_DOC)
+    @api.doc(responses=responses_doc_for(400, 500))
+    def get(self):
+        query = request.args.get('q', '')
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', SEARCH_PAGE_SIZE, type=int)
+        if not query.strip() or offset < 0 or not 0 < limit <= MAX_SEARCH_PAGE_SIZE:
+            api.abort(400, 'q is required, offset cant be negative and limit must be between 1 and {}.'.format(
+                MAX_SEARCH_PAGE_SIZE
+            ))
+        products = self.__products_service.search_products(query, offset, limit, self._fields(serialization.product_model))
+        return self._marshal(products, serialization.product_model)
+
 
 class ProductResource(ResourceBase):
 
@@ -39,13 +198,16 @@ class ProductResource(ResourceBase):
         super(ProductResource, self).__init__(*args, **kwargs)
         self.__products_service = kwargs['products_service']
 
-    @api.marshal_with(serialization.product_model)
-    @api.doc(responses=responses_doc_for(200, 403, 404, 500))
+    @api.response(200, RESPONSES_DOC[200], serialization.product_model)
+    @api.doc(params=FIELDS_DOC)
+    @api.doc(responses=responses_doc_for(400, 403, 404, 500))
     def get(self, product_id: str):
         try:
-            return self.__products_service.get_product(product_id)
+            product = self.__products_service.get_product(product_id, self._fields(serialization.product_model))
         except NotFound:
             api.abort(404, 'Product Not Found.', product_id=product_id)
+        hot_keys.record(hot_keys.PRODUCT, product_id)
+        return self._marshal(product, serialization.product_model)
 
     @api.expect(serialization.product_update_command_model, validate=True)
     @api.marshal_with(serialization.product_model, code=200)
@@ -58,6 +220,22 @@ class ProductResource(ResourceBase):
         except NotFound:
             api.abort(404, 'Product Not Found.', product_id=product_id)
 
+    @api.expect(serialization.product_patch_command_model, validate=True)
+    @api.marshal_with(serialization.product_model, code=200)
+    @api.doc(responses=responses_doc_for(200, 400, 404, 500))
+    def patch(self, product_id: str):
+        '''
+            Updates only the attributes sent, e.g. {"price": 25.0}
+        :return:
+        '''
+        product_patch_command = self._serialize_patch_in(serialization.product_patch_command_model)
+        if not product_patch_command:
+            api.abort(400, 'Nothing to update.', product_id=product_id)
+        try:
+            return self.__products_service.patch_product(product_id, product_patch_command), 200
+        except NotFound:
+            api.abort(404, 'Product Not Found.', product_id=product_id)
+
     @api.doc(responses=responses_doc_for(204, 403, 404, 500))
     def delete(self, product_id: str):
         try:
@@ -90,10 +268,49 @@ class KitsResource(ResourceBase):
         except skuExistsError:
             api.abort(400, 'The kit sku is already being used by another kit ', sku=kit_creation_command['sku'])
 
-    @api.doc(responses=responses_doc_for(200, 500))
-    @api.marshal_list_with(serialization.kit_model, code=200)
+    @api.doc(params={
+        'productSku': 'Lists only the kits using this product, repeated or comma separated for any of several',
+        'offset': 'Kits to skip when filtered by productSku, default 0',
+        'limit': 'Page size when filtered by productSku, default 100, at most 1000',
+        'expand': 'products inlines the product of every kit product',
+        'ids': 'Gets these kits instead, comma separated, at most 100, in order, {id, notFound} for the missing ones',
+        'skus': 'Gets these kits instead, like ids'
+    })
+    @api.doc(params=FIELDS_DOC)
+    @api.doc(responses=responses_doc_for(400, 500))
+    @api.response(200, RESPONSES_DOC[200], [serialization.expanded_kit_model])
     def get(self):
-        return self.__kits_service.list_kits()
+        expansions = expansions_from(request.args)
+        fields = self._fields(serialization.expanded_kit_model)
+        multi_get = multi_get_keys_from(request.args)
+        if multi_get:
+            return self.__get_many(*multi_get, fields, expansions)
+
+        product_skus = list_argument(request.args, 'productSku')
+        if not product_skus:
+            kits = self.__kits_service.list_kits(fields)
+        else:
+            offset = request.args.get('offset', 0, type=int)
+            limit = request.args.get('limit', KITS_PAGE_SIZE, type=int)
+            if offset < 0 or not 0 < limit <= MAX_KITS_PAGE_SIZE:
+                api.abort(400, 'offset cant be negative and limit must be between 1 and {}.'.format(MAX_KITS_PAGE_SIZE))
+            kits = self.__kits_service.list_kits_with_products(product_skus, offset, limit, fields)
+
+        return self.__marshal(kits, expansions)
+
+    def __get_many(self, key_field: str, keys: list, fields: list, expansions: set) -> list:
+        if key_field == 'id':
+            kits = self.__kits_service.get_kits(keys, fields)
+        else:
+            kits = self.__kits_service.get_kits_by_skus(keys, fields)
+        found_kits = [kit for kit in kits if kit is not None]
+        hot_keys.record_many(hot_keys.KIT, [kit.id for kit in found_kits])
+        return with_not_found_markers(key_field, keys, kits, self.__marshal(found_kits, expansions))
+
+    def __marshal(self, kits: list, expansions: set) -> list:
+        if 'products' in expansions:
+            return self._marshal(self.__kits_service.expand_products(kits), serialization.expanded_kit_model)
+        return self._marshal(kits, serialization.kit_model)
 
 
 @api.doc()
@@ -103,13 +320,21 @@ class KitResource(ResourceBase):
         super(KitResource, self).__init__(*args, **kwargs)
         self.__kits_service = kwargs['kits_service']
 
-    @api.doc(responses=responses_doc_for(200, 404, 500))
-    @api.marshal_with(serialization.kit_model, code=200)
+    @api.doc(params={'expand': 'products inlines the product of every kit product'})
+    @api.doc(params=FIELDS_DOC)
+    @api.doc(responses=responses_doc_for(400, 404, 500))
+    @api.response(200, RESPONSES_DOC[200], serialization.expanded_kit_model)
     def get(self, kit_id: str):
+        expansions = expansions_from(request.args)
         try:
-            return self.__kits_service.get_kit(kit_id)
+            kit = self.__kits_service.get_kit(kit_id, self._fields(serialization.expanded_kit_model))
         except NotFound:
             api.abort(404, 'Kit Not Found.', kit_id=kit_id)
+        hot_keys.record(hot_keys.KIT, kit_id)
+
+        if 'products' in expansions:
+            return self._marshal(self.__kits_service.expand_products([kit])[0], serialization.expanded_kit_model)
+        return self._marshal(kit, serialization.kit_model)
 
     @api.expect(serialization.kit_update_command_model, validate=True)
     @api.marshal_with(serialization.kit_model, code=200)
@@ -131,24 +356,84 @@ class KitResource(ResourceBase):
             api.abort(404, 'Kit Not Found.', kit_id=kit_id)
 
 
+class KitProductsResource(ResourceBase):
+
+    def __init__(self, *args, **kwargs):
+        super(KitProductsResource, self).__init__(*args, **kwargs)
+        self.__kits_service = kwargs['kits_service']
+
+    @api.expect(serialization.kit_products_patch_command_model, validate=True)
+    @api.marshal_with(serialization.kit_model, code=200)
+    @api.doc(responses=responses_doc_for(200, 400, 404, 409, 500))
+    def patch(self, kit_id: str):
+        '''
+            Adds, changes or removes single kit products, e.g. {"change": [{"productSku": "A", "quantity": 2,
+            "discountPercentage": 5}], "remove": ["B"]}
+        :return:
+        '''
+        kit_products_patch_command = self._serialize_patch_in(serialization.kit_products_patch_command_model)
+        product_skus = [kit_product['product_sku'] for kit_product in kit_products_patch_command.get('add', [])] + \
+            [kit_product['product_sku'] for kit_product in kit_products_patch_command.get('change', [])] + \
+            kit_products_patch_command.get('remove', [])
+        if not product_skus:
+            api.abort(400, 'Nothing to update.', kit_id=kit_id)
+        if len(set(product_skus)) < len(product_skus):
+            api.abort(400, 'A product sku can be in one operation only.', kit_id=kit_id)
+
+        try:
+            return self.__kits_service.patch_kit_products(kit_id, kit_products_patch_command)
+        except NotFound as error:
+            api.abort(404, 'Kit Or Product Not Found.', kit_id=kit_id, reason=str(error))
+        except KitProductExistsError as error:
+            api.abort(400, 'The product is already in the kit.', kit_id=kit_id, reason=str(error))
+        except ConcurrentUpdateError as error:
+            api.abort(409, 'The kit changed while it was patched, try again.', kit_id=kit_id, reason=str(error))
+
+
+@api.doc(params={'maxInventory': 'Kits whose products allow at most this many kits, required'})
+class CalculatedKitsResource(ResourceBase):
+
+    def __init__(self, *args, **kwargs):
+        super(CalculatedKitsResource, self).__init__(*args, **kwargs)
+        self.__kit_availability_service = kwargs['kit_availability_service']
+
+    @api.response(200, RESPONSES_DOC[200], [serialization.kit_availability_model])
+    @api.doc(params=FIELDS_DOC)
+    @api.doc(responses=responses_doc_for(400, 500))
+    def get(self):
+        max_inventory = request.args.get('maxInventory', type=int)
+        if max_inventory is None:
+            api.abort(400, 'maxInventory must be an integer.', maxInventory=request.args.get('maxInventory'))
+        return self._marshal(
+            self.__kit_availability_service.list_low_availability(max_inventory), serialization.kit_availability_model
+        )
+
+
 class CalculatedKitResource(ResourceBase):
 
     def __init__(self, *args, **kwargs):
         super(CalculatedKitResource, self).__init__(*args, **kwargs)
         self.__calculated_kits_service = kwargs['calculated_kits_service']
 
-    @api.doc(responses=responses_doc_for(200, 404, 500))
-    @api.marshal_with(serialization.calculated_kit_model, code=200)
+    @api.doc(params=FIELDS_DOC)
+    @api.doc(responses=responses_doc_for(400, 404, 500))
+    @api.response(200, RESPONSES_DOC[200], serialization.calculated_kit_model)
     def get(self, kit_id: str):
+        fields = self._fields(serialization.calculated_kit_model)
         try:
-            return self.__calculated_kits_service.calculate_kit(kit_id)
+            calculated_kit = self.__calculated_kits_service.calculate_kit(kit_id, fields)
         except NotFound:
             api.abort(404, 'Kit Not Found.', kit_id=kit_id)
+        hot_keys.record(hot_keys.CALCULATED_KIT, kit_id)
+        return self._marshal(calculated_kit, serialization.calculated_kit_model)
 
 
-def register(products_service, kits_service, calculated_kits_service):
+def register(products_service, kits_service, calculated_kits_service, kit_availability_service):
+    api.add_resource(ProductSearchResource, '/api/products/search', resource_class_kwargs={'products_service': products_service})
     api.add_resource(ProductResource, '/api/products/<string:product_id>', resource_class_kwargs={'products_service': products_service})
     api.add_resource(ProductsResource, '/api/products', resource_class_kwargs={'products_service': products_service})
     api.add_resource(KitResource, '/api/kits/<string:kit_id>', resource_class_kwargs={'kits_service': kits_service})
+    api.add_resource(KitProductsResource, '/api/kits/<string:kit_id>/kit-products', resource_class_kwargs={'kits_service': kits_service})
     api.add_resource(KitsResource, '/api/kits', resource_class_kwargs={'kits_service': kits_service})
     api.add_resource(CalculatedKitResource, '/api/calculated-kits/<string:kit_id>', resource_class_kwargs={'calculated_kits_service': calculated_kits_service})
+    api.add_resource(CalculatedKitsResource, '/api/calculated-kits', resource_class_kwargs={'kit_availability_service': kit_availability_service})
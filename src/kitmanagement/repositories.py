@@ -1,30 +1,328 @@
+import heapq
+import re
+import unicodedata
 from abc import ABC
+from bisect import bisect_left, bisect_right
 from copy import deepcopy
-from typing import List
+from typing import Callable, Dict, Iterator, List
 
+import pymongo
 from bson.objectid import ObjectId
+from pymongo.collection import Collection, ReturnDocument
 from pymongo.errors import DuplicateKeyError
 
-from src.exceptions import NotFound, skuExistsError
-from src.kitmanagement.domain import ProductRepository, KitRepository, Kit, Product, KitProduct
+from src.exceptions import NotFound, skuExistsError, KitProductExistsError, ConcurrentUpdateError
+from src.kitmanagement.domain import ProductRepository, KitRepository, Kit, Product, KitProduct, AsyncProductRepository, \
+    AsyncKitRepository, ProductFilter, SortKey, KitAvailability, KitAvailabilityRepository, AsyncKitAvailabilityRepository
+
+SEARCH_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+# INFO: searches rank at most this many matching products, the first ones found through the index
+MAX_SEARCH_CANDIDATES = 1000
+
+
+def normalize_search_text(text: str) -> str:
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode().lower()
+
+
+def search_tokens(text: str) -> List[str]:
+    return SEARCH_TOKEN_PATTERN.findall(normalize_search_text(text))
+
+
+def product_search_tokens(product: Product) -> List[str]:
+    return sorted(set(search_tokens(product.name) + search_tokens(product.sku)))
+
+
+# INFO: search_tokens of the stored sku, as an aggregation expression. Mongo lower cases ASCII only, so it matches
+# search_tokens for ASCII skus
+MONGO_SKU_SEARCH_TOKENS = {'$map': {
+    'input': {'$regexFindAll': {'input': {'$toLower': '$sku'}, 'regex': SEARCH_TOKEN_PATTERN.pattern}},
+    'as': 'token',
+    'in': '$$token.match'
+}}
+
+
+def sku_prefix_variants(query: str) -> List[str]:
+    '''
+        The query as typed, upper and lower case, for the sku prefix lookups: skus are stored as they were sent, and
+        matching them case insensitively in an index takes one case sensitive range per variant
+    :return:
+    '''
+    stripped_query = query.strip()
+    return list({stripped_query: None, stripped_query.upper(): None, stripped_query.lower(): None})
+
+
+def rank_search_results(products: List[Product], query: str, offset: int, limit: int,
+                        tokens_of: Callable = product_search_tokens) -> List[Product]:
+    '''
+        Orders the products matching a search, the exact sku first, then skus starting with the query, then the
+        products matching more query tokens whole instead of by prefix, by name
+    :return: the requested page
+    '''
+    query_tokens = set(search_tokens(query))
+    normalized_query = normalize_search_text(query).strip()
+
+    def rank(product: Product) -> tuple:
+        sku = normalize_search_text(product.sku)
+        return (
+            sku != normalized_query,
+            not sku.startswith(normalized_query),
+            -len(query_tokens.intersection(tokens_of(product))),
+            product.name.lower(),
+            product.id,
+        )
+    return heapq.nsmallest(offset + limit, products, key=rank)[offset:]
+
+# INFO: above every character, so prefix + MAX_CHARACTER bounds the strings starting with prefix
+MAX_CHARACTER = chr(0x10FFFF)
+# INFO: a kit products patch is tried again while its failure was caused by concurrent patches, at most this many times
+PATCH_KIT_PRODUCTS_ATTEMPTS = 3
+MONGO_PRODUCT_FIELDS = {
+    'name': 'name',
+    'sku': 'sku',
+    'cost': 'cost',
+    'price': 'price',
+    'inventory_quantity': 'inventoryQuantity',
+}
+MONGO_KIT_FIELDS = {
+    'name': 'name',
+    'sku': 'sku',
+    'kit_products': 'kitProducts',
+}
+
+
+def sort_products(products: List[Product], sort_keys: List[SortKey]) -> List[Product]:
+    # INFO: sorts are stable, so sorting by the last key first gives the order of all the keys, each in its direction
+    for sort_key in reversed(sort_keys):
+        products = sorted(products, key=lambda product: getattr(product, sort_key.field), reverse=sort_key.descending)
+    return products
+
+
+def create_mongo_filter_from_product_filter(product_filter: ProductFilter) -> dict:
+    mongo_filter = {}
+    for field, low, high in (('price', product_filter.min_price, product_filter.max_price),
+                             ('cost', product_filter.min_cost, product_filter.max_cost),
+                             ('inventoryQuantity', None, product_filter.max_inventory_quantity)):
+        bounds = {}
+        if low is not None:
+            bounds['$gte'] = low
+        if high is not None:
+            bounds['$lte'] = high
+        if bounds:
+            mongo_filter[field] = bounds
+    if product_filter.sku_prefix:
+        # INFO: an anchored, case sensitive regex is a range scan on the sku index
+        mongo_filter['sku'] = {'$regex': '^' + re.escape(product_filter.sku_prefix)}
+    return mongo_filter
+
+
+def create_mongo_projection(fields: List[str], mongo_fields: Dict[str, str]) -> dict:
+    '''
+        Projection reading only the mongo fields of the given attributes and the id, None reads whole documents
+    :return:
+    '''
+    if fields is None:
+        return None
+    projection = {'_id': True}
+    projection.update({mongo_fields[field]: True for field in fields if field in mongo_fields})
+    return projection
+
+
+def to_object_ids(entity_ids: List[str]) -> List[ObjectId]:
+    '''
+        The valid ObjectIds of the ids, the others can't match any document
+    :return:
+    '''
+    return [ObjectId(entity_id) for entity_id in entity_ids if ObjectId.is_valid(entity_id)]
+
+
+def create_kit_availability_from_mongo(mongo_kit_availability: dict) -> KitAvailability:
+    return KitAvailability(
+        kit_id=str(mongo_kit_availability['_id']),
+        kit_sku=mongo_kit_availability['kitSku'],
+        kit_name=mongo_kit_availability['kitName'],
+        inventory_quantity=mongo_kit_availability['inventoryQuantity'],
+        limiting_product_sku=mongo_kit_availability['limitingProductSku']
+    )
+
+
+def create_mongo_kit_availability_from_kit_availability(kit_availability: KitAvailability) -> dict:
+    return {
+        'kitSku': kit_availability.kit_sku,
+        'kitName': kit_availability.kit_name,
+        'inventoryQuantity': kit_availability.inventory_quantity,
+        'limitingProductSku': kit_availability.limiting_product_sku
+    }
+
+
+class SortedIndex(object):
+    '''
+        Ids ordered by a value (e.g. product ids by price), to find the ones in a range by bisection
+    '''
+
+    def __init__(self):
+        self.__values = []
+        self.__ids = []
+        # INFO: the indexed values are kept by id, the stored entity may already carry its new values
+        self.__values_by_id = {}
+
+    def add(self, entity_id: str, value) -> None:
+        position = bisect_right(self.__values, value)
+        self.__values.insert(position, value)
+        self.__ids.insert(position, entity_id)
+        self.__values_by_id[entity_id] = value
+
+    def remove(self, entity_id: str) -> None:
+        value = self.__values_by_id.pop(entity_id)
+        start = bisect_left(self.__values, value)
+        position = self.__ids.index(entity_id, start, bisect_right(self.__values, value))
+        del self.__values[position]
+        del self.__ids[position]
+
+    def between(self, low=None, high=None) -> range:
+        '''
+            Positions of the values from low to high, both inclusive
+        :return:
+        '''
+        start = 0 if low is None else bisect_left(self.__values, low)
+        end = len(self.__values) if high is None else bisect_right(self.__values, high)
+        return range(start, max(start, end))
+
+    def with_prefix(self, prefix: str) -> range:
+        return range(bisect_left(self.__values, prefix), bisect_left(self.__values, prefix + MAX_CHARACTER))
+
+    def ids(self, positions: range) -> List[str]:
+        return self.__ids[positions.start:positions.stop]
+
+
+def create_product_from_mongo(mongo_product: dict) -> Product:
+    return Product(
+        id=str(mongo_product['_id']),
+        name=mongo_product.get('name'),
+        sku=mongo_product.get('sku'),
+        cost=mongo_product.get('cost'),
+        price=mongo_product.get('price'),
+        inventory_quantity=mongo_product.get('inventoryQuantity')
+    )
+
+
+def create_mongo_product_from_product(product: Product) -> dict:
+    return {
+        'name': product.name,
+        'sku': product.sku,
+        'cost': product.cost,
+        'price': product.price,
+        'inventoryQuantity': product.inventory_quantity,
+        'searchTokens': product_search_tokens(product)
+    }
+
+
+def create_kit_from_mongo(kit_mongo: dict) -> Kit:
+    kit_products = [
+        KitProduct(
+            product_sku=kit_product_mongo['productSku'],
+            quantity=kit_product_mongo['quantity'],
+            discount_percentage=kit_product_mongo['discountPercentage']
+        )
+        for kit_product_mongo in kit_mongo.pop('kitProducts', [])
+    ]
+    return Kit(
+        id=str(kit_mongo['_id']),
+        name=kit_mongo.get('name'),
+        sku=kit_mongo.get('sku'),
+        kit_products=kit_products
+    )
+
+
+def create_mongo_kit_product_from_kit_product(kit_product: KitProduct) -> dict:
+    return {
+        'productSku': kit_product.product_sku,
+        'quantity': kit_product.quantity,
+        'discountPercentage': kit_product.discount_percentage
+    }
+
+
+def create_mongo_kit_from_kit(kit: Kit) -> dict:
+    return {
+        'name': kit.name,
+        'sku': kit.sku,
+        'kitProducts': [create_mongo_kit_product_from_kit_product(kit_product) for kit_product in kit.kit_products]
+    }
 
 
 class InMemoryProductRepository(ProductRepository):
 
     def __init__(self):
         self.__products : List[Product] = []
+        # INFO: search index, the products by id for each token plus the sorted tokens to find the ones with a prefix
+        self.__products_by_token: Dict[str, Dict[str, Product]] = {}
+        self.__sorted_tokens: List[str] = []
+        self.__tokens_by_id: Dict[str, List[str]] = {}
+        # INFO: list_filtered indexes, the bounded filter matching the fewest products picks the candidates
+        self.__products_by_id: Dict[str, Product] = {}
+        self.__products_by_sku: Dict[str, Product] = {}
+        self.__price_index = SortedIndex()
+        self.__cost_index = SortedIndex()
+        self.__inventory_quantity_index = SortedIndex()
+        self.__sku_index = SortedIndex()
 
     def add(self, product: Product) -> str:
         product = deepcopy(product)
         product.define_id(self.__next_id())
         self.__raise_if_sku_already_exists(product.sku)
         self.__products.append(product)
+        self.__index(product)
         return product.id
 
-    def list(self, for_read=True) -> List[Product]:
+    def list(self, for_read=True, fields: List[str] = None) -> List[Product]:
         return self.__products
 
-    def get_by_id(self, product_id: str) -> Product:
+    def list_filtered(self, product_filter: ProductFilter, sort_keys: List[SortKey], fields: List[str] = None) -> List[Product]:
+        ranges = []
+        if product_filter.min_price is not None or product_filter.max_price is not None:
+            ranges.append((self.__price_index, self.__price_index.between(product_filter.min_price, product_filter.max_price)))
+        if product_filter.min_cost is not None or product_filter.max_cost is not None:
+            ranges.append((self.__cost_index, self.__cost_index.between(product_filter.min_cost, product_filter.max_cost)))
+        if product_filter.max_inventory_quantity is not None:
+            ranges.append((
+                self.__inventory_quantity_index,
+                self.__inventory_quantity_index.between(high=product_filter.max_inventory_quantity)
+            ))
+        if product_filter.sku_prefix:
+            ranges.append((self.__sku_index, self.__sku_index.with_prefix(product_filter.sku_prefix)))
+
+        if ranges:
+            index, positions = min(ranges, key=lambda index_range: len(index_range[1]))
+            candidates = [self.__products_by_id[product_id] for product_id in index.ids(positions)]
+        else:
+            candidates = self.__products
+        return sort_products([product for product in candidates if product_filter.matches(product)], sort_keys)
+
+    def search(self, query: str, offset: int, limit: int, fields: List[str] = None) -> List[Product]:
+        tokens = set(search_tokens(query))
+        if not tokens:
+            return []
+        # INFO: walks the products of the most selective token, in token order like the Mongo index, so the exact
+        # token matches come first, and checks the other tokens on each product
+        selective_token = min(tokens, key=self.__count_with_token_prefix)
+        other_tokens = tokens - {selective_token}
+        candidates = {}
+        # INFO: the skus starting with the query rank first, so they are candidates whatever the cut-off below
+        for product in self.__products_with_sku_prefix(query):
+            if self.__has_token_prefixes(product, tokens):
+                candidates[product.id] = product
+        token_candidates = 0
+        for product in self.__products_with_token_prefix(selective_token):
+            if product.id in candidates or not self.__has_token_prefixes(product, other_tokens):
+                continue
+            candidates[product.id] = product
+            token_candidates += 1
+            if token_candidates == MAX_SEARCH_CANDIDATES:
+                break
+        return rank_search_results(
+            list(candidates.values()), query, offset, limit, tokens_of=lambda product: self.__tokens_by_id[product.id]
+        )
+
+    def get_by_id(self, product_id: str, fields: List[str] = None) -> Product:
         for product in self.__products:
             if product.id == product_id:
                 return product
@@ -36,6 +334,12 @@ class InMemoryProductRepository(ProductRepository):
                 return product
         raise NotFound(f'product sku: {sku} not found')
 
+    def get_many_by_ids(self, product_ids: List[str], fields: List[str] = None) -> List[Product]:
+        return [self.__products_by_id.get(product_id) for product_id in product_ids]
+
+    def get_many_by_skus(self, skus: List[str], fields: List[str] = None) -> List[Product]:
+        return [self.__products_by_sku.get(sku) for sku in skus]
+
     def remove(self, product_id: str) -> None:
         index_to_remove = None
 
@@ -48,6 +352,7 @@ class InMemoryProductRepository(ProductRepository):
             raise NotFound(f'product id: {product_id} not found')
 
         self.__products.pop(index_to_remove)
+        self.__unindex(product_id)
 
     def update(self, product_to_update: Product) -> None:
         index_to_update = None
@@ -61,6 +366,18 @@ class InMemoryProductRepository(ProductRepository):
             raise NotFound(f'product id: {product_to_update.id} not found')
 
         self.__products[index_to_update] = product_to_update
+        self.__unindex(product_to_update.id)
+        self.__index(product_to_update)
+
+    def patch(self, product_id: str, changes: dict) -> Product:
+        product = self.__products_by_id.get(product_id)
+        if product is None:
+            raise NotFound(f'product id: {product_id} not found')
+
+        self.__unindex(product_id)
+        product.patch_infos(**changes)
+        self.__index(product)
+        return product
 
     def list_with_skus(self, skus: List[str]) -> List[Product]:
         return[product for product in self.__products if product.sku in skus]
@@ -77,20 +394,79 @@ class InMemoryProductRepository(ProductRepository):
                 raise skuExistsError('you must provide an unique sku')
         return None
 
+    def __index(self, product: Product) -> None:
+        self.__products_by_id[product.id] = product
+        self.__products_by_sku[product.sku] = product
+        for attribute, index in self.__sorted_indexes():
+            index.add(product.id, getattr(product, attribute))
+        tokens = product_search_tokens(product)
+        self.__tokens_by_id[product.id] = tokens
+        for token in tokens:
+            if token not in self.__products_by_token:
+                self.__products_by_token[token] = {}
+                self.__sorted_tokens.insert(bisect_left(self.__sorted_tokens, token), token)
+            self.__products_by_token[token][product.id] = product
+
+    def __unindex(self, product_id: str) -> None:
+        del self.__products_by_sku[self.__products_by_id.pop(product_id).sku]
+        for _, index in self.__sorted_indexes():
+            index.remove(product_id)
+        # INFO: the indexed tokens are kept by id, the stored product may already carry its new name
+        for token in self.__tokens_by_id.pop(product_id, []):
+            token_products = self.__products_by_token[token]
+            del token_products[product_id]
+            if not token_products:
+                del self.__products_by_token[token]
+                self.__sorted_tokens.pop(bisect_left(self.__sorted_tokens, token))
+
+    def __sorted_indexes(self) -> List[tuple]:
+        return [
+            ('price', self.__price_index),
+            ('cost', self.__cost_index),
+            ('inventory_quantity', self.__inventory_quantity_index),
+            ('sku', self.__sku_index),
+        ]
+
+    def __token_range(self, prefix: str) -> range:
+        # INFO: tokens only have [a-z0-9], so every token starting with the prefix sorts before prefix + '{'
+        return range(bisect_left(self.__sorted_tokens, prefix), bisect_left(self.__sorted_tokens, prefix + '{'))
+
+    def __count_with_token_prefix(self, prefix: str) -> int:
+        return sum(len(self.__products_by_token[self.__sorted_tokens[position]]) for position in self.__token_range(prefix))
+
+    def __products_with_token_prefix(self, prefix: str) -> Iterator[Product]:
+        for position in self.__token_range(prefix):
+            yield from self.__products_by_token[self.__sorted_tokens[position]].values()
+
+    def __products_with_sku_prefix(self, query: str) -> Iterator[Product]:
+        for prefix in sku_prefix_variants(query):
+            for product_id in self.__sku_index.ids(self.__sku_index.with_prefix(prefix))[:MAX_SEARCH_CANDIDATES]:
+                yield self.__products_by_id[product_id]
+
+    def __has_token_prefixes(self, product: Product, tokens: set) -> bool:
+        product_tokens = self.__tokens_by_id[product.id]
+        return all(any(product_token.startswith(token) for product_token in product_tokens) for token in tokens)
+
 
 class InMemoryKitRepository(KitRepository, ABC):
 
     def __init__(self):
         self.__kits : List[Kit] = []
+        # INFO: reverse index of the kits using each product, kept up to date by add, update and remove
+        self.__kits_by_product_sku: Dict[str, Dict[str, Kit]] = {}
+        self.__product_skus_by_kit_id: Dict[str, List[str]] = {}
+        self.__kits_by_id: Dict[str, Kit] = {}
+        self.__kits_by_sku: Dict[str, Kit] = {}
 
     def add(self, kit: Kit) -> str:
         kit = deepcopy(kit)
         kit.define_id(self.__next_id())
         self.__raise_if_sku_already_exists(kit.sku)
         self.__kits.append(kit)
+        self.__index(kit)
         return kit.id
 
-    def list(self, for_read=True) -> List[Kit]:
+    def list(self, for_read=True, fields: List[str] = None) -> List[Kit]:
         return self.__kits
 
     def list_with_product(self, product_sku: str) -> List[Kit]:
@@ -101,12 +477,26 @@ class InMemoryKitRepository(KitRepository, ABC):
                     kits.append(kit)
         return kits
 
-    def get_by_id(self, kit_id) -> Kit:
+    def list_with_products(self, product_skus: List[str], offset: int, limit: int,
+                           fields: List[str] = None) -> List[Kit]:
+        kits = {}
+        for product_sku in product_skus:
+            kits.update(self.__kits_by_product_sku.get(product_sku, {}))
+        kit_ids = heapq.nsmallest(offset + limit, kits, key=int)[offset:]
+        return [kits[kit_id] for kit_id in kit_ids]
+
+    def get_by_id(self, kit_id, fields: List[str] = None) -> Kit:
         for kit in self.__kits:
             if kit.id == kit_id:
                 return kit
         raise NotFound(f'kit id: {kit_id} not found')
 
+    def get_many_by_ids(self, kit_ids: List[str], fields: List[str] = None) -> List[Kit]:
+        return [self.__kits_by_id.get(kit_id) for kit_id in kit_ids]
+
+    def get_many_by_skus(self, skus: List[str], fields: List[str] = None) -> List[Kit]:
+        return [self.__kits_by_sku.get(sku) for sku in skus]
+
     def remove(self, kit_id) -> None:
         index_to_remove = None
 
@@ -119,6 +509,7 @@ class InMemoryKitRepository(KitRepository, ABC):
             raise NotFound(f'kit id: {kit_id} not found')
 
         self.__kits.pop(index_to_remove)
+        self.__unindex(kit_id)
 
     def update(self, kit_to_update: Kit) -> None:
         index_to_update = None
@@ -132,6 +523,31 @@ class InMemoryKitRepository(KitRepository, ABC):
             raise NotFound(f'kit id: {kit_to_update.id} not found')
 
         self.__kits[index_to_update] = kit_to_update
+        self.__unindex(kit_to_update.id)
+        self.__index(kit_to_update)
+
+    def patch_kit_products(self, kit_id: str, added: List[KitProduct], changed: List[KitProduct],
+                           removed_skus: List[str]) -> Kit:
+        kit = self.__kits_by_id.get(kit_id)
+        if kit is None:
+            raise NotFound(f'kit id: {kit_id} not found')
+
+        kit_products = {kit_product.product_sku: kit_product for kit_product in kit.kit_products}
+        for product_sku in removed_skus + [kit_product.product_sku for kit_product in changed]:
+            if product_sku not in kit_products:
+                raise NotFound(f'kit product sku: {product_sku} not found')
+        for kit_product in added:
+            if kit_product.product_sku in kit_products:
+                raise KitProductExistsError(f'kit product sku: {kit_product.product_sku} already in the kit')
+
+        for product_sku in removed_skus:
+            del kit_products[product_sku]
+        # INFO: a changed kit product keeps its position, like the Mongo positional update
+        kit_products.update((kit_product.product_sku, kit_product) for kit_product in changed + added)
+        self.__unindex(kit_id)
+        kit.update_infos(kit.name, list(kit_products.values()))
+        self.__index(kit)
+        return kit
 
     def __next_id(self) -> str:
         try:
@@ -145,41 +561,149 @@ class InMemoryKitRepository(KitRepository, ABC):
                 raise skuExistsError('you must provide an unique sku')
         return None
 
+    def __index(self, kit: Kit) -> None:
+        self.__kits_by_id[kit.id] = kit
+        self.__kits_by_sku[kit.sku] = kit
+        product_skus = [kit_product.product_sku for kit_product in kit.kit_products]
+        self.__product_skus_by_kit_id[kit.id] = product_skus
+        for product_sku in product_skus:
+            self.__kits_by_product_sku.setdefault(product_sku, {})[kit.id] = kit
+
+    def __unindex(self, kit_id: str) -> None:
+        kit = self.__kits_by_id.pop(kit_id, None)
+        if kit is not None:
+            del self.__kits_by_sku[kit.sku]
+        # INFO: the kit may have been changed in place since it was indexed, so its skus come from the index
+        for product_sku in self.__product_skus_by_kit_id.pop(kit_id, []):
+            kits = self.__kits_by_product_sku[product_sku]
+            kits.pop(kit_id, None)
+            if not kits:
+                del self.__kits_by_product_sku[product_sku]
+
+
+class InMemoryKitAvailabilityRepository(KitAvailabilityRepository):
+
+    def __init__(self):
+        self.__kit_availabilities: Dict[str, KitAvailability] = {}
+        self.__inventory_quantity_index = SortedIndex()
+
+    def save(self, kit_availability: KitAvailability) -> None:
+        self.remove(kit_availability.kit_id)
+        self.__kit_availabilities[kit_availability.kit_id] = kit_availability
+        self.__inventory_quantity_index.add(kit_availability.kit_id, kit_availability.inventory_quantity)
+
+    def save_all(self, kit_availabilities: List[KitAvailability]) -> None:
+        for kit_availability in kit_availabilities:
+            self.save(kit_availability)
+
+    def remove(self, kit_id: str) -> None:
+        if self.__kit_availabilities.pop(kit_id, None):
+            self.__inventory_quantity_index.remove(kit_id)
+
+    def remove_many(self, kit_ids: List[str]) -> None:
+        for kit_id in kit_ids:
+            self.remove(kit_id)
+
+    def list_at_most(self, max_inventory_quantity: int) -> List[KitAvailability]:
+        positions = self.__inventory_quantity_index.between(high=max_inventory_quantity)
+        return [self.__kit_availabilities[kit_id] for kit_id in self.__inventory_quantity_index.ids(positions)]
+
 
 class MongoProductRepository(ProductRepository):
 
-    def __init__(self, mongo_db):
+    def __init__(self, mongo_db, read_mongo_db=None):
         self.__mongo_db = mongo_db
-        self.__collection = self.__mongo_db['products']
+        self.__read_mongo_db = read_mongo_db if read_mongo_db is not None else mongo_db
+
+    @property
+    def __collection(self) -> Collection:
+        return self.__mongo_db['products']
+
+    @property
+    def __read_collection(self) -> Collection:
+        return self.__read_mongo_db['products']
 
-    def list(self) -> List[Product]:
-        return [self.__create_product_from_mongo(mongo_product) for mongo_product in self.__collection.find()]
+    def list(self, fields: List[str] = None) -> List[Product]:
+        return [
+            create_product_from_mongo(mongo_product)
+            for mongo_product in self.__read_collection.find({}, create_mongo_projection(fields, MONGO_PRODUCT_FIELDS))
+        ]
 
     def list_with_skus(self, skus: List[str]) -> List[Product]:
         return [
-            self.__create_product_from_mongo(mongo_product)
-            for mongo_product in self.__collection.find({'sku': {'$in': skus}}).sort('_id')
+            create_product_from_mongo(mongo_product)
+            for mongo_product in self.__read_collection.find({'sku': {'$in': skus}}).sort('_id')
         ]
 
+    def list_filtered(self, product_filter: ProductFilter, sort_keys: List[SortKey], fields: List[str] = None) -> List[Product]:
+        mongo_products = self.__read_collection.find(
+            create_mongo_filter_from_product_filter(product_filter), create_mongo_projection(fields, MONGO_PRODUCT_FIELDS)
+        )
+        if sort_keys:
+            mongo_products = mongo_products.sort([
+                (MONGO_PRODUCT_FIELDS[sort_key.field], pymongo.DESCENDING if sort_key.descending else pymongo.ASCENDING)
+                for sort_key in sort_keys
+            ] + [('_id', pymongo.ASCENDING)])
+        return [create_product_from_mongo(mongo_product) for mongo_product in mongo_products]
+
+    def search(self, query: str, offset: int, limit: int, fields: List[str] = None) -> List[Product]:
+        tokens = set(search_tokens(query))
+        if not tokens:
+            return []
+        # INFO: the ranking needs the name and sku, whatever the fields
+        projection = create_mongo_projection(fields + ['name', 'sku'], MONGO_PRODUCT_FIELDS) if fields is not None \
+            else {'searchTokens': False}
+        # INFO: anchored prefix regexes are range scans on the searchTokens multikey index
+        tokens_filter = [{'searchTokens': {'$regex': '^' + re.escape(token)}} for token in tokens]
+        # INFO: the exact sku and the skus starting with the query rank first, so they are read on their own, through
+        # the sku index, instead of depending on where they fall among the first token matches
+        sku_filter = {'sku': {'$in': [re.compile('^' + re.escape(prefix)) for prefix in sku_prefix_variants(query)]}}
+        mongo_products = list(self.__read_collection.find(
+            {'$and': tokens_filter + [sku_filter]}, projection
+        ).sort('sku').limit(MAX_SEARCH_CANDIDATES))
+        mongo_products.extend(self.__read_collection.find(
+            {'$and': tokens_filter + [{'_id': {'$nin': [mongo_product['_id'] for mongo_product in mongo_products]}}]},
+            projection
+        ).limit(MAX_SEARCH_CANDIDATES))
+        return rank_search_results(
+            [create_product_from_mongo(mongo_product) for mongo_product in mongo_products], query, offset, limit
+        )
+
     def add(self, product: Product) -> str:
         try:
-            added_product = self.__collection.insert_one(self.__create_mongo_product_from_product(product))
+            added_product = self.__collection.insert_one(create_mongo_product_from_product(product))
         except DuplicateKeyError:
             raise skuExistsError('you must provide an unique sku')
 
         return str(added_product.inserted_id)
 
-    def get_by_id(self, product_id: str) -> Product:
-        mongo_product = self.__collection.find_one({'_id': ObjectId(product_id)})
+    def get_by_id(self, product_id: str, fields: List[str] = None) -> Product:
+        mongo_product = self.__collection.find_one(
+            {'_id': ObjectId(product_id)}, create_mongo_projection(fields, MONGO_PRODUCT_FIELDS)
+        )
         if not mongo_product:
             raise NotFound(f'product id: {product_id} not found')
-        return self.__create_product_from_mongo(mongo_product)
+        return create_product_from_mongo(mongo_product)
 
     def get_by_sku(self, sku: str) -> Product:
         mongo_product = self.__collection.find_one({'sku': sku})
         if not mongo_product:
             raise NotFound(f'product sku: {sku} not found')
-        return self.__create_product_from_mongo(mongo_product)
+        return create_product_from_mongo(mongo_product)
+
+    def get_many_by_ids(self, product_ids: List[str], fields: List[str] = None) -> List[Product]:
+        mongo_products = self.__collection.find(
+            {'_id': {'$in': to_object_ids(product_ids)}}, create_mongo_projection(fields, MONGO_PRODUCT_FIELDS)
+        )
+        products_by_id = {product.id: product for product in map(create_product_from_mongo, mongo_products)}
+        return [products_by_id.get(product_id) for product_id in product_ids]
+
+    def get_many_by_skus(self, skus: List[str], fields: List[str] = None) -> List[Product]:
+        # INFO: the results are matched to the skus, so the sku is read whatever the fields
+        projection = create_mongo_projection(fields + ['sku'] if fields is not None else None, MONGO_PRODUCT_FIELDS)
+        mongo_products = self.__collection.find({'sku': {'$in': skus}}, projection)
+        products_by_sku = {product.sku: product for product in map(create_product_from_mongo, mongo_products)}
+        return [products_by_sku.get(sku) for sku in skus]
 
     def remove(self, product_id: str) -> None:
         result = self.__collection.delete_one({'_id': ObjectId(product_id)})
@@ -187,7 +711,7 @@ class MongoProductRepository(ProductRepository):
             raise NotFound(f'product id: {product_id} not found')
 
     def update(self, product: Product) -> None:
-        mongo_product = self.__create_mongo_product_from_product(product)
+        mongo_product = create_mongo_product_from_product(product)
         result = self.__collection.update_one(
             {'_id': ObjectId(product.id)},
             {'$set': mongo_product}
@@ -195,51 +719,80 @@ class MongoProductRepository(ProductRepository):
         if result.matched_count < 1:
             raise NotFound(f'product id: {product.id} not found')
 
-    def __create_product_from_mongo(self, mongo_product: dict) -> Product:
-        return Product(
-            id=str(mongo_product['_id']),
-            name=mongo_product['name'],
-            sku=mongo_product['sku'],
-            cost=mongo_product['cost'],
-            price=mongo_product['price'],
-            inventory_quantity=mongo_product['inventoryQuantity']
+    def patch(self, product_id: str, changes: dict) -> Product:
+        # INFO: a pipeline update, values are $literal so a string starting with $ isn't read as a field path
+        update = {MONGO_PRODUCT_FIELDS[attribute]: {'$literal': value} for attribute, value in changes.items()}
+        if 'name' in changes:
+            # INFO: the sku can't be patched, so the tokens are the new name's and the stored sku's, in the same write
+            update['searchTokens'] = {'$setUnion': [search_tokens(changes['name']), MONGO_SKU_SEARCH_TOKENS]}
+        mongo_product = self.__collection.find_one_and_update(
+            {'_id': ObjectId(product_id)},
+            [{'$set': update}],
+            projection={'searchTokens': False},
+            return_document=ReturnDocument.AFTER
         )
-
-    def __create_mongo_product_from_product(self, product: Product) -> dict:
-        return {
-            'name': product.name,
-            'sku': product.sku,
-            'cost': product.cost,
-            'price': product.price,
-            'inventoryQuantity': product.inventory_quantity
-        }
+        if not mongo_product:
+            raise NotFound(f'product id: {product_id} not found')
+        return create_product_from_mongo(mongo_product)
 
 
 class MongoKitRepository(KitRepository):
 
-    def __init__(self, mongo_db):
+    def __init__(self, mongo_db, read_mongo_db=None):
         self.__mongo_db = mongo_db
-        self.__collection = self.__mongo_db['kits']
+        self.__read_mongo_db = read_mongo_db if read_mongo_db is not None else mongo_db
+
+    @property
+    def __collection(self) -> Collection:
+        return self.__mongo_db['kits']
+
+    @property
+    def __read_collection(self) -> Collection:
+        return self.__read_mongo_db['kits']
 
-    def list(self) -> List[Kit]:
-        return [self.__create_kit_from_mongo(mongo_kit) for mongo_kit in self.__collection.find()]
+    def list(self, fields: List[str] = None) -> List[Kit]:
+        return [
+            create_kit_from_mongo(mongo_kit)
+            for mongo_kit in self.__read_collection.find({}, create_mongo_projection(fields, MONGO_KIT_FIELDS))
+        ]
 
     def list_with_product(self, product_sku: str) -> List[Kit]:
-        return [self.__create_kit_from_mongo(mongo_kit) for mongo_kit in self.__collection.find({"kitProducts.productSku": product_sku})]
+        return [create_kit_from_mongo(mongo_kit) for mongo_kit in self.__collection.find({"kitProducts.productSku": product_sku})]
+
+    def list_with_products(self, product_skus: List[str], offset: int, limit: int,
+                           fields: List[str] = None) -> List[Kit]:
+        mongo_kits = self.__read_collection.find(
+            {'kitProducts.productSku': {'$in': product_skus}}, create_mongo_projection(fields, MONGO_KIT_FIELDS)
+        ).sort('_id', pymongo.ASCENDING).skip(offset).limit(limit)
+        return [create_kit_from_mongo(mongo_kit) for mongo_kit in mongo_kits]
 
     def add(self, kit: Kit) -> str:
         try:
-            added_kit = self.__collection.insert_one(self.__create_mongo_kit_from_kit(kit))
+            added_kit = self.__collection.insert_one(create_mongo_kit_from_kit(kit))
         except DuplicateKeyError:
             raise skuExistsError('you must provide an unique sku')
 
         return str(added_kit.inserted_id)
 
-    def get_by_id(self, kit_id: str) -> Kit:
-        mongo_product = self.__collection.find_one({'_id': ObjectId(kit_id)})
+    def get_by_id(self, kit_id: str, fields: List[str] = None) -> Kit:
+        mongo_product = self.__collection.find_one({'_id': ObjectId(kit_id)}, create_mongo_projection(fields, MONGO_KIT_FIELDS))
         if not mongo_product:
             raise NotFound(f'kit id: {kit_id} not found')
-        return self.__create_kit_from_mongo(mongo_product)
+        return create_kit_from_mongo(mongo_product)
+
+    def get_many_by_ids(self, kit_ids: List[str], fields: List[str] = None) -> List[Kit]:
+        mongo_kits = self.__collection.find(
+            {'_id': {'$in': to_object_ids(kit_ids)}}, create_mongo_projection(fields, MONGO_KIT_FIELDS)
+        )
+        kits_by_id = {kit.id: kit for kit in map(create_kit_from_mongo, mongo_kits)}
+        return [kits_by_id.get(kit_id) for kit_id in kit_ids]
+
+    def get_many_by_skus(self, skus: List[str], fields: List[str] = None) -> List[Kit]:
+        # INFO: the results are matched to the skus, so the sku is read whatever the fields
+        projection = create_mongo_projection(fields + ['sku'] if fields is not None else None, MONGO_KIT_FIELDS)
+        mongo_kits = self.__collection.find({'sku': {'$in': skus}}, projection)
+        kits_by_sku = {kit.sku: kit for kit in map(create_kit_from_mongo, mongo_kits)}
+        return [kits_by_sku.get(sku) for sku in skus]
 
     def remove(self, kit_id: str) -> None:
         result = self.__collection.delete_one({'_id': ObjectId(kit_id)})
@@ -247,7 +800,7 @@ class MongoKitRepository(KitRepository):
             raise NotFound(f'kit id: {kit_id} not found')
 
     def update(self, kit: Kit) -> None:
-        kit_mongo = self.__create_mongo_kit_from_kit(kit)
+        kit_mongo = create_mongo_kit_from_kit(kit)
         result = self.__collection.update_one(
             {'_id': ObjectId(kit.id)},
             {'$set': kit_mongo}
@@ -255,34 +808,232 @@ class MongoKitRepository(KitRepository):
         if result.matched_count < 1:
             raise NotFound(f'product id: {kit.id} not found')
 
-    @staticmethod
-    def __create_kit_from_mongo(kit_mongo: dict) -> Kit:
-        kit_products = [
-            KitProduct(
-                product_sku=kit_product_mongo['productSku'],
-                quantity=kit_product_mongo['quantity'],
-                discount_percentage=kit_product_mongo['discountPercentage']
+    def patch_kit_products(self, kit_id: str, added: List[KitProduct], changed: List[KitProduct],
+                           removed_skus: List[str]) -> Kit:
+        '''
+            A single pipeline update, all or nothing: the filter requires the removed and changed skus to be in the
+            kit and the added ones not to be, and the kit products are rebuilt from the stored ones in the same write
+        :return:
+        '''
+        if not (added or changed or removed_skus):
+            return self.get_by_id(kit_id)
+        required_skus = removed_skus + [kit_product.product_sku for kit_product in changed]
+        added_skus = [kit_product.product_sku for kit_product in added]
+        kit_filter = {'_id': ObjectId(kit_id)}
+        conditions = []
+        if required_skus:
+            conditions.append({'kitProducts.productSku': {'$all': required_skus}})
+        if added_skus:
+            conditions.append({'kitProducts.productSku': {'$nin': added_skus}})
+        kit_filter['$and'] = conditions
+
+        # INFO: values are $literal, so a sku starting with $ isn't read as a field path
+        kit_products = {'$filter': {
+            'input': '$kitProducts',
+            'as': 'kitProduct',
+            'cond': {'$not': [{'$in': ['$$kitProduct.productSku', {'$literal': removed_skus}]}]}
+        }}
+        if changed:
+            # INFO: a changed kit product keeps its position, like in the in memory repository
+            kit_products = {'$map': {'input': kit_products, 'as': 'kitProduct', 'in': {'$switch': {
+                'branches': [
+                    {
+                        'case': {'$eq': ['$$kitProduct.productSku', {'$literal': kit_product.product_sku}]},
+                        'then': {'$literal': create_mongo_kit_product_from_kit_product(kit_product)}
+                    }
+                    for kit_product in changed
+                ],
+                'default': '$$kitProduct'
+            }}}}
+        update = [{'$set': {'kitProducts': {'$concatArrays': [kit_products, {'$literal': [
+            create_mongo_kit_product_from_kit_product(kit_product) for kit_product in added
+        ]}]}}}]
+        for _ in range(PATCH_KIT_PRODUCTS_ATTEMPTS):
+            kit_mongo = self.__collection.find_one_and_update(kit_filter, update, return_document=ReturnDocument.AFTER)
+            if kit_mongo:
+                return create_kit_from_mongo(kit_mongo)
+            self.__raise_patch_kit_products_error(kit_id, required_skus, added_skus)
+        raise ConcurrentUpdateError(f'kit id: {kit_id} kept changing while patching its kit products')
+
+    def __raise_patch_kit_products_error(self, kit_id: str, required_skus: List[str], added_skus: List[str]) -> None:
+        '''
+            Only on failures, to tell a missing kit from kit products that are missing or already there. Returns when
+            the kit meets the preconditions again, as a concurrent patch changed it between the update and this read
+        :return:
+        '''
+        kit_mongo = self.__collection.find_one({'_id': ObjectId(kit_id)}, {'kitProducts.productSku': True})
+        if not kit_mongo:
+            raise NotFound(f'kit id: {kit_id} not found')
+        product_skus = {kit_product_mongo['productSku'] for kit_product_mongo in kit_mongo.get('kitProducts', [])}
+        product_sku = next((sku for sku in required_skus if sku not in product_skus), None)
+        if product_sku is not None:
+            raise NotFound(f'kit product sku: {product_sku} not found')
+        product_sku = next((sku for sku in added_skus if sku in product_skus), None)
+        if product_sku is not None:
+            raise KitProductExistsError(f'kit product sku: {product_sku} already in the kit')
+
+
+class MongoKitAvailabilityRepository(KitAvailabilityRepository):
+
+    def __init__(self, mongo_db, read_mongo_db=None):
+        self.__mongo_db = mongo_db
+        self.__read_mongo_db = read_mongo_db if read_mongo_db is not None else mongo_db
+
+    @property
+    def __collection(self) -> Collection:
+        return self.__mongo_db['kitAvailability']
+
+    @property
+    def __read_collection(self) -> Collection:
+        return self.__read_mongo_db['kitAvailability']
+
+    def save(self, kit_availability: KitAvailability) -> None:
+        self.__collection.replace_one(
+            {'_id': ObjectId(kit_availability.kit_id)},
+            create_mongo_kit_availability_from_kit_availability(kit_availability),
+            upsert=True
+        )
+
+    def save_all(self, kit_availabilities: List[KitAvailability]) -> None:
+        if not kit_availabilities:
+            return
+        self.__collection.bulk_write([
+            pymongo.ReplaceOne(
+                {'_id': ObjectId(kit_availability.kit_id)},
+                create_mongo_kit_availability_from_kit_availability(kit_availability),
+                upsert=True
             )
-            for kit_product_mongo in kit_mongo.pop('kitProducts')
+            for kit_availability in kit_availabilities
+        ], ordered=False)
+
+    def remove(self, kit_id: str) -> None:
+        self.__collection.delete_one({'_id': ObjectId(kit_id)})
+
+    def remove_many(self, kit_ids: List[str]) -> None:
+        if kit_ids:
+            self.__collection.delete_many({'_id': {'$in': to_object_ids(kit_ids)}})
+
+    def list_at_most(self, max_inventory_quantity: int) -> List[KitAvailability]:
+        mongo_kit_availabilities = self.__read_collection.find(
+            {'inventoryQuantity': {'$lte': max_inventory_quantity}}
+        ).sort([('inventoryQuantity', pymongo.ASCENDING), ('_id', pymongo.ASCENDING)])
+        return [
+            create_kit_availability_from_mongo(mongo_kit_availability)
+            for mongo_kit_availability in mongo_kit_availabilities
+        ]
+
+
+class AsyncMongoProductRepository(AsyncProductRepository):
+
+    def __init__(self, motor_db, read_motor_db=None):
+        self.__motor_db = motor_db
+        self.__collection = self.__motor_db['products']
+        self.__read_collection = (read_motor_db if read_motor_db is not None else motor_db)['products']
+
+    async def list(self) -> List[Product]:
+        return [create_product_from_mongo(mongo_product) async for mongo_product in self.__read_collection.find()]
+
+    async def list_with_skus(self, skus: List[str]) -> List[Product]:
+        return [
+            create_product_from_mongo(mongo_product)
+            async for mongo_product in self.__read_collection.find({'sku': {'$in': skus}}).sort('_id')
         ]
-        return Kit(
-            id=str(kit_mongo['_id']),
-            name=kit_mongo['name'],
-            sku=kit_mongo['sku'],
-            kit_products=kit_products
+
+    async def add(self, product: Product) -> str:
+        try:
+            added_product = await self.__collection.insert_one(create_mongo_product_from_product(product))
+        except DuplicateKeyError:
+            raise skuExistsError('you must provide an unique sku')
+
+        return str(added_product.inserted_id)
+
+    async def get_by_id(self, product_id: str) -> Product:
+        mongo_product = await self.__collection.find_one({'_id': ObjectId(product_id)})
+        if not mongo_product:
+            raise NotFound(f'product id: {product_id} not found')
+        return create_product_from_mongo(mongo_product)
+
+    async def get_by_sku(self, sku: str) -> Product:
+        mongo_product = await self.__collection.find_one({'sku': sku})
+        if not mongo_product:
+            raise NotFound(f'product sku: {sku} not found')
+        return create_product_from_mongo(mongo_product)
+
+    async def remove(self, product_id: str) -> None:
+        result = await self.__collection.delete_one({'_id': ObjectId(product_id)})
+        if result.deleted_count < 1:
+            raise NotFound(f'product id: {product_id} not found')
+
+    async def update(self, product: Product) -> None:
+        result = await self.__collection.update_one(
+            {'_id': ObjectId(product.id)},
+            {'$set': create_mongo_product_from_product(product)}
         )
+        if result.matched_count < 1:
+            raise NotFound(f'product id: {product.id} not found')
+
+
+class AsyncMongoKitRepository(AsyncKitRepository):
+
+    def __init__(self, motor_db, read_motor_db=None):
+        self.__motor_db = motor_db
+        self.__collection = self.__motor_db['kits']
+        self.__read_collection = (read_motor_db if read_motor_db is not None else motor_db)['kits']
+
+    async def list(self) -> List[Kit]:
+        return [create_kit_from_mongo(mongo_kit) async for mongo_kit in self.__read_collection.find()]
 
-    def __create_mongo_kit_from_kit(self, kit: Kit) -> dict:
-        kit_products_mongo = [
-            {
-                'productSku': kit_product.product_sku,
-                'quantity': kit_product.quantity,
-                'discountPercentage': kit_product.discount_percentage
-            }
-            for kit_product in kit.kit_products
+    async def list_with_product(self, product_sku: str) -> List[Kit]:
+        return [
+            create_kit_from_mongo(mongo_kit)
+            async for mongo_kit in self.__collection.find({"kitProducts.productSku": product_sku})
         ]
-        return {
-            'name': kit.name,
-            'sku': kit.sku,
-            'kitProducts': kit_products_mongo
-        }
+
+    async def add(self, kit: Kit) -> str:
+        try:
+            added_kit = await self.__collection.insert_one(create_mongo_kit_from_kit(kit))
+        except DuplicateKeyError:
+            raise skuExistsError('you must provide an unique sku')
+
+        return str(added_kit.inserted_id)
+
+    async def get_by_id(self, kit_id: str) -> Kit:
+        mongo_kit = await self.__collection.find_one({'_id': ObjectId(kit_id)})
+        if not mongo_kit:
+            raise NotFound(f'kit id: {kit_id} not found')
+        return create_kit_from_mongo(mongo_kit)
+
+    async def remove(self, kit_id: str) -> None:
+        result = await self.__collection.delete_one({'_id': ObjectId(kit_id)})
+        if result.deleted_count < 1:
+            raise NotFound(f'kit id: {kit_id} not found')
+
+    async def update(self, kit: Kit) -> None:
+        result = await self.__collection.update_one(
+            {'_id': ObjectId(kit.id)},
+            {'$set': create_mongo_kit_from_kit(kit)}
+        )
+        if result.matched_count < 1:
+            raise NotFound(f'kit id: {kit.id} not found')
+
+
+class AsyncMongoKitAvailabilityRepository(AsyncKitAvailabilityRepository):
+
+    def __init__(self, motor_db):
+        self.__collection = motor_db['kitAvailability']
+
+    async def save_all(self, kit_availabilities: List[KitAvailability]) -> None:
+        if not kit_availabilities:
+            return
+        await self.__collection.bulk_write([
+            pymongo.ReplaceOne(
+                {'_id': ObjectId(kit_availability.kit_id)},
+                create_mongo_kit_availability_from_kit_availability(kit_availability),
+                upsert=True
+            )
+            for kit_availability in kit_availabilities
+        ], ordered=False)
+
+    async def remove_many(self, kit_ids: List[str]) -> None:
+        if kit_ids:
+            await self.__collection.delete_many({'_id': {'$in': to_object_ids(kit_ids)}})
@@ -27,6 +27,13 @@ product_update_command_model = api.model('ProductUpdateCommand', {
     'inventoryQuantity': fields.Integer(required=True)
 })
 
+product_patch_command_model = api.model('ProductPatchCommand', {
+    'name': fields.String,
+    'cost': fields.Float,
+    'price': fields.Float,
+    'inventoryQuantity': fields.Integer
+})
+
 
 kit_product_field_out = api.model('KitProductFieldOut', {
     'productSku': fields.String(attribute='product_sku'),
@@ -41,6 +48,14 @@ kit_model = api.model('Kit', {
     'kitProducts': fields.List(fields.Nested(kit_product_field_out), attribute='kit_products')
 })
 
+expanded_kit_product_field_out = api.clone('ExpandedKitProductFieldOut', kit_product_field_out, {
+    'product': fields.Nested(product_model, allow_null=True)
+})
+
+expanded_kit_model = api.clone('ExpandedKit', kit_model, {
+    'kitProducts': fields.List(fields.Nested(expanded_kit_product_field_out), attribute='kit_products')
+})
+
 kit_product_field_in = api.model('KitProductFieldIn', {
     'productSku': fields.String(required=True),
     'quantity': fields.Integer(required=True),
@@ -58,6 +73,12 @@ kit_update_command_model = api.model('KitUpdateCommand', {
     'kitProducts': fields.List(fields.Nested(kit_product_field_in), required=True)
 })
 
+kit_products_patch_command_model = api.model('KitProductsPatchCommand', {
+    'add': fields.List(fields.Nested(kit_product_field_in)),
+    'change': fields.List(fields.Nested(kit_product_field_in)),
+    'remove': fields.List(fields.String, description='Product skus')
+})
+
 calculated_kit_model = api.model('CalculatedKit', {
     'name': fields.String,
     'sku': fields.String,
@@ -65,3 +86,11 @@ calculated_kit_model = api.model('CalculatedKit', {
     'price': fields.Float,
     'inventoryQuantity': fields.Integer(attribute='inventory_quantity')
 })
+
+kit_availability_model = api.model('KitAvailability', {
+    'id': fields.String(attribute='kit_id'),
+    'name': fields.String(attribute='kit_name'),
+    'sku': fields.String(attribute='kit_sku'),
+    'inventoryQuantity': fields.Integer(attribute='inventory_quantity'),
+    'limitingProductSku': fields.String(attribute='limiting_product_sku')
+})
@@ -4,8 +4,7 @@ from flask import Flask
 from flask_restx import Api, Model
 
 from src import configurations
-
-config = configurations.get_config()
+from src.base.representations import MSGPACK_MEDIATYPE, MsgpackAwareRequest, output_msgpack
 
 web_app = None
 api = None
@@ -15,7 +14,8 @@ def get_web_app():
     global web_app
     if not web_app:
         web_app = Flask(__name__)
-        web_app.config.from_object(config)
+        web_app.request_class = MsgpackAwareRequest
+        web_app.config.from_object(configurations.get_config())
     return web_app
 
 
@@ -28,5 +28,6 @@ def get_api():
             title='Kit API',
             description='Enjoy the API.'
         )
+        api.representation(MSGPACK_MEDIATYPE)(output_msgpack)
 
     return api
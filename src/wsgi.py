@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+Production WSGI entry point:
+
+    $ gunicorn -c python:src.gunicorn_config src.wsgi:application
+"""
+from src.initialize import create_app
+
+application = create_app()
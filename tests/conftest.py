@@ -0,0 +1,37 @@
+import pytest
+
+from src import configurations
+from src.instrumentation.queries import MONGO_COMMANDS_HEADER, REPOSITORY_CALLS_HEADER, REPOSITORY_CALLS_BY_METHOD_HEADER
+
+
+@pytest.fixture(scope='session')
+def kit_api_client():
+    '''
+        Test client of the app on the in memory repositories, with query counting on. The repositories are shared
+        by the whole session, so tests should use their own skus.
+    '''
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        config = configurations.get_config()
+        monkeypatch.setattr(config, 'REPOSITORY_BACKEND', 'memory')
+        monkeypatch.setattr(config, 'QUERY_COUNTING_ENABLED', True)
+        from src.initialize import create_app
+
+        yield create_app().test_client()
+
+
+@pytest.fixture
+def query_budget(kit_api_client):
+    '''
+        Sends a request and fails the test when it takes more round trips (Mongo commands, or repository calls on
+        the in memory backend) than allowed:
+
+            query_budget('GET', '/api/calculated-kits/1', max_round_trips=2)
+    '''
+    def request_within_budget(method: str, path: str, max_round_trips: int, **kwargs):
+        response = kit_api_client.open(path, method=method, **kwargs)
+        round_trips = int(response.headers.get(MONGO_COMMANDS_HEADER, response.headers[REPOSITORY_CALLS_HEADER]))
+        assert round_trips <= max_round_trips, '{} {} took {} round trips, the budget is {} ({})'.format(
+            method, path, round_trips, max_round_trips, response.headers[REPOSITORY_CALLS_BY_METHOD_HEADER]
+        )
+        return response
+    return request_within_budget
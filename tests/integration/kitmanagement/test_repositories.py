@@ -1,9 +1,15 @@
+from unittest import mock
+
 import pymongo
+from bson import ObjectId
+from pymongo.collection import Collection
 
 from src import configurations
-from src.exceptions import NotFound, skuExistsError
-from src.kitmanagement.domain import Product, Kit, KitProduct
-from src.kitmanagement.repositories import InMemoryProductRepository, InMemoryKitRepository, MongoProductRepository, MongoKitRepository
+from src.exceptions import NotFound, skuExistsError, KitProductExistsError, ConcurrentUpdateError
+from src.kitmanagement.domain import Product, Kit, KitProduct, ProductFilter, SortKey, KitAvailability
+from src.kitmanagement.repositories import InMemoryProductRepository, InMemoryKitRepository, MongoProductRepository, MongoKitRepository, \
+    InMemoryKitAvailabilityRepository, MongoKitAvailabilityRepository, MAX_SEARCH_CANDIDATES, create_mongo_product_from_product, \
+    product_search_tokens, PATCH_KIT_PRODUCTS_ATTEMPTS
 from tests.integration.testbase import TestCase
 
 
@@ -222,6 +228,126 @@ class TestInMemoryProductRepository(TestCase):
         self.assertEqual(product.price, 220.00)
         self.assertEqual(product.inventory_quantity, 150)
 
+    def test_list_filtered(self):
+        repository = InMemoryProductRepository()
+        for name, sku, cost, price, inventory_quantity in (
+            ('The Last of Us Part II', 'AHJU-49685', 10.00, 220.00, 150),
+            ('God of war', 'AHJU-49684', 20.00, 180.00, 5),
+            ('Horizon Zero Dawn', 'BHJU-49610', 20.00, 120.00, 2),
+            ('Bloodborne', 'AHJU-1458', 50.00, 200.00, 5),
+        ):
+            repository.add(Product(name=name, sku=sku, cost=cost, price=price, inventory_quantity=inventory_quantity))
+
+        low_stock = repository.list_filtered(
+            ProductFilter(max_inventory_quantity=5), [SortKey('inventory_quantity'), SortKey('name', descending=True)]
+        )
+        self.assertEqual([product.name for product in low_stock], ['Horizon Zero Dawn', 'God of war', 'Bloodborne'])
+        self.assertEqual(
+            [product.name for product in repository.list_filtered(
+                ProductFilter(min_price=180.00, max_price=200.00, sku_prefix='AHJU'), [SortKey('price')]
+            )],
+            ['God of war', 'Bloodborne']
+        )
+        self.assertEqual(
+            [product.name for product in repository.list_filtered(ProductFilter(min_cost=20.00, max_cost=20.00), [])],
+            ['God of war', 'Horizon Zero Dawn']
+        )
+        self.assertEqual(repository.list_filtered(ProductFilter(sku_prefix='C'), []), [])
+
+    def test_list_filtered_should_follow_updates_and_removals(self):
+        repository = InMemoryProductRepository()
+        product_id = repository.add(Product(
+            name='Last of Us Part II', sku='AHJU-4968', cost=2.00, price=100.00, inventory_quantity=100
+        ))
+        product = repository.get_by_id(product_id)
+        product.update_infos(name='Last of Us Part II', cost=2.00, price=100.00, inventory_quantity=1)
+        repository.update(product)
+
+        self.assertEqual(
+            [product.id for product in repository.list_filtered(ProductFilter(max_inventory_quantity=10), [])],
+            [product_id]
+        )
+
+        repository.remove(product_id)
+
+        self.assertEqual(repository.list_filtered(ProductFilter(max_inventory_quantity=10), []), [])
+
+    def test_search_should_match_name_and_sku_prefixes_best_matches_first(self):
+        repository = InMemoryProductRepository()
+        for name, sku in (('The Last of Us Part II', 'AHJU-49685'), ('Last Guardian', 'LAST-1'),
+                          ('God of war', 'AHJU-49684'), ('Lasting Pokémon', 'AHJU-49610')):
+            repository.add(Product(name=name, sku=sku, cost=10.00, price=220.00, inventory_quantity=10))
+
+        self.assertEqual(
+            [product.name for product in repository.search('last', 0, 10)],
+            ['Last Guardian', 'The Last of Us Part II', 'Lasting Pokémon']
+        )
+        self.assertEqual([product.name for product in repository.search('las of', 0, 10)], ['The Last of Us Part II'])
+        self.assertEqual([product.name for product in repository.search('ahju-49684', 0, 10)], ['God of war'])
+        self.assertEqual([product.name for product in repository.search('POKEMON', 0, 10)], ['Lasting Pokémon'])
+        self.assertEqual([product.name for product in repository.search('last', 1, 1)], ['The Last of Us Part II'])
+        self.assertEqual(repository.search('zelda', 0, 10), [])
+        self.assertEqual(repository.search(' - ', 0, 10), [])
+
+    def test_search_should_rank_the_sku_matches_past_the_candidates_limit_first(self):
+        repository = InMemoryProductRepository()
+        for index in range(MAX_SEARCH_CANDIDATES + 100):
+            repository.add(Product(name='Widget {}'.format(index), sku='W-{:05}'.format(index), cost=1.00, price=2.00,
+                                   inventory_quantity=1))
+        product_id = repository.add(Product(name='Zen widget', sku='WIDGET', cost=1.00, price=2.00, inventory_quantity=1))
+
+        self.assertEqual([product.id for product in repository.search('widget', 0, 1)], [product_id])
+
+    def test_search_should_follow_updates_and_removals(self):
+        repository = InMemoryProductRepository()
+        product_id = repository.add(Product(
+            name='Last of Us Part II', sku='AHJU-4968', cost=2.00, price=100.00, inventory_quantity=100
+        ))
+        product = repository.get_by_id(product_id)
+        product.update_infos(name='Bloodborne', cost=2.00, price=100.00, inventory_quantity=100)
+        repository.update(product)
+
+        self.assertEqual(repository.search('last', 0, 10), [])
+        self.assertEqual([product.id for product in repository.search('blood', 0, 10)], [product_id])
+
+        repository.remove(product_id)
+
+        self.assertEqual(repository.search('blood', 0, 10), [])
+
+    def test_patch_should_set_only_the_changes_and_follow_them_in_the_indexes(self):
+        repository = InMemoryProductRepository()
+        product_id = repository.add(Product(
+            name='Last of Us Part II', sku='AHJU-4968', cost=2.00, price=100.00, inventory_quantity=100
+        ))
+
+        product = repository.patch(product_id, {'name': 'Bloodborne', 'price': 150.00})
+
+        self.assertEqual((product.name, product.sku, product.cost, product.price, product.inventory_quantity),
+                         ('Bloodborne', 'AHJU-4968', 2.00, 150.00, 100))
+        self.assertEqual(repository.get_by_id(product_id).price, 150.00)
+        self.assertEqual(repository.search('last', 0, 10), [])
+        self.assertEqual([product.id for product in repository.search('blood', 0, 10)], [product_id])
+        self.assertEqual(repository.list_filtered(ProductFilter(max_price=100.00), []), [])
+        self.assertEqual([product.id for product in repository.list_filtered(ProductFilter(min_price=150.00), [])],
+                         [product_id])
+        with self.assertRaises(NotFound):
+            repository.patch('2', {'price': 10.00})
+
+    def test_get_many_by_ids_and_skus_should_keep_the_order_and_mark_the_missing(self):
+        repository = InMemoryProductRepository()
+        first_id = repository.add(Product(name='God of war', sku='AHJU-49684', cost=2.00, price=100.00, inventory_quantity=1))
+        second_id = repository.add(Product(name='Bloodborne', sku='AHJU-49685', cost=2.00, price=100.00, inventory_quantity=1))
+        repository.remove(first_id)
+
+        self.assertEqual(
+            [product and product.id for product in repository.get_many_by_ids([second_id, first_id, second_id])],
+            [second_id, None, second_id]
+        )
+        self.assertEqual(
+            [product and product.id for product in repository.get_many_by_skus(['AHJU-49684', 'AHJU-49685'])],
+            [None, second_id]
+        )
+
 
 class TestInMemoryKitRepository(TestCase):
 
@@ -535,6 +661,98 @@ class TestInMemoryKitRepository(TestCase):
         self.assertEqual(second_kit.kit_products[0], created_kits[1].kit_products[0])
         self.assertEqual(second_kit.kit_products[1], created_kits[1].kit_products[1])
 
+    def test_list_with_products_should_page_the_kits_using_any_of_the_products(self):
+        repository = InMemoryKitRepository()
+        kit_ids = [
+            repository.add(Kit(name='Sony Gaming Pack', sku='FASD-78{}'.format(index), kit_products=[
+                KitProduct(product_sku=product_sku, quantity=1, discount_percentage=10.5) for product_sku in product_skus
+            ]))
+            for index, product_skus in enumerate([['FASD-498', 'FASD-1489'], ['FASD-1489'], ['FASD-49809'], ['FASD-498']])
+        ]
+
+        kits = repository.list_with_products(['FASD-498', 'FASD-1489'], offset=0, limit=10)
+        second_page = repository.list_with_products(['FASD-498', 'FASD-1489'], offset=1, limit=2)
+
+        self.assertEqual([kit.id for kit in kits], [kit_ids[0], kit_ids[1], kit_ids[3]])
+        self.assertEqual([kit.id for kit in second_page], [kit_ids[1], kit_ids[3]])
+        self.assertEqual(repository.list_with_products(['FASD-147099'], offset=0, limit=10), [])
+
+    def test_get_many_by_ids_and_skus_should_keep_the_order_and_mark_the_missing(self):
+        repository = InMemoryKitRepository()
+        kit_products = [KitProduct(product_sku='FASD-498', quantity=1, discount_percentage=10.5)]
+        first_id = repository.add(Kit(name='Sony Gaming Pack', sku='FASD-789', kit_products=kit_products))
+        second_id = repository.add(Kit(name='Sony Gaming Pack II', sku='FASD-790', kit_products=kit_products))
+        repository.remove(first_id)
+
+        self.assertEqual([kit and kit.id for kit in repository.get_many_by_ids([second_id, first_id])], [second_id, None])
+        self.assertEqual([kit and kit.id for kit in repository.get_many_by_skus(['FASD-789', 'FASD-790'])], [None, second_id])
+
+    def test_list_with_products_should_follow_updates_and_removals(self):
+        repository = InMemoryKitRepository()
+        kit_id = repository.add(Kit(name='Sony Gaming Pack', sku='FASD-789', kit_products=[
+            KitProduct(product_sku='FASD-498', quantity=1, discount_percentage=10.5)
+        ]))
+        kit = repository.get_by_id(kit_id)
+        kit.update_infos(name=kit.name, kit_products=[
+            KitProduct(product_sku='FASD-1489', quantity=1, discount_percentage=10.5)
+        ])
+        repository.update(kit)
+
+        self.assertEqual(repository.list_with_products(['FASD-498'], offset=0, limit=10), [])
+        self.assertEqual([kit.id for kit in repository.list_with_products(['FASD-1489'], offset=0, limit=10)], [kit_id])
+
+        repository.remove(kit_id)
+
+        self.assertEqual(repository.list_with_products(['FASD-1489'], offset=0, limit=10), [])
+
+    def test_patch_kit_products(self):
+        repository = InMemoryKitRepository()
+        kit_id = repository.add(Kit(name='Sony Gaming Pack', sku='FASD-789', kit_products=[
+            KitProduct(product_sku='FASD-498', quantity=1, discount_percentage=10.5),
+            KitProduct(product_sku='FASD-1489', quantity=1, discount_percentage=10.5),
+            KitProduct(product_sku='FASD-1490', quantity=1, discount_percentage=10.5),
+        ]))
+
+        kit = repository.patch_kit_products(
+            kit_id,
+            added=[KitProduct(product_sku='FASD-1500', quantity=4, discount_percentage=0.0)],
+            changed=[KitProduct(product_sku='FASD-1489', quantity=2, discount_percentage=5.0)],
+            removed_skus=['FASD-498']
+        )
+
+        self.assertEqual(kit.kit_products, [
+            KitProduct(product_sku='FASD-1489', quantity=2, discount_percentage=5.0),
+            KitProduct(product_sku='FASD-1490', quantity=1, discount_percentage=10.5),
+            KitProduct(product_sku='FASD-1500', quantity=4, discount_percentage=0.0),
+        ])
+        self.assertEqual(repository.get_by_id(kit_id).kit_products, kit.kit_products)
+        self.assertEqual(repository.list_with_products(['FASD-498'], offset=0, limit=10), [])
+        self.assertEqual([kit.id for kit in repository.list_with_products(['FASD-1500'], offset=0, limit=10)], [kit_id])
+
+    def test_patch_kit_products_should_raise_for_missing_or_existing_kit_products(self):
+        repository = InMemoryKitRepository()
+        kit_id = repository.add(Kit(name='Sony Gaming Pack', sku='FASD-789', kit_products=[
+            KitProduct(product_sku='FASD-498', quantity=1, discount_percentage=10.5)
+        ]))
+
+        with self.assertRaises(NotFound):
+            repository.patch_kit_products('2', added=[], changed=[], removed_skus=['FASD-498'])
+        with self.assertRaises(NotFound):
+            repository.patch_kit_products(kit_id, added=[], changed=[], removed_skus=['FASD-1489'])
+        with self.assertRaises(KitProductExistsError):
+            repository.patch_kit_products(kit_id, added=[
+                KitProduct(product_sku='FASD-498', quantity=1, discount_percentage=10.5)
+            ], changed=[], removed_skus=[])
+        with self.assertRaises(KitProductExistsError):
+            repository.patch_kit_products(kit_id, added=[
+                KitProduct(product_sku='FASD-498', quantity=2, discount_percentage=10.5)
+            ], changed=[
+                KitProduct(product_sku='FASD-498', quantity=3, discount_percentage=10.5)
+            ], removed_skus=[])
+        self.assertEqual(repository.get_by_id(kit_id).kit_products, [
+            KitProduct(product_sku='FASD-498', quantity=1, discount_percentage=10.5)
+        ])
+
 
 class TestMongoProductRepository(TestCase):
 
@@ -542,6 +760,7 @@ class TestMongoProductRepository(TestCase):
         self.mongo_client = pymongo.MongoClient(config.MONGO_HOST, config.MONGO_PORT)
         self.mongo_db = self.mongo_client['test-database']
         self.mongo_db.products.create_index("sku", unique=True)
+        self.mongo_db.products.create_index("searchTokens")
 
     def test_add(self):
         repository = MongoProductRepository(self.mongo_db)
@@ -775,6 +994,95 @@ class TestMongoProductRepository(TestCase):
         with self.assertRaises(NotFound):
             repository.update(product)
 
+    def test_patch(self):
+        repository = MongoProductRepository(self.mongo_db)
+        product_id = repository.add(Product(
+            name='Last of Us Part II', sku='AHJU-4968', cost=2.00, price=100.00, inventory_quantity=100
+        ))
+
+        product = repository.patch(product_id, {'name': 'Bloodborne', 'inventory_quantity': 10})
+
+        self.assertEqual((product.id, product.name, product.sku, product.cost, product.price, product.inventory_quantity),
+                         (product_id, 'Bloodborne', 'AHJU-4968', 2.00, 100.00, 10))
+        self.assertEqual(repository.get_by_id(product_id).inventory_quantity, 10)
+        self.assertEqual(repository.search('last', 0, 10), [])
+        self.assertEqual([product.id for product in repository.search('blood', 0, 10)], [product_id])
+        self.assertEqual(
+            sorted(self.mongo_db.products.find_one({'_id': ObjectId(product_id)})['searchTokens']),
+            product_search_tokens(product)
+        )
+        self.assertEqual(repository.patch(product_id, {'name': '$name'}).name, '$name')
+        with self.assertRaises(NotFound):
+            repository.patch('5f566e9c1022bd08188d674b', {'price': 10.00})
+
+    def test_list_filtered(self):
+        repository = MongoProductRepository(self.mongo_db)
+        for name, sku, cost, price, inventory_quantity in (
+            ('The Last of Us Part II', 'AHJU-49685', 10.00, 220.00, 150),
+            ('God of war', 'AHJU-49684', 20.00, 180.00, 5),
+            ('Horizon Zero Dawn', 'BHJU-49610', 20.00, 120.00, 2),
+            ('Bloodborne', 'AHJU-1458', 50.00, 200.00, 5),
+        ):
+            repository.add(Product(name=name, sku=sku, cost=cost, price=price, inventory_quantity=inventory_quantity))
+
+        low_stock = repository.list_filtered(
+            ProductFilter(max_inventory_quantity=5), [SortKey('inventory_quantity'), SortKey('name', descending=True)]
+        )
+        self.assertEqual([product.name for product in low_stock], ['Horizon Zero Dawn', 'God of war', 'Bloodborne'])
+        self.assertEqual(
+            [product.name for product in repository.list_filtered(
+                ProductFilter(min_price=180.00, max_price=200.00, sku_prefix='AHJU'), [SortKey('price')]
+            )],
+            ['God of war', 'Bloodborne']
+        )
+
+    def test_search_should_match_name_and_sku_prefixes_best_matches_first(self):
+        repository = MongoProductRepository(self.mongo_db)
+        for name, sku in (('The Last of Us Part II', 'AHJU-49685'), ('Last Guardian', 'LAST-1'),
+                          ('God of war', 'AHJU-49684')):
+            repository.add(Product(name=name, sku=sku, cost=10.00, price=220.00, inventory_quantity=10))
+
+        self.assertEqual(
+            [product.name for product in repository.search('last', 0, 10)], ['Last Guardian', 'The Last of Us Part II']
+        )
+        self.assertEqual([product.name for product in repository.search('ahju-49684', 0, 10)], ['God of war'])
+        self.assertEqual(repository.search('zelda', 0, 10), [])
+
+    def test_search_should_rank_the_sku_matches_past_the_candidates_limit_first(self):
+        repository = MongoProductRepository(self.mongo_db)
+        self.mongo_db.products.insert_many([
+            create_mongo_product_from_product(Product(
+                name='Widget {}'.format(index), sku='W-{:05}'.format(index), cost=1.00, price=2.00, inventory_quantity=1
+            ))
+            for index in range(MAX_SEARCH_CANDIDATES + 100)
+        ])
+        product_id = repository.add(Product(name='Zen widget', sku='WIDGET', cost=1.00, price=2.00, inventory_quantity=1))
+
+        self.assertEqual([product.id for product in repository.search('widget', 0, 1)], [product_id])
+
+    def test_get_many_by_ids_and_skus_should_keep_the_order_and_mark_the_missing(self):
+        repository = MongoProductRepository(self.mongo_db)
+        first_id = repository.add(Product(name='God of war', sku='AHJU-49684', cost=2.00, price=100.00, inventory_quantity=1))
+        second_id = repository.add(Product(name='Bloodborne', sku='AHJU-49685', cost=2.00, price=100.00, inventory_quantity=1))
+
+        self.assertEqual(
+            [product and product.id for product in repository.get_many_by_ids([second_id, 'not-an-id', first_id])],
+            [second_id, None, first_id]
+        )
+        products = repository.get_many_by_skus(['AHJU-49686', 'AHJU-49685'], fields=['price'])
+        self.assertIsNone(products[0])
+        self.assertEqual((products[1].id, products[1].price), (second_id, 100.00))
+
+    def test_list_should_read_only_the_fields(self):
+        repository = MongoProductRepository(self.mongo_db)
+        repository.add(Product(name='God of war', sku='AHJU-49684', cost=10.00, price=220.00, inventory_quantity=10))
+
+        products = repository.list(fields=['sku', 'price'])
+
+        self.assertEqual([(product.sku, product.price) for product in products], [('AHJU-49684', 220.00)])
+        self.assertIsNone(products[0].name)
+        self.assertIsNone(products[0].inventory_quantity)
+
     def tearDown(self) -> None:
         self.mongo_db.drop_collection('products')
 
@@ -785,6 +1093,7 @@ class TestMongoKitRepository(TestCase):
         self.mongo_client = pymongo.MongoClient(config.MONGO_HOST, config.MONGO_PORT)
         self.mongo_db = self.mongo_client['test-database']
         self.mongo_db.kits.create_index("sku", unique=True)
+        self.mongo_db.kits.create_index("kitProducts.productSku")
 
     def test_add(self):
         repository = MongoKitRepository(self.mongo_db)
@@ -1118,5 +1427,188 @@ class TestMongoKitRepository(TestCase):
         with self.assertRaises(NotFound):
             repository.update(kit)
 
+    def test_patch_kit_products(self):
+        repository = MongoKitRepository(self.mongo_db)
+        kit_id = repository.add(Kit(name='Sony Gaming Pack', sku='FASD-789', kit_products=[
+            KitProduct(product_sku='FASD-498', quantity=1, discount_percentage=10.5),
+            KitProduct(product_sku='FASD-1489', quantity=1, discount_percentage=10.5),
+            KitProduct(product_sku='FASD-1490', quantity=1, discount_percentage=10.5),
+        ]))
+
+        kit = repository.patch_kit_products(
+            kit_id,
+            added=[KitProduct(product_sku='FASD-1500', quantity=4, discount_percentage=0.0)],
+            changed=[KitProduct(product_sku='FASD-1489', quantity=2, discount_percentage=5.0)],
+            removed_skus=['FASD-498']
+        )
+
+        self.assertEqual(kit.kit_products, [
+            KitProduct(product_sku='FASD-1489', quantity=2, discount_percentage=5.0),
+            KitProduct(product_sku='FASD-1490', quantity=1, discount_percentage=10.5),
+            KitProduct(product_sku='FASD-1500', quantity=4, discount_percentage=0.0),
+        ])
+        self.assertEqual(repository.get_by_id(kit_id).kit_products, kit.kit_products)
+
+    def test_patch_kit_products_should_raise_for_missing_or_existing_kit_products(self):
+        repository = MongoKitRepository(self.mongo_db)
+        kit_id = repository.add(Kit(name='Sony Gaming Pack', sku='FASD-789', kit_products=[
+            KitProduct(product_sku='FASD-498', quantity=1, discount_percentage=10.5)
+        ]))
+
+        with self.assertRaises(NotFound):
+            repository.patch_kit_products('5f566e9c1022bd08188d674b', added=[], changed=[], removed_skus=['FASD-498'])
+        with self.assertRaises(NotFound):
+            repository.patch_kit_products(kit_id, added=[], changed=[
+                KitProduct(product_sku='FASD-1489', quantity=1, discount_percentage=10.5)
+            ], removed_skus=[])
+        with self.assertRaises(KitProductExistsError):
+            repository.patch_kit_products(kit_id, added=[
+                KitProduct(product_sku='FASD-498', quantity=1, discount_percentage=10.5)
+            ], changed=[], removed_skus=[])
+        with self.assertRaises(KitProductExistsError):
+            repository.patch_kit_products(kit_id, added=[
+                KitProduct(product_sku='FASD-498', quantity=2, discount_percentage=10.5)
+            ], changed=[
+                KitProduct(product_sku='FASD-498', quantity=3, discount_percentage=10.5)
+            ], removed_skus=[])
+        self.assertEqual(repository.get_by_id(kit_id).kit_products, [
+            KitProduct(product_sku='FASD-498', quantity=1, discount_percentage=10.5)
+        ])
+
+    def test_patch_kit_products_should_try_again_when_a_concurrent_patch_made_it_fail(self):
+        repository = MongoKitRepository(self.mongo_db)
+        kit_id = repository.add(Kit(name='Sony Gaming Pack', sku='FASD-789', kit_products=[
+            KitProduct(product_sku='FASD-498', quantity=1, discount_percentage=10.5)
+        ]))
+        find_one_and_update = Collection.find_one_and_update
+
+        def find_one_and_update_after_a_concurrent_patch(collection, *args, **kwargs):
+            # INFO: the first attempt fails as if another patch had changed the kit then changed it back
+            if find_one_and_update_mock.call_count == 1:
+                return None
+            return find_one_and_update(collection, *args, **kwargs)
+
+        with mock.patch.object(Collection, 'find_one_and_update', autospec=True,
+                               side_effect=find_one_and_update_after_a_concurrent_patch) as find_one_and_update_mock:
+            kit = repository.patch_kit_products(kit_id, added=[
+                KitProduct(product_sku='FASD-1489', quantity=1, discount_percentage=10.5)
+            ], changed=[], removed_skus=['FASD-498'])
+
+        self.assertEqual(find_one_and_update_mock.call_count, 2)
+        self.assertEqual(kit.kit_products, [KitProduct(product_sku='FASD-1489', quantity=1, discount_percentage=10.5)])
+
+    def test_patch_kit_products_should_raise_a_conflict_when_concurrent_patches_keep_making_it_fail(self):
+        repository = MongoKitRepository(self.mongo_db)
+        kit_id = repository.add(Kit(name='Sony Gaming Pack', sku='FASD-789', kit_products=[
+            KitProduct(product_sku='FASD-498', quantity=1, discount_percentage=10.5)
+        ]))
+
+        with mock.patch.object(Collection, 'find_one_and_update', return_value=None) as find_one_and_update_mock:
+            with self.assertRaises(ConcurrentUpdateError):
+                repository.patch_kit_products(kit_id, added=[], changed=[], removed_skus=['FASD-498'])
+
+        self.assertEqual(find_one_and_update_mock.call_count, PATCH_KIT_PRODUCTS_ATTEMPTS)
+
+    def test_get_many_by_ids_and_skus_should_keep_the_order_and_mark_the_missing(self):
+        repository = MongoKitRepository(self.mongo_db)
+        kit_products = [KitProduct(product_sku='FASD-498', quantity=1, discount_percentage=10.5)]
+        first_id = repository.add(Kit(name='Sony Gaming Pack', sku='FASD-789', kit_products=kit_products))
+        second_id = repository.add(Kit(name='Sony Gaming Pack II', sku='FASD-790', kit_products=kit_products))
+
+        self.assertEqual(
+            [kit and kit.id for kit in repository.get_many_by_ids([second_id, '5f566e9c1022bd08188d674b', first_id])],
+            [second_id, None, first_id]
+        )
+        self.assertEqual([kit and kit.id for kit in repository.get_many_by_skus(['FASD-791', 'FASD-789'])], [None, first_id])
+
+    def test_get_by_id_should_read_only_the_fields(self):
+        repository = MongoKitRepository(self.mongo_db)
+        kit_id = repository.add(Kit(name='Sony Gaming Pack', sku='FASD-789', kit_products=[
+            KitProduct(product_sku='FASD-498', quantity=1, discount_percentage=10.5)
+        ]))
+
+        kit = repository.get_by_id(kit_id, fields=['sku'])
+
+        self.assertEqual(kit.id, kit_id)
+        self.assertEqual(kit.sku, 'FASD-789')
+        self.assertIsNone(kit.name)
+        self.assertEqual(kit.kit_products, [])
+
+    def test_list_with_products_should_page_the_kits_using_any_of_the_products(self):
+        repository = MongoKitRepository(self.mongo_db)
+        kit_ids = [
+            repository.add(Kit(name='Sony Gaming Pack', sku='FASD-78{}'.format(index), kit_products=[
+                KitProduct(product_sku=product_sku, quantity=1, discount_percentage=10.5) for product_sku in product_skus
+            ]))
+            for index, product_skus in enumerate([['FASD-498', 'FASD-1489'], ['FASD-1489'], ['FASD-49809'], ['FASD-498']])
+        ]
+
+        kits = repository.list_with_products(['FASD-498', 'FASD-1489'], offset=0, limit=10)
+        second_page = repository.list_with_products(['FASD-498', 'FASD-1489'], offset=1, limit=2)
+
+        self.assertEqual([kit.id for kit in kits], [kit_ids[0], kit_ids[1], kit_ids[3]])
+        self.assertEqual([kit.id for kit in second_page], [kit_ids[1], kit_ids[3]])
+
     def tearDown(self) -> None:
         self.mongo_db.drop_collection('kits')
+
+
+def kit_availability(kit_id: str, inventory_quantity: int) -> KitAvailability:
+    return KitAvailability(
+        kit_id=kit_id, kit_sku='KIT-' + kit_id, kit_name='Kit', inventory_quantity=inventory_quantity,
+        limiting_product_sku='AHJU-49685'
+    )
+
+
+class TestInMemoryKitAvailabilityRepository(TestCase):
+
+    def test_list_at_most_should_return_the_lowest_first(self):
+        repository = InMemoryKitAvailabilityRepository()
+        repository.save_all([kit_availability('1', 7), kit_availability('2', 0), kit_availability('3', 30)])
+        repository.save(kit_availability('1', 3))
+
+        self.assertEqual(repository.list_at_most(10), [kit_availability('2', 0), kit_availability('1', 3)])
+
+    def test_remove(self):
+        repository = InMemoryKitAvailabilityRepository()
+        repository.save(kit_availability('1', 3))
+        repository.remove('1')
+        repository.remove('2')
+
+        self.assertEqual(repository.list_at_most(10), [])
+
+    def test_remove_many(self):
+        repository = InMemoryKitAvailabilityRepository()
+        repository.save_all([kit_availability('1', 3), kit_availability('2', 5), kit_availability('3', 7)])
+        repository.remove_many(['1', '3', '4'])
+
+        self.assertEqual(repository.list_at_most(10), [kit_availability('2', 5)])
+
+
+class TestMongoKitAvailabilityRepository(TestCase):
+
+    def setUp(self) -> None:
+        self.mongo_client = pymongo.MongoClient(config.MONGO_HOST, config.MONGO_PORT)
+        self.mongo_db = self.mongo_client['test-database']
+        self.mongo_db.kitAvailability.create_index('inventoryQuantity')
+
+    def test_list_at_most_should_return_the_lowest_first(self):
+        repository = MongoKitAvailabilityRepository(self.mongo_db)
+        first_id, second_id, third_id = '5f566e9c1022bd08188d674b', '5f566e9c1022bd08188d674c', '5f566e9c1022bd08188d674d'
+        repository.save_all([kit_availability(first_id, 7), kit_availability(second_id, 0), kit_availability(third_id, 30)])
+        repository.save(kit_availability(first_id, 3))
+
+        self.assertEqual(
+            repository.list_at_most(10), [kit_availability(second_id, 0), kit_availability(first_id, 3)]
+        )
+
+        repository.remove(second_id)
+
+        self.assertEqual(repository.list_at_most(10), [kit_availability(first_id, 3)])
+
+        repository.remove_many([first_id, third_id])
+
+        self.assertEqual(repository.list_at_most(100), [])
+
+    def tearDown(self) -> None:
+        self.mongo_db.drop_collection('kitAvailability')
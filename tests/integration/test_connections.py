@@ -0,0 +1,79 @@
+from unittest import mock
+
+from pymongo.collection import Collection
+
+from src import connections
+from tests.integration.testbase import TestCase
+
+
+class TestLazyMongoDatabase(TestCase):
+
+    def setUp(self) -> None:
+        connections.mongo_client = None
+        connections.mongo_client_pid = None
+
+    def test_register_should_not_create_a_client(self):
+        connections.register(mock.MagicMock())
+        self.assertIsNone(connections.mongo_client)
+
+    def test_should_create_the_client_on_first_use(self):
+        database = connections.LazyMongoDatabase('test-database')
+        collection = database['products']
+
+        self.assertIsInstance(collection, Collection)
+        self.assertIsNotNone(connections.mongo_client)
+        self.assertIs(database['kits'].database.client, connections.mongo_client)
+
+    def test_should_create_a_new_client_after_fork(self):
+        database = connections.LazyMongoDatabase('test-database')
+        parent_client = database['products'].database.client
+
+        with mock.patch('src.connections.os.getpid', return_value=-1):
+            child_client = database['products'].database.client
+
+        self.assertIsNot(parent_client, child_client)
+
+    def tearDown(self) -> None:
+        if connections.mongo_client:
+            connections.mongo_client.close()
+        connections.mongo_client = None
+        connections.mongo_client_pid = None
+
+
+class TestIndexes(TestCase):
+
+    def test_missing_indexes_should_list_the_absent_and_not_unique_ones(self):
+        index_information = {
+            'products': {
+                '_id_': {'key': [('_id', 1)]},
+                'sku_1': {'key': [('sku', 1)]},
+                'searchTokens_1': {'key': [('searchTokens', 1)]},
+                'price_1': {'key': [('price', 1)]},
+                'cost_1': {'key': [('cost', 1)]},
+                'inventoryQuantity_1': {'key': [('inventoryQuantity', 1)]},
+            },
+            'kits': {
+                '_id_': {'key': [('_id', 1)]},
+                'sku_1': {'key': [('sku', 1)], 'unique': True},
+            },
+            'kitAvailability': {
+                'inventoryQuantity_1': {'key': [('inventoryQuantity', 1)]},
+            },
+        }
+        database = {}
+        for collection_name, indexes in index_information.items():
+            database[collection_name] = mock.MagicMock()
+            database[collection_name].index_information.return_value = indexes
+
+        with mock.patch('src.connections.mongo_kit_db', database):
+            self.assertEqual(connections.missing_indexes(), ['products.sku', 'kits.kitProducts.productSku'])
+
+    def test_create_indexes_should_create_every_index(self):
+        database = {collection_name: mock.MagicMock() for collection_name in connections.INDEXES}
+
+        with mock.patch('src.connections.mongo_kit_db', database):
+            connections.create_indexes()
+
+        database['products'].create_index.assert_any_call('sku', unique=True)
+        database['kits'].create_index.assert_any_call('kitProducts.productSku', unique=False)
+        self.assertEqual(database['kitAvailability'].create_index.call_count, 1)
@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+import msgpack
+from flask_restx import Api, fields
+from flask_restx.errors import abort
+
+from src.base.asgi import AsgiApp, AsyncResourceBase
+from tests.unit.testbase import TestCase
+
+api = Api()
+echo_model = api.model('AsgiEcho', {'productSku': fields.String(required=True), 'quantity': fields.Integer(required=True)})
+
+
+class EchoResource(AsyncResourceBase):
+
+    def __init__(self):
+        super(EchoResource, self).__init__(api)
+
+    async def get(self, request, echo_id: str):
+        if echo_id == 'missing':
+            abort(404, 'Echo Not Found.', echo_id=echo_id)
+        return {'id': echo_id}
+
+    async def put(self, request, echo_id: str):
+        return self._serialize_in(request, echo_model), 200
+
+    async def delete(self, request, echo_id: str):
+        return {}, 204
+
+
+def call(asgi_app, method, path, body=b'', headers=None, query_string=b''):
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query_string,
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    }
+    asyncio.run(asgi_app(scope, receive, send))
+    return messages[0]['status'], dict(messages[0]['headers']), messages[1]['body']
+
+
+class TestAsgiApp(TestCase):
+
+    def setUp(self) -> None:
+        self.asgi_app = AsgiApp()
+        self.asgi_app.add_resource(EchoResource(), '/echoes/<string:echo_id>')
+
+    def test_should_dispatch_to_the_resource_method(self):
+        status, headers, body = call(self.asgi_app, 'GET', '/echoes/1')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'content-type'], b'application/json')
+        self.assertEqual(json.loads(body), {'id': '1'})
+
+    def test_should_validate_and_convert_the_payload(self):
+        status, _, body = call(
+            self.asgi_app, 'PUT', '/echoes/1',
+            body=json.dumps({'productSku': 'A', 'quantity': 2}).encode(),
+            headers={'Content-Type': 'application/json'}
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {'product_sku': 'A', 'quantity': 2})
+
+    def test_should_return_validation_errors_like_flask_restx(self):
+        status, _, body = call(
+            self.asgi_app, 'PUT', '/echoes/1',
+            body=json.dumps({'productSku': 'A'}).encode(),
+            headers={'Content-Type': 'application/json'}
+        )
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(body)['message'], 'Input payload validation failed')
+        self.assertIn('quantity', json.loads(body)['errors'])
+
+    def test_should_return_abort_data(self):
+        status, _, body = call(self.asgi_app, 'GET', '/echoes/missing')
+        self.assertEqual(status, 404)
+        self.assertEqual(json.loads(body), {'message': 'Echo Not Found.', 'echo_id': 'missing'})
+
+    def test_should_answer_unknown_routes_and_methods(self):
+        self.assertEqual(call(self.asgi_app, 'GET', '/unknown')[0], 404)
+        self.assertEqual(call(self.asgi_app, 'POST', '/echoes/1')[0], 405)
+
+    def test_should_reject_the_query_arguments_it_doesnt_serve(self):
+        status, _, body = call(self.asgi_app, 'GET', '/echoes/1', query_string=b'fields=id&expand=products')
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(body), {
+            'message': 'Query arguments not supported by the ASGI deployment.', 'arguments': ['expand', 'fields']
+        })
+
+    def test_should_send_an_empty_body_for_no_content(self):
+        status, _, body = call(self.asgi_app, 'DELETE', '/echoes/1')
+        self.assertEqual(status, 204)
+        self.assertEqual(body, b'')
+
+    def test_should_negotiate_msgpack(self):
+        status, headers, body = call(self.asgi_app, 'GET', '/echoes/1', headers={'Accept': 'application/msgpack'})
+        self.assertEqual(headers[b'content-type'], b'application/msgpack')
+        self.assertEqual(msgpack.unpackb(body, raw=False), {'id': '1'})
+
+    def test_should_run_lifespan_handlers(self):
+        events = []
+        messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        @self.asgi_app.on_startup
+        async def startup():
+            events.append('startup')
+
+        @self.asgi_app.on_shutdown
+        async def shutdown():
+            events.append('shutdown')
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.asgi_app({'type': 'lifespan'}, receive, send))
+        self.assertEqual(events, ['startup', 'shutdown'])
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
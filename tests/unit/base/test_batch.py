@@ -0,0 +1,50 @@
+from flask import Flask, current_app, g, request
+from flask_restx import Api, Resource
+
+from src.base.batch import dispatch
+from tests.unit.testbase import TestCase
+
+
+class TestDispatch(TestCase):
+
+    def setUp(self) -> None:
+        self.hooks = []
+        web_app = Flask(__name__)
+        api = Api(web_app)
+
+        @web_app.before_request
+        def start():
+            g.request_id = request.headers.get('X-Request-Id')
+            self.hooks.append(('before', request.method, request.path))
+
+        @web_app.after_request
+        def finish(response):
+            self.hooks.append(('after', request.method, request.path))
+            return response
+
+        class EchoResource(Resource):
+
+            def put(self, item_id: str):
+                return {'id': item_id, 'requestId': g.request_id, 'args': request.args.to_dict(), 'body': request.json}
+
+        class OuterResource(Resource):
+
+            def post(self):
+                return dispatch(current_app._get_current_object(), request.json)
+
+        api.add_resource(EchoResource, '/api/items/<string:item_id>')
+        api.add_resource(OuterResource, '/outer')
+        self.client = web_app.test_client()
+
+    def test_should_run_the_sub_request_with_the_batch_headers_and_hooks(self):
+        response = self.client.post('/outer', headers={'X-Request-Id': 'abc'}, json={
+            'method': 'PUT', 'path': '/api/items/7?fields=id', 'body': {'name': 'Item'}
+        })
+
+        self.assertEqual(response.json, {'status': 200, 'body': {
+            'id': '7', 'requestId': 'abc', 'args': {'fields': 'id'}, 'body': {'name': 'Item'}
+        }})
+        self.assertEqual(self.hooks, [
+            ('before', 'POST', '/outer'), ('before', 'PUT', '/api/items/7'),
+            ('after', 'PUT', '/api/items/7'), ('after', 'POST', '/outer')
+        ])
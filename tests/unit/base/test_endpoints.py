@@ -1,6 +1,9 @@
 from unittest import mock
 
-from src.base.endpoints import responses_doc_for
+from flask import Flask
+from flask_restx import Api, fields
+
+from src.base.endpoints import responses_doc_for, ResourceBase
 from src.kitmanagement.domain import Product, KitProduct, Kit, CalculatedKit
 from tests.unit.testbase import TestCase
 
@@ -22,3 +25,44 @@ class TestResponsesDocFor(TestCase):
             201: 'Created. The request has been fulfilled, resulting in the creation of a new resource.',
             400: 'The server cannot or will not process the request due to an apparent client error (e.g., malformed request syntax, size too large, invalid request message framing, or deceptive request routing).'
         })
+
+
+class TestResourceBaseFields(TestCase):
+
+    def setUp(self) -> None:
+        web_app = Flask(__name__)
+        api = Api(web_app)
+        item_model = api.model('FieldsItem', {
+            'id': fields.String,
+            'sku': fields.String,
+            'inventoryQuantity': fields.Integer(attribute='inventory_quantity'),
+            'parts': fields.List(fields.Nested(api.model('FieldsPart', {'sku': fields.String, 'quantity': fields.Integer})))
+        })
+        self.requested_fields = []
+
+        class ItemResource(ResourceBase):
+
+            def get(resource):
+                self.requested_fields.append(resource._fields(item_model))
+                return resource._marshal({
+                    'id': '1', 'sku': 'A', 'inventory_quantity': 3, 'parts': [{'sku': 'B', 'quantity': 2}]
+                }, item_model)
+
+        api.add_resource(ItemResource, '/item')
+        self.client = web_app.test_client()
+
+    def test_should_marshal_every_field_without_fields(self):
+        response = self.client.get('/item')
+        self.assertEqual(response.json, {
+            'id': '1', 'sku': 'A', 'inventoryQuantity': 3, 'parts': [{'sku': 'B', 'quantity': 2}]
+        })
+        self.assertEqual(self.requested_fields, [None])
+
+    def test_should_marshal_and_request_only_the_selected_fields(self):
+        response = self.client.get('/item?fields=inventoryQuantity,parts{quantity}')
+        self.assertEqual(response.json, {'inventoryQuantity': 3, 'parts': [{'quantity': 2}]})
+        self.assertEqual(self.requested_fields, [['inventory_quantity', 'parts']])
+
+    def test_should_reject_unknown_or_malformed_fields(self):
+        self.assertEqual(self.client.get('/item?fields=sku,color').status_code, 400)
+        self.assertEqual(self.client.get('/item?fields=parts{sku').status_code, 400)
@@ -0,0 +1,47 @@
+from unittest import mock
+
+from src.base.loading import BatchLoader, PRODUCT, KIT
+from src.exceptions import NotFound
+from tests.unit.testbase import TestCase
+
+
+class TestBatchLoader(TestCase):
+
+    def setUp(self) -> None:
+        self.repository = mock.Mock()
+        self.repository.get_many_by_ids.return_value = ['product 1', None]
+        self.batch_loader = BatchLoader()
+        self.batch_loader.register(PRODUCT, self.repository, 'product_id')
+
+    def test_should_load_the_distinct_ids_with_one_get_many_by_ids(self):
+        with self.batch_loader.loading([{'product_id': '1'}, {'kit_id': '9'}, {'product_id': '2'}, {'product_id': '1'}]):
+            repository = self.batch_loader.repository(PRODUCT, self.repository)
+            self.assertEqual(repository.get_by_id('1'), 'product 1')
+            self.assertEqual(repository.get_by_id('1'), 'product 1')
+        self.repository.get_many_by_ids.assert_called_once_with(['1', '2'])
+        self.repository.get_by_id.assert_not_called()
+
+    def test_should_raise_not_found_for_a_loaded_id_that_doesnt_exist(self):
+        with self.batch_loader.loading([{'product_id': '1'}, {'product_id': '2'}]):
+            with self.assertRaises(NotFound):
+                self.batch_loader.repository(PRODUCT, self.repository).get_by_id('2')
+
+    def test_should_delegate_ids_that_werent_loaded_and_the_other_methods(self):
+        with self.batch_loader.loading([{'product_id': '1'}, {'product_id': '2'}]):
+            repository = self.batch_loader.repository(PRODUCT, self.repository)
+            repository.get_by_id('3', fields=['sku'])
+            repository.list(fields=['sku'])
+        self.repository.get_by_id.assert_called_once_with('3', fields=['sku'])
+        self.repository.list.assert_called_once_with(fields=['sku'])
+
+    def test_should_give_the_repository_itself_outside_loading(self):
+        self.assertIs(self.batch_loader.repository(PRODUCT, self.repository), self.repository)
+        with self.batch_loader.loading([{'product_id': '1'}]):
+            self.assertIs(self.batch_loader.repository(KIT, self.repository), self.repository)
+        self.assertIs(self.batch_loader.repository(PRODUCT, self.repository), self.repository)
+
+    def test_should_stop_loading_when_the_batch_fails(self):
+        with self.assertRaises(ValueError):
+            with self.batch_loader.loading([{'product_id': '1'}]):
+                raise ValueError
+        self.assertIs(self.batch_loader.repository(PRODUCT, self.repository), self.repository)
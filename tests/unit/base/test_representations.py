@@ -0,0 +1,57 @@
+import msgpack
+from flask import Flask
+from flask_restx import Api, Resource, fields
+
+from src.base.representations import MSGPACK_MEDIATYPE, MsgpackAwareRequest, output_msgpack
+from tests.unit.testbase import TestCase
+
+
+class TestMsgpackRepresentation(TestCase):
+
+    def setUp(self) -> None:
+        web_app = Flask(__name__)
+        web_app.request_class = MsgpackAwareRequest
+        api = Api(web_app)
+        api.representation(MSGPACK_MEDIATYPE)(output_msgpack)
+        echo_model = api.model('Echo', {'sku': fields.String(required=True), 'quantity': fields.Integer(required=True)})
+
+        class EchoResource(Resource):
+
+            @api.expect(echo_model, validate=True)
+            def post(self):
+                return api.payload, 201
+
+            def get(self):
+                return [{'sku': 'A', 'quantity': 1}, {'sku': 'B', 'quantity': 2}]
+
+        api.add_resource(EchoResource, '/echo')
+        self.client = web_app.test_client()
+
+    def test_should_decode_msgpack_body_and_encode_msgpack_response(self):
+        response = self.client.post(
+            '/echo',
+            data=msgpack.packb({'sku': 'A', 'quantity': 3}),
+            content_type=MSGPACK_MEDIATYPE,
+            headers={'Accept': MSGPACK_MEDIATYPE}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.content_type, MSGPACK_MEDIATYPE)
+        self.assertEqual(msgpack.unpackb(response.data, raw=False), {'sku': 'A', 'quantity': 3})
+
+    def test_should_encode_lists(self):
+        response = self.client.get('/echo', headers={'Accept': MSGPACK_MEDIATYPE})
+        self.assertEqual(msgpack.unpackb(response.data, raw=False), [{'sku': 'A', 'quantity': 1}, {'sku': 'B', 'quantity': 2}])
+
+    def test_should_validate_msgpack_body_against_the_model(self):
+        response = self.client.post('/echo', data=msgpack.packb({'sku': 'A'}), content_type=MSGPACK_MEDIATYPE)
+        self.assertEqual(response.status_code, 400)
+
+    def test_should_reject_malformed_msgpack_body(self):
+        response = self.client.post('/echo', data=b'\xc1', content_type=MSGPACK_MEDIATYPE)
+        self.assertEqual(response.status_code, 400)
+
+    def test_should_keep_json_as_default(self):
+        response = self.client.post('/echo', json={'sku': 'A', 'quantity': 3})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertEqual(response.json, {'sku': 'A', 'quantity': 3})
@@ -0,0 +1,60 @@
+import io
+import json
+import logging
+
+from flask import Flask, abort
+
+from src.instrumentation.access_log import AccessLog, parse_sample_rates
+from tests.unit.testbase import TestCase
+
+
+class TestAccessLog(TestCase):
+
+    def setUp(self) -> None:
+        self.output = io.StringIO()
+        web_app = Flask(__name__)
+
+        @web_app.route('/items/<item_id>', methods=['GET', 'POST'])
+        def get_item(item_id: str):
+            if item_id == 'missing':
+                abort(404)
+            return 'item ' + item_id
+
+        self.web_app = web_app
+        self.access_log = None
+
+    def __records(self, sample_rates: dict, *paths: str) -> list:
+        self.access_log = AccessLog(logging.StreamHandler(self.output), sample_rates)
+        self.access_log.init_app(self.web_app)
+        client = self.web_app.test_client()
+        for path in paths:
+            client.post(path, data='payload')
+        self.access_log.stop()
+        return [json.loads(line) for line in self.output.getvalue().splitlines()]
+
+    def test_should_write_a_json_record_per_request(self):
+        records = self.__records({}, '/items/7')
+
+        self.assertEqual(len(records), 1)
+        record = records[0]
+        self.assertEqual(record['method'], 'POST')
+        self.assertEqual(record['route'], '/items/<item_id>')
+        self.assertEqual(record['path'], '/items/7')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['request_bytes'], len('payload'))
+        self.assertEqual(record['response_bytes'], len('item 7'))
+        self.assertNotIn('mongo_bytes_out', record)
+        self.assertGreaterEqual(record['latency_ms'], 0)
+
+    def test_should_sample_each_status_class_at_its_rate(self):
+        records = self.__records(parse_sample_rates('2xx=0,4xx=1'), '/items/7', '/items/missing')
+
+        self.assertEqual([record['status'] for record in records], [404])
+
+    def test_should_parse_sample_rates(self):
+        self.assertEqual(parse_sample_rates('2xx=0.1, 5xx=1'), {'2xx': 0.1, '5xx': 1.0})
+        self.assertEqual(parse_sample_rates(''), {})
+
+    def tearDown(self) -> None:
+        if self.access_log:
+            self.access_log.stop()
@@ -0,0 +1,46 @@
+import tracemalloc
+
+from flask import Flask
+
+from src.instrumentation.allocations import AllocationProfiler
+from tests.unit.testbase import TestCase
+
+
+class TestAllocationProfiler(TestCase):
+
+    def setUp(self) -> None:
+        self.retained = []
+        web_app = Flask(__name__)
+
+        @web_app.route('/items')
+        def list_items():
+            self.retained.append([{'sku': str(index)} for index in range(2000)])
+            return 'ok'
+
+        self.web_app = web_app
+
+    def __profiler(self, sample_rate: float = 1.0) -> AllocationProfiler:
+        profiler = AllocationProfiler(sample_rate)
+        profiler.init_app(self.web_app)
+        return profiler
+
+    def test_should_report_top_allocation_sites_and_peak_per_route(self):
+        profiler = self.__profiler()
+        self.web_app.test_client().get('/items')
+
+        route = profiler.routes()['GET /items']
+        self.assertEqual(route['sampled_requests'], 1)
+        self.assertGreater(route['peak_bytes_max'], 0)
+        self.assertTrue(any(__file__ in site['site'] for site in route['top_sites']))
+
+    def test_should_diff_memory_against_the_baseline(self):
+        profiler = self.__profiler(sample_rate=0)
+        profiler.reset_baseline()
+        self.web_app.test_client().get('/items')
+
+        diff = profiler.diff()
+        self.assertEqual(profiler.routes(), {})
+        self.assertTrue(any(__file__ in site['site'] and site['size_diff_bytes'] > 0 for site in diff['top_sites']))
+
+    def tearDown(self) -> None:
+        tracemalloc.stop()
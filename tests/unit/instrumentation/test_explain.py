@@ -0,0 +1,89 @@
+from unittest import mock
+
+from bson import ObjectId
+from flask import Flask
+from flask_restx import Api, Resource
+
+from src.instrumentation.explain import QueryExplainer, summarize
+from tests.unit.testbase import TestCase
+
+EXPLAIN_RESULT = {
+    'queryPlanner': {
+        'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'sku_1'}}
+    },
+    'executionStats': {'nReturned': 1, 'totalKeysExamined': 1, 'totalDocsExamined': 1, 'executionTimeMillis': 0}
+}
+
+
+class TestSummarize(TestCase):
+
+    def test_should_summarize_an_index_scan(self):
+        self.assertEqual(summarize(EXPLAIN_RESULT), {
+            'stages': ['FETCH', 'IXSCAN'],
+            'index': 'sku_1',
+            'collection_scan': False,
+            'returned': 1,
+            'keys_examined': 1,
+            'docs_examined': 1,
+            'execution_time_ms': 0,
+        })
+
+    def test_should_flag_collection_scans(self):
+        summary = summarize({
+            'queryPlanner': {'winningPlan': {'queryPlan': {'stage': 'COLLSCAN'}}},
+            'executionStats': {'nReturned': 3, 'totalKeysExamined': 0, 'totalDocsExamined': 100000}
+        })
+        self.assertTrue(summary['collection_scan'])
+        self.assertIsNone(summary['index'])
+
+
+class TestQueryExplainer(TestCase):
+
+    def setUp(self) -> None:
+        self.database = mock.Mock()
+        self.database.command.return_value = EXPLAIN_RESULT
+        self.explainer = QueryExplainer()
+        web_app = Flask(__name__)
+        api = Api(web_app)
+        explainer = self.explainer
+
+        class ProductResource(Resource):
+
+            def get(self, sku: str):
+                command = {'find': 'products', 'filter': {'sku': sku, '_id': ObjectId()}, 'lsid': {}, '$db': 'local'}
+                explainer.started(mock.Mock(request_id=1, command_name='find', database_name='local', command=command))
+                explainer.succeeded(mock.Mock(request_id=1, duration_micros=1500))
+                return {'sku': sku}
+
+        api.add_resource(ProductResource, '/products/<string:sku>')
+        self.explainer.init_app(web_app, lambda: {'local': self.database}, 'secret')
+        self.client = web_app.test_client()
+
+    def test_should_add_the_query_plans_to_the_response(self):
+        response = self.client.get('/products/A?explain=1', headers={'X-Admin-Token': 'secret'})
+
+        self.assertEqual(response.json['data'], {'sku': 'A'})
+        query = response.json['explain']['queries'][0]
+        self.assertEqual(query['collection'], 'products')
+        self.assertEqual(query['index'], 'sku_1')
+        self.assertEqual(query['duration_ms'], 1.5)
+        self.assertEqual(query['query']['filter']['sku'], 'A')
+        self.assertNotIn('lsid', query['query'])
+        self.assertNotIn('$db', query['query'])
+        self.assertEqual(set(response.json['explain']['timing']), {'total_ms', 'mongo_ms', 'app_ms'})
+        self.database.command.assert_called_once_with(
+            'explain', mock.ANY, verbosity='executionStats'
+        )
+
+    def test_should_ignore_explain_without_the_admin_token(self):
+        for headers in ({}, {'X-Admin-Token': 'wrong'}):
+            response = self.client.get('/products/A?explain=1', headers=headers)
+
+            self.assertEqual(response.json, {'sku': 'A'})
+        self.database.command.assert_not_called()
+
+    def test_should_leave_other_requests_untouched(self):
+        response = self.client.get('/products/A')
+
+        self.assertEqual(response.json, {'sku': 'A'})
+        self.database.command.assert_not_called()
@@ -0,0 +1,63 @@
+from functools import partial
+from unittest import mock
+
+from src.instrumentation import hot_keys
+from src.kitmanagement.application_services import CalculatedKitsService
+from tests.unit.testbase import TestCase
+
+
+class TestCountMinSketch(TestCase):
+
+    def test_should_never_underestimate(self):
+        sketch = hot_keys.CountMinSketch(width=16, depth=3)
+        counts = {'sku-{}'.format(index): index % 7 + 1 for index in range(100)}
+        for key, count in counts.items():
+            for _ in range(count):
+                sketch.add(key)
+
+        for key, count in counts.items():
+            self.assertGreaterEqual(sketch.estimate(key), count)
+
+
+class TestAccessStatistics(TestCase):
+
+    def test_should_keep_the_most_accessed_keys(self):
+        access_statistics = hot_keys.AccessStatistics(capacity=3, width=1024, depth=4)
+        for index in range(200):
+            access_statistics.record(hot_keys.KIT, ['cold-{}'.format(index)])
+        for hot_key, accesses in (('hot-a', 50), ('hot-b', 30), ('hot-c', 20)):
+            access_statistics.record(hot_keys.KIT, [hot_key] * accesses)
+
+        kits = access_statistics.top(limit=3)[hot_keys.KIT]
+        self.assertEqual(kits['accesses'], 300)
+        self.assertEqual([entry['key'] for entry in kits['top']], ['hot-a', 'hot-b', 'hot-c'])
+        self.assertGreaterEqual(access_statistics.estimate(hot_keys.KIT, 'hot-a'), 50)
+
+    def test_reset_should_start_counts_over(self):
+        access_statistics = hot_keys.AccessStatistics()
+        access_statistics.record(hot_keys.PRODUCT, ['1'])
+        access_statistics.reset()
+
+        self.assertEqual(access_statistics.top()[hot_keys.PRODUCT], {'accesses': 0, 'top': []})
+
+    def test_calculate_kit_should_count_the_products_by_id(self):
+        access_statistics = hot_keys.AccessStatistics()
+        kit_mock = mock.MagicMock()
+        kit_mock.kit_products = [mock.MagicMock(product_sku='A'), mock.MagicMock(product_sku='B')]
+        kit_repository_mock = mock.MagicMock()
+        kit_repository_mock.get_by_id.return_value = kit_mock
+        product_repository_mock = mock.MagicMock()
+        product_repository_mock.list_with_skus.return_value = [mock.MagicMock(id='1'), mock.MagicMock(id='2')]
+        service = CalculatedKitsService(
+            kit_repository_mock, product_repository_mock,
+            record_products=partial(access_statistics.record, hot_keys.PRODUCT)
+        )
+
+        with mock.patch('src.kitmanagement.application_services.CalculatedKit'):
+            service.calculate_kit('1')
+
+        self.assertEqual(access_statistics.estimate(hot_keys.PRODUCT, '1'), 1)
+        self.assertEqual(access_statistics.estimate(hot_keys.PRODUCT, '2'), 1)
+
+    def tearDown(self) -> None:
+        hot_keys.install(None)
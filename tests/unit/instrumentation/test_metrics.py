@@ -0,0 +1,84 @@
+from unittest import mock
+
+from flask import Flask
+from flask_restx import Api, Resource
+
+from src.instrumentation.metrics import Histogram, RequestMetrics, CommandTimingListener, render_pool
+from src.instrumentation.pool import PoolCheckoutListener
+from tests.unit.testbase import TestCase
+
+
+class TestHistogram(TestCase):
+
+    def test_should_render_cumulative_buckets(self):
+        histogram = Histogram('latency_seconds', 'Latency.', ('route',), [0.1, 1, float('inf')])
+        histogram.observe(('a',), 0.05)
+        histogram.observe(('a',), 0.1)
+        histogram.observe(('a',), 0.5)
+        histogram.observe(('a',), 3)
+
+        self.assertEqual(histogram.render(), [
+            '# HELP latency_seconds Latency.',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{route="a",le="0.1"} 2',
+            'latency_seconds_bucket{route="a",le="1"} 3',
+            'latency_seconds_bucket{route="a",le="+Inf"} 4',
+            'latency_seconds_sum{route="a"} 3.65',
+            'latency_seconds_count{route="a"} 4',
+        ])
+
+
+class TestRequestMetrics(TestCase):
+
+    def setUp(self) -> None:
+        web_app = Flask(__name__)
+        api = Api(web_app)
+
+        class ItemResource(Resource):
+
+            def get(self, item_id: str):
+                if item_id == 'missing':
+                    api.abort(404)
+                return {'id': item_id}
+
+        api.add_resource(ItemResource, '/items/<string:item_id>')
+        self.request_metrics = RequestMetrics()
+        self.request_metrics.init_app(web_app)
+        self.client = web_app.test_client()
+
+    def test_should_time_requests_by_resource_and_method(self):
+        self.client.get('/items/1')
+        self.client.get('/items/2')
+
+        rendered = '\n'.join(self.request_metrics.render())
+        self.assertIn('kit_api_request_duration_seconds_count{resource="ItemResource",method="get"} 2', rendered)
+
+    def test_should_count_errors_by_status(self):
+        self.client.get('/items/missing')
+        self.client.get('/unknown')
+
+        rendered = '\n'.join(self.request_metrics.render())
+        self.assertIn('kit_api_request_errors_total{resource="ItemResource",method="get",status="404"} 1', rendered)
+        self.assertIn('kit_api_request_errors_total{resource="unmatched",method="get",status="404"} 1', rendered)
+
+
+class TestCommandTimingListener(TestCase):
+
+    def test_should_time_commands_and_count_failures(self):
+        listener = CommandTimingListener()
+        listener.succeeded(mock.Mock(command_name='find', duration_micros=1500))
+        listener.failed(mock.Mock(command_name='insert', duration_micros=300))
+
+        rendered = '\n'.join(listener.render())
+        self.assertIn('kit_api_mongo_command_duration_seconds_bucket{command="find",le="0.0025"} 1', rendered)
+        self.assertIn('kit_api_mongo_command_duration_seconds_count{command="insert"} 1', rendered)
+        self.assertIn('kit_api_mongo_command_failures_total{command="insert"} 1', rendered)
+
+
+class TestRenderPool(TestCase):
+
+    def test_should_render_pool_snapshot(self):
+        rendered = '\n'.join(render_pool(PoolCheckoutListener().snapshot()))
+
+        self.assertIn('kit_api_mongo_pool_checkouts_total 0', rendered)
+        self.assertIn('kit_api_mongo_pool_checkout_wait_seconds_bucket{le="+Inf"} 0', rendered)
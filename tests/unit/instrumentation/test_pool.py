@@ -0,0 +1,46 @@
+from pymongo import monitoring
+
+from src.instrumentation.pool import PoolCheckoutListener
+from tests.unit.testbase import TestCase
+
+ADDRESS = ('localhost', 27017)
+
+
+class TestPoolCheckoutListener(TestCase):
+
+    def test_should_measure_checkout_waits(self):
+        listener = PoolCheckoutListener()
+        listener.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+        listener.connection_checked_out(monitoring.ConnectionCheckedOutEvent(ADDRESS, 1))
+        listener.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+        listener.connection_checked_out(monitoring.ConnectionCheckedOutEvent(ADDRESS, 2))
+
+        snapshot = listener.snapshot()
+        self.assertEqual(snapshot['checkouts'], 2)
+        self.assertEqual(sum(bucket['count'] for bucket in snapshot['wait_buckets']), 2)
+        self.assertEqual(snapshot['wait_buckets'][-1]['le_ms'], '+Inf')
+        self.assertGreaterEqual(snapshot['wait_max_ms'], snapshot['wait_mean_ms'])
+        self.assertEqual(snapshot['checked_out_connections'], {'localhost:27017': 2})
+
+    def test_should_count_checkout_failures_by_reason(self):
+        listener = PoolCheckoutListener()
+        listener.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+        listener.connection_check_out_failed(monitoring.ConnectionCheckOutFailedEvent(
+            ADDRESS, monitoring.ConnectionCheckOutFailedReason.TIMEOUT
+        ))
+
+        snapshot = listener.snapshot()
+        self.assertEqual(snapshot['checkouts'], 0)
+        self.assertEqual(snapshot['checkout_failures'], {'timeout': 1})
+
+    def test_should_track_open_and_checked_out_connections(self):
+        listener = PoolCheckoutListener()
+        listener.connection_created(monitoring.ConnectionCreatedEvent(ADDRESS, 1))
+        listener.connection_created(monitoring.ConnectionCreatedEvent(ADDRESS, 2))
+        listener.connection_checked_out(monitoring.ConnectionCheckedOutEvent(ADDRESS, 1))
+        listener.connection_checked_in(monitoring.ConnectionCheckedInEvent(ADDRESS, 1))
+        listener.connection_closed(monitoring.ConnectionClosedEvent(ADDRESS, 2, 'idle'))
+
+        snapshot = listener.snapshot()
+        self.assertEqual(snapshot['open_connections'], {'localhost:27017': 1})
+        self.assertEqual(snapshot['checked_out_connections'], {'localhost:27017': 0})
@@ -0,0 +1,73 @@
+import marshal
+from unittest import mock
+
+from flask import Flask
+from flask_restx import Api, Resource
+
+from src.instrumentation.commands import CommandCounter
+from src.instrumentation.profiler import SlowRequestProfiler
+from tests.unit.testbase import TestCase
+
+
+class TestSlowRequestProfiler(TestCase):
+
+    def setUp(self) -> None:
+        self.command_counter = CommandCounter()
+        web_app = Flask(__name__)
+        api = Api(web_app)
+        command_counter = self.command_counter
+
+        class ItemResource(Resource):
+
+            def get(self, item_id: str):
+                command_counter.started(mock.Mock())
+                command_counter.started(mock.Mock())
+                return {'id': item_id}
+
+        api.add_resource(ItemResource, '/items/<string:item_id>')
+        web_app.add_url_rule('/other', 'other', lambda: 'other')
+        self.web_app = web_app
+
+    def __profiler(self, sample_rate: float = 1.0, slow_request_ms: float = 0, max_profiles: int = 10):
+        profiler = SlowRequestProfiler(
+            sample_rate, slow_request_ms, max_profiles, resource_modules=[__name__], command_counter=self.command_counter
+        )
+        profiler.init_app(self.web_app)
+        return profiler
+
+    def test_should_keep_profiles_of_slow_requests(self):
+        profiler = self.__profiler()
+        self.web_app.test_client().get('/items/7?verbose=1')
+
+        profiles = profiler.list()
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]['resource'], 'ItemResource.get')
+        self.assertEqual(profiles[0]['route'], '/items/<string:item_id>')
+        self.assertEqual(profiles[0]['view_args'], {'item_id': '7'})
+        self.assertEqual(profiles[0]['query_args'], {'verbose': '1'})
+        self.assertEqual(profiles[0]['mongo_commands'], 2)
+        self.assertNotIn('stats', profiles[0])
+        self.assertIsInstance(marshal.loads(profiler.get(profiles[0]['id'])['stats']), dict)
+
+    def test_should_discard_fast_requests(self):
+        profiler = self.__profiler(slow_request_ms=60000)
+        self.web_app.test_client().get('/items/7')
+        self.assertEqual(profiler.list(), [])
+
+    def test_should_only_profile_the_sample(self):
+        profiler = self.__profiler(sample_rate=0)
+        self.web_app.test_client().get('/items/7')
+        self.assertEqual(profiler.list(), [])
+
+    def test_should_only_profile_resources_of_the_given_modules(self):
+        profiler = self.__profiler()
+        self.web_app.test_client().get('/other')
+        self.assertEqual(profiler.list(), [])
+
+    def test_should_keep_the_latest_profiles(self):
+        profiler = self.__profiler(max_profiles=2)
+        client = self.web_app.test_client()
+        for item_id in range(3):
+            client.get('/items/{}'.format(item_id))
+
+        self.assertEqual([profile['view_args']['item_id'] for profile in profiler.list()], ['2', '1'])
@@ -0,0 +1,102 @@
+from flask import Flask, current_app
+from flask_restx import Api, Resource
+
+from src.base.batch import dispatch
+from src.instrumentation import tracing
+from tests.unit.testbase import TestCase
+
+
+class ListExporter(object):
+
+    def __init__(self):
+        self.requests = []
+
+    def export(self, otlp_request: dict) -> None:
+        self.requests.append(otlp_request)
+
+    def spans(self) -> dict:
+        return {
+            span['name']: span
+            for otlp_request in self.requests
+            for span in otlp_request['resourceSpans'][0]['scopeSpans'][0]['spans']
+        }
+
+
+class ItemsService(object):
+
+    def get_item(self, item_id: str) -> dict:
+        with tracing.span('domain_math'):
+            return {'id': item_id}
+
+
+class TestTracer(TestCase):
+
+    def setUp(self) -> None:
+        self.exporter = ListExporter()
+
+    def __client(self, sample_rate: float = 1.0):
+        tracer = tracing.Tracer(self.exporter, sample_rate, flush_interval=0)
+        tracing.install(tracer)
+        web_app = Flask(__name__)
+        api = Api(web_app)
+        tracer.init_app(web_app)
+        items_service = tracing.TracingProxy(ItemsService(), 'ItemsService', tracer)
+
+        class ItemResource(Resource):
+            method_decorators = [tracer.trace_resource_method]
+
+            def get(self, item_id: str):
+                return items_service.get_item(item_id)
+
+        class BatchResource(Resource):
+            method_decorators = [tracer.trace_resource_method]
+
+            def post(self):
+                return dispatch(current_app._get_current_object(), {'method': 'GET', 'path': '/api/items/7'})
+
+        api.add_resource(ItemResource, '/items/<string:item_id>', '/api/items/<string:item_id>')
+        api.add_resource(BatchResource, '/batch')
+        return tracer, web_app.test_client()
+
+    def test_should_nest_resource_service_and_custom_spans_under_the_request(self):
+        tracer, client = self.__client()
+        client.get('/items/7')
+        tracer.flush()
+
+        spans = self.exporter.spans()
+        request_span = spans['GET /items/<string:item_id>']
+        self.assertEqual(request_span['parentSpanId'], '')
+        self.assertEqual(spans['ItemResource.get']['parentSpanId'], request_span['spanId'])
+        self.assertEqual(spans['ItemsService.get_item']['parentSpanId'], spans['ItemResource.get']['spanId'])
+        self.assertEqual(spans['domain_math']['parentSpanId'], spans['ItemsService.get_item']['spanId'])
+        self.assertEqual(len({span['traceId'] for span in spans.values()}), 1)
+        self.assertIn({'key': 'http.status_code', 'value': {'intValue': '200'}}, request_span['attributes'])
+
+    def test_should_trace_a_batch_sub_request_as_a_child_span(self):
+        tracer, client = self.__client()
+        client.post('/batch')
+        tracer.flush()
+
+        spans = self.exporter.spans()
+        self.assertEqual(len(self.exporter.requests), 1)
+        self.assertEqual(spans['POST /batch']['parentSpanId'], '')
+        sub_request_span = spans['GET /api/items/<string:item_id>']
+        self.assertEqual(sub_request_span['parentSpanId'], spans['BatchResource.post']['spanId'])
+        self.assertEqual(spans['ItemResource.get']['parentSpanId'], sub_request_span['spanId'])
+        self.assertEqual(len({span['traceId'] for span in spans.values()}), 1)
+
+    def test_should_not_record_sampled_out_requests(self):
+        tracer, client = self.__client(sample_rate=0)
+        response = client.get('/items/7')
+        tracer.flush()
+
+        self.assertEqual(response.json, {'id': '7'})
+        self.assertEqual(self.exporter.requests, [])
+
+    def test_span_should_do_nothing_when_tracing_is_off(self):
+        tracing.install(None)
+        with tracing.span('anything') as span:
+            self.assertIsNone(span)
+
+    def tearDown(self) -> None:
+        tracing.install(None)
@@ -1,8 +1,11 @@
+import asyncio
 from unittest import mock
 
-from src.exceptions import ProductInUseError
-from src.kitmanagement.application_services import ProductsService, KitsService, CalculatedKitsService
-from src.kitmanagement.domain import Kit, KitProduct, CalculatedKit
+from src.exceptions import NotFound, ProductInUseError
+from src.kitmanagement.application_services import ProductsService, KitsService, CalculatedKitsService, \
+    AsyncProductsService, AsyncKitsService, AsyncCalculatedKitsService, KitAvailabilityService, \
+    AsyncKitAvailabilityService
+from src.kitmanagement.domain import Kit, KitProduct, CalculatedKit, ProductFilter, SortKey, Product, KitAvailability
 from tests.unit.testbase import TestCase
 
 
@@ -39,6 +42,28 @@ class TestProductsService(TestCase):
         repository_mock.list.assert_called()
         self.assertEqual(products_mock, products)
 
+    def test_list_products_should_query_the_repository_when_filtered_or_sorted(self):
+        kit_repository_mock = mock.MagicMock()
+        products_mock = mock.MagicMock()
+        repository_mock = mock.MagicMock()
+        repository_mock.list_filtered.return_value = products_mock
+        service = ProductsService(repository_mock, kit_repository_mock)
+        sort_keys = [SortKey('price', descending=True)]
+        products = service.list_products(sort_keys=sort_keys)
+        repository_mock.list_filtered.assert_called_with(ProductFilter(), sort_keys, fields=None)
+        repository_mock.list.assert_not_called()
+        self.assertEqual(products_mock, products)
+
+    def test_search_products(self):
+        kit_repository_mock = mock.MagicMock()
+        products_mock = mock.MagicMock()
+        repository_mock = mock.MagicMock()
+        repository_mock.search.return_value = products_mock
+        service = ProductsService(repository_mock, kit_repository_mock)
+        products = service.search_products('last of', 20, 10, fields=['sku', 'price'])
+        repository_mock.search.assert_called_with('last of', 20, 10, fields=['sku', 'price'])
+        self.assertEqual(products_mock, products)
+
     def test_get_product(self):
         kit_repository_mock = mock.MagicMock()
         product_mock = mock.MagicMock()
@@ -46,7 +71,7 @@ class TestProductsService(TestCase):
         repository_mock.get_by_id.return_value = product_mock
         service = ProductsService(repository_mock, kit_repository_mock)
         product = service.get_product(1)
-        repository_mock.get_by_id.assert_called_with(1)
+        repository_mock.get_by_id.assert_called_with(1, fields=None)
         self.assertEqual(product_mock, product)
 
     def test_remove_product(self):
@@ -136,6 +161,21 @@ class TestKitService(TestCase):
         self.assertEqual(created_kit.kit_products[1].quantity, 2)
         self.assertEqual(created_kit.kit_products[1].discount_percentage, 15)
 
+    def test_create_kit_should_read_the_products_at_once_and_raise_not_found_for_a_missing_one(self):
+        product_repository_mock = mock.MagicMock()
+        product_repository_mock.get_many_by_skus.return_value = [mock.MagicMock(), None]
+        kit_repository_mock = mock.MagicMock()
+        service = KitsService(kit_repository_mock, product_repository_mock)
+
+        with self.assertRaises(NotFound):
+            service.create_kit({'name': 'Sony Pack I', 'sku': 'FASF-123', 'kit_products': [
+                {'product_sku': 'AHJU-49685', 'quantity': 1, 'discount_percentage': 10},
+                {'product_sku': 'AHJU-49621', 'quantity': 2, 'discount_percentage': 15},
+            ]})
+
+        product_repository_mock.get_many_by_skus.assert_called_once_with(['AHJU-49685', 'AHJU-49621'])
+        kit_repository_mock.add.assert_not_called()
+
     def test_list_kit(self):
         kits_mock = mock.MagicMock()
         product_repository_mock = mock.MagicMock()
@@ -148,6 +188,39 @@ class TestKitService(TestCase):
         kit_repository_mock.list.assert_called()
         self.assertEqual(kits_mock, kits)
 
+    def test_list_kits_with_products(self):
+        kits_mock = mock.MagicMock()
+        kit_repository_mock = mock.MagicMock()
+        kit_repository_mock.list_with_products.return_value = kits_mock
+        service = KitsService(kit_repository_mock, mock.MagicMock())
+
+        kits = service.list_kits_with_products(['FASD-1', 'FASD-2'], 0, 100)
+
+        kit_repository_mock.list_with_products.assert_called_with(['FASD-1', 'FASD-2'], 0, 100, fields=None)
+        self.assertEqual(kits_mock, kits)
+
+    def test_expand_products_should_read_the_products_of_all_kits_at_once(self):
+        product_repository_mock = mock.MagicMock()
+        product_repository_mock.list_with_skus.return_value = [
+            Product(id='1', name='A', sku='A', cost=10.00, price=20.00, inventory_quantity=10)
+        ]
+        service = KitsService(mock.MagicMock(), product_repository_mock)
+        kits = [
+            Kit(id='1', name='Kit', sku='KIT-1', kit_products=[
+                KitProduct(product_sku='A', quantity=2, discount_percentage=0.0),
+                KitProduct(product_sku='B', quantity=1, discount_percentage=0.0),
+            ]),
+            Kit(id='2', name='Kit', sku='KIT-2', kit_products=[KitProduct(product_sku='A', quantity=1, discount_percentage=0.0)]),
+        ]
+
+        expanded_kits = service.expand_products(kits)
+
+        product_repository_mock.list_with_skus.assert_called_once_with(['A', 'B'])
+        self.assertEqual(expanded_kits[0].sku, 'KIT-1')
+        self.assertEqual(expanded_kits[0].kit_products[0].product.id, '1')
+        self.assertIsNone(expanded_kits[0].kit_products[1].product)
+        self.assertEqual(expanded_kits[1].kit_products[0].product.id, '1')
+
     def test_get_kit(self):
         kit_mock = mock.MagicMock()
         product_repository_mock = mock.MagicMock()
@@ -198,6 +271,43 @@ class TestKitService(TestCase):
         service.remove_kit(1)
         kit_repository_mock.remove.assert_called_with(1)
 
+    def test_patch_kit_products_should_only_check_the_added_products(self):
+        kit_mock = mock.MagicMock()
+        product_mock = mock.MagicMock()
+        product_repository_mock = mock.MagicMock()
+        product_repository_mock.get_many_by_skus.return_value = [product_mock]
+        kit_repository_mock = mock.MagicMock()
+        kit_repository_mock.patch_kit_products.return_value = kit_mock
+        kit_availability_service_mock = mock.MagicMock()
+        service = KitsService(kit_repository_mock, product_repository_mock, kit_availability_service_mock)
+
+        patched_kit = service.patch_kit_products('1', {
+            'add': [{'product_sku': 'C', 'quantity': 1, 'discount_percentage': 0.0}],
+            'change': [{'product_sku': 'A', 'quantity': 3, 'discount_percentage': 5.0}],
+            'remove': ['B']
+        })
+
+        self.assertEqual(patched_kit, kit_mock)
+        product_repository_mock.get_many_by_skus.assert_called_once_with(['C'])
+        kit_repository_mock.get_by_id.assert_not_called()
+        kit_repository_mock.patch_kit_products.assert_called_with(
+            '1',
+            [KitProduct(product_sku='C', quantity=1, discount_percentage=0.0)],
+            [KitProduct(product_sku='A', quantity=3, discount_percentage=5.0)],
+            ['B']
+        )
+        kit_availability_service_mock.refresh_kits.assert_called_with([kit_mock], [product_mock])
+
+    def test_patch_kit_products_should_raise_not_found_when_an_added_product_doesnt_exist(self):
+        product_repository_mock = mock.MagicMock()
+        product_repository_mock.get_many_by_skus.return_value = [None]
+        kit_repository_mock = mock.MagicMock()
+        service = KitsService(kit_repository_mock, product_repository_mock)
+
+        with self.assertRaises(NotFound):
+            service.patch_kit_products('1', {'add': [{'product_sku': 'C', 'quantity': 1, 'discount_percentage': 0.0}]})
+        kit_repository_mock.patch_kit_products.assert_not_called()
+
 
 class TestCalculatedKitsService(TestCase):
 
@@ -225,3 +335,267 @@ class TestCalculatedKitsService(TestCase):
         calculated_kit = service.calculate_kit(1)
         self.assertIsInstance(calculated_kit, CalculatedKit)
         self.assertEqual(calculated_kit.cost, 40.00)
+
+
+class TestKitAvailabilityService(TestCase):
+
+    def setUp(self) -> None:
+        self.products = [
+            Product(id='1', name='A', sku='A', cost=10.00, price=20.00, inventory_quantity=10),
+            Product(id='2', name='B', sku='B', cost=10.00, price=20.00, inventory_quantity=3),
+        ]
+        self.kit = Kit(id='1', name='Kit', sku='KIT', kit_products=[
+            KitProduct(product_sku='A', quantity=2, discount_percentage=0.0),
+            KitProduct(product_sku='B', quantity=1, discount_percentage=0.0),
+        ])
+
+    def test_refresh_kit_should_save_the_kit_inventory_quantity_and_limiting_product(self):
+        kit_availability_repository_mock = mock.MagicMock()
+        service = KitAvailabilityService(mock.MagicMock(), mock.MagicMock(), kit_availability_repository_mock)
+
+        service.refresh_kit(self.kit, self.products)
+
+        kit_availability_repository_mock.save.assert_called_with(
+            KitAvailability(kit_id='1', kit_sku='KIT', kit_name='Kit', inventory_quantity=3, limiting_product_sku='B')
+        )
+
+    def test_refresh_kits_with_product_should_use_the_updated_product(self):
+        kit_repository_mock = mock.MagicMock()
+        kit_repository_mock.list_with_product.return_value = [self.kit]
+        product_repository_mock = mock.MagicMock()
+        product_repository_mock.list_with_skus.return_value = [self.products[0]]
+        kit_availability_repository_mock = mock.MagicMock()
+        service = KitAvailabilityService(kit_repository_mock, product_repository_mock, kit_availability_repository_mock)
+        updated_product = Product(id='2', name='B', sku='B', cost=10.00, price=20.00, inventory_quantity=1)
+
+        service.refresh_kits_with_product(updated_product)
+
+        kit_repository_mock.list_with_product.assert_called_with('B')
+        product_repository_mock.list_with_skus.assert_called_with(['A'])
+        kit_availability_repository_mock.save_all.assert_called_with([
+            KitAvailability(kit_id='1', kit_sku='KIT', kit_name='Kit', inventory_quantity=1, limiting_product_sku='B')
+        ])
+
+    def test_refresh_kits_should_remove_the_kits_without_products_at_once(self):
+        product_repository_mock = mock.MagicMock()
+        product_repository_mock.list_with_skus.return_value = self.products
+        kit_availability_repository_mock = mock.MagicMock()
+        service = KitAvailabilityService(mock.MagicMock(), product_repository_mock, kit_availability_repository_mock)
+        empty_kits = [Kit(id=kit_id, name='Empty', sku=f'EMPTY-{kit_id}', kit_products=[]) for kit_id in ('2', '3')]
+
+        service.refresh_kits([self.kit] + empty_kits)
+
+        kit_availability_repository_mock.remove.assert_not_called()
+        kit_availability_repository_mock.remove_many.assert_called_once_with(['2', '3'])
+        kit_availability_repository_mock.save_all.assert_called_with([
+            KitAvailability(kit_id='1', kit_sku='KIT', kit_name='Kit', inventory_quantity=3, limiting_product_sku='B')
+        ])
+
+    def test_update_product_should_refresh_kits_only_when_the_inventory_changes(self):
+        kit_availability_service_mock = mock.MagicMock()
+        repository_mock = mock.MagicMock()
+        repository_mock.get_by_id.return_value = self.products[1]
+        service = ProductsService(repository_mock, mock.MagicMock(), kit_availability_service_mock)
+
+        service.update_product('2', {'name': 'B', 'cost': 10.00, 'price': 30.00, 'inventory_quantity': 3})
+        kit_availability_service_mock.refresh_kits_with_product.assert_not_called()
+        service.update_product('2', {'name': 'B', 'cost': 10.00, 'price': 30.00, 'inventory_quantity': 0})
+        kit_availability_service_mock.refresh_kits_with_product.assert_called_with(self.products[1])
+
+    def test_patch_product_should_refresh_kits_only_when_it_sets_the_inventory(self):
+        kit_availability_service_mock = mock.MagicMock()
+        repository_mock = mock.MagicMock()
+        repository_mock.patch.return_value = self.products[1]
+        service = ProductsService(repository_mock, mock.MagicMock(), kit_availability_service_mock)
+
+        self.assertEqual(service.patch_product('2', {'price': 30.00}), self.products[1])
+        repository_mock.patch.assert_called_with('2', {'price': 30.00})
+        repository_mock.get_by_id.assert_not_called()
+        kit_availability_service_mock.refresh_kits_with_product.assert_not_called()
+        service.patch_product('2', {'inventory_quantity': 0})
+        kit_availability_service_mock.refresh_kits_with_product.assert_called_with(self.products[1])
+
+
+class TestAsyncKitAvailabilityService(TestCase):
+
+    def setUp(self) -> None:
+        self.products = [
+            Product(id='1', name='A', sku='A', cost=10.00, price=20.00, inventory_quantity=10),
+            Product(id='2', name='B', sku='B', cost=10.00, price=20.00, inventory_quantity=3),
+        ]
+        self.kit = Kit(id='1', name='Kit', sku='KIT', kit_products=[
+            KitProduct(product_sku='A', quantity=2, discount_percentage=0.0),
+            KitProduct(product_sku='B', quantity=1, discount_percentage=0.0),
+        ])
+
+    def test_refresh_kits_with_product_should_use_the_updated_product(self):
+        kit_repository_mock = mock.AsyncMock()
+        kit_repository_mock.list_with_product.return_value = [self.kit]
+        product_repository_mock = mock.AsyncMock()
+        product_repository_mock.list_with_skus.return_value = [self.products[0]]
+        kit_availability_repository_mock = mock.AsyncMock()
+        service = AsyncKitAvailabilityService(kit_repository_mock, product_repository_mock, kit_availability_repository_mock)
+        updated_product = Product(id='2', name='B', sku='B', cost=10.00, price=20.00, inventory_quantity=1)
+
+        asyncio.run(service.refresh_kits_with_product(updated_product))
+
+        product_repository_mock.list_with_skus.assert_awaited_with(['A'])
+        kit_availability_repository_mock.save_all.assert_awaited_with([
+            KitAvailability(kit_id='1', kit_sku='KIT', kit_name='Kit', inventory_quantity=1, limiting_product_sku='B')
+        ])
+
+    def test_kits_service_writes_should_refresh_the_kit_availability(self):
+        kit_repository_mock = mock.AsyncMock()
+        kit_repository_mock.add.return_value = '1'
+        kit_repository_mock.get_by_id.return_value = self.kit
+        product_repository_mock = mock.AsyncMock()
+        product_repository_mock.get_by_sku.side_effect = lambda sku: {'A': self.products[0], 'B': self.products[1]}[sku]
+        kit_availability_repository_mock = mock.AsyncMock()
+        kit_availability_service = AsyncKitAvailabilityService(
+            kit_repository_mock, product_repository_mock, kit_availability_repository_mock
+        )
+        service = AsyncKitsService(kit_repository_mock, product_repository_mock, kit_availability_service)
+
+        asyncio.run(service.create_kit({
+            'sku': 'KIT',
+            'name': 'Kit',
+            'kit_products': [{'product_sku': 'A', 'quantity': 2, 'discount_percentage': 0.0},
+                             {'product_sku': 'B', 'quantity': 1, 'discount_percentage': 0.0}]
+        }))
+        kit_availability_repository_mock.save_all.assert_awaited_with([
+            KitAvailability(kit_id='1', kit_sku='KIT', kit_name='Kit', inventory_quantity=3, limiting_product_sku='B')
+        ])
+        asyncio.run(service.update_kit('1', {
+            'name': 'Kit', 'kit_products': [{'product_sku': 'A', 'quantity': 5, 'discount_percentage': 0.0}]
+        }))
+        kit_availability_repository_mock.save_all.assert_awaited_with([
+            KitAvailability(kit_id='1', kit_sku='KIT', kit_name='Kit', inventory_quantity=2, limiting_product_sku='A')
+        ])
+        product_repository_mock.list_with_skus.assert_not_awaited()
+
+        asyncio.run(service.remove_kit('1'))
+        kit_availability_repository_mock.remove_many.assert_awaited_with(['1'])
+
+    def test_update_product_should_refresh_kits_only_when_the_inventory_changes(self):
+        kit_availability_service_mock = mock.AsyncMock()
+        repository_mock = mock.AsyncMock()
+        repository_mock.get_by_id.return_value = self.products[1]
+        service = AsyncProductsService(repository_mock, mock.AsyncMock(), kit_availability_service_mock)
+
+        asyncio.run(service.update_product('2', {'name': 'B', 'cost': 10.00, 'price': 30.00, 'inventory_quantity': 3}))
+        kit_availability_service_mock.refresh_kits_with_product.assert_not_awaited()
+        asyncio.run(service.update_product('2', {'name': 'B', 'cost': 10.00, 'price': 30.00, 'inventory_quantity': 0}))
+        kit_availability_service_mock.refresh_kits_with_product.assert_awaited_with(self.products[1])
+
+
+class TestAsyncProductsService(TestCase):
+
+    def test_create_product(self):
+        kit_repository_mock = mock.AsyncMock()
+        repository_mock = mock.AsyncMock()
+        repository_mock.add.return_value = '1'
+        service = AsyncProductsService(repository_mock, kit_repository_mock)
+        product = asyncio.run(service.create_product({
+            'name': 'The Last of Us Part II',
+            'sku': 'AHJU-49685',
+            'cost': 10.00,
+            'price': 220.00,
+            'inventory_quantity': 150
+        }))
+
+        repository_mock.add.assert_awaited()
+        self.assertEqual(product.id, '1')
+        self.assertEqual(product.sku, 'AHJU-49685')
+
+    def test_remove_product_should_raise_product_in_use_error_when_product_is_being_used_by_any_kit(self):
+        kit_repository_mock = mock.AsyncMock()
+        kit_repository_mock.list_with_product.return_value = [mock.MagicMock()]
+        product_repository_mock = mock.AsyncMock()
+        product_repository_mock.get_by_id.return_value = mock.MagicMock(sku='FASD-1')
+
+        service = AsyncProductsService(product_repository_mock, kit_repository_mock)
+        with self.assertRaises(ProductInUseError):
+            asyncio.run(service.remove_product(1))
+
+        product_repository_mock.remove.assert_not_awaited()
+        kit_repository_mock.list_with_product.assert_awaited_with('FASD-1')
+
+
+class TestAsyncKitService(TestCase):
+
+    def test_create_kit_should_validate_every_component_sku(self):
+        kit_creation_command = {
+            'sku': 'FASF-123',
+            'name': 'Sony Pack I',
+            'kit_products': [
+                {'product_sku': 'AHJU-49685', 'quantity': 1, 'discount_percentage': 10},
+                {'product_sku': 'AHJU-49621', 'quantity': 2, 'discount_percentage': 15}
+            ]
+        }
+        kit_repository_mock = mock.AsyncMock()
+        kit_repository_mock.add.return_value = '1'
+        product_repository_mock = mock.AsyncMock()
+        service = AsyncKitsService(kit_repository_mock, product_repository_mock)
+
+        kit = asyncio.run(service.create_kit(kit_creation_command))
+
+        self.assertIsInstance(kit, Kit)
+        self.assertEqual(kit.id, '1')
+        self.assertEqual(kit.kit_products[1], KitProduct(product_sku='AHJU-49621', quantity=2, discount_percentage=15))
+        product_repository_mock.get_by_sku.assert_has_awaits([mock.call('AHJU-49685'), mock.call('AHJU-49621')], any_order=True)
+
+    def test_create_kit_should_not_add_kit_when_a_component_is_not_found(self):
+        kit_repository_mock = mock.AsyncMock()
+        product_repository_mock = mock.AsyncMock()
+        product_repository_mock.get_by_sku.side_effect = NotFound
+        service = AsyncKitsService(kit_repository_mock, product_repository_mock)
+
+        with self.assertRaises(NotFound):
+            asyncio.run(service.create_kit({
+                'sku': 'FASF-123',
+                'name': 'Sony Pack I',
+                'kit_products': [{'product_sku': 'AHJU-49685', 'quantity': 1, 'discount_percentage': 10}]
+            }))
+
+        kit_repository_mock.add.assert_not_awaited()
+
+    def test_update_kit(self):
+        kit_update_command = {
+            'name': 'Sony Pack I',
+            'kit_products': [{'product_sku': 'AHJU-49685', 'quantity': 1, 'discount_percentage': 10}]
+        }
+        kit_mock = mock.MagicMock()
+        product_repository_mock = mock.AsyncMock()
+        kit_repository_mock = mock.AsyncMock()
+        kit_repository_mock.get_by_id.return_value = kit_mock
+
+        service = AsyncKitsService(kit_repository_mock, product_repository_mock)
+        updated_kit = asyncio.run(service.update_kit(1, kit_update_command))
+
+        self.assertEqual(updated_kit, kit_mock)
+        product_repository_mock.get_by_sku.assert_awaited_with('AHJU-49685')
+        kit_mock.update_infos.assert_called_with(
+            name='Sony Pack I',
+            kit_products=[KitProduct(product_sku='AHJU-49685', quantity=1, discount_percentage=10)]
+        )
+        kit_repository_mock.update.assert_awaited_with(kit_mock)
+
+
+class TestAsyncCalculatedKitsService(TestCase):
+
+    def test_get_calculated_kit(self):
+        product_A_mock = mock.MagicMock(inventory_quantity=10, cost=20.00, price=100.00, sku='A')
+        kit_mock = mock.MagicMock()
+        kit_mock.kit_products = [KitProduct(product_sku='A', quantity=2, discount_percentage=10.00)]
+
+        product_repository_mock = mock.AsyncMock()
+        product_repository_mock.list_with_skus.return_value = [product_A_mock]
+        kit_repository_mock = mock.AsyncMock()
+        kit_repository_mock.get_by_id.return_value = kit_mock
+
+        service = AsyncCalculatedKitsService(kit_repository_mock, product_repository_mock)
+        calculated_kit = asyncio.run(service.calculate_kit(1))
+
+        product_repository_mock.list_with_skus.assert_awaited_with(['A'])
+        self.assertIsInstance(calculated_kit, CalculatedKit)
+        self.assertEqual(calculated_kit.cost, 40.00)
@@ -187,6 +187,12 @@ class TestCalculatedKit(TestCase):
         calculated_kit = CalculatedKit(self.kit_mock, self.products_mock)
         self.assertEqual(calculated_kit.inventory_quantity, 5)
 
+    def test_inventory_quantity_should_be_limited_by_any_kit_product(self):
+        self.products_mock[2].inventory_quantity = 14
+        calculated_kit = CalculatedKit(self.kit_mock, self.products_mock)
+        self.assertEqual(calculated_kit.inventory_quantity, 2)
+        self.assertEqual(calculated_kit.limiting_product_sku, 'C')
+
     def test_cost(self):
         calculated_kit = CalculatedKit(self.kit_mock, self.products_mock)
         self.assertEqual(calculated_kit.cost, 125.00)
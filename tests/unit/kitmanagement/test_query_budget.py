@@ -0,0 +1,236 @@
+import uuid
+
+import msgpack
+import pytest
+
+from src.instrumentation.queries import REPOSITORY_CALLS_BY_METHOD_HEADER
+
+COMPONENTS = 5
+
+
+@pytest.fixture(scope='module')
+def catalog(kit_api_client):
+    run_id = uuid.uuid4().hex[:8]
+    product_skus = []
+    product_ids = []
+    for index in range(COMPONENTS):
+        product = kit_api_client.post('/api/products', json={
+            'name': 'Budget Product {}'.format(index),
+            'sku': 'BUDGET-{}-P{}'.format(run_id, index),
+            'cost': 10.0,
+            'price': 20.0,
+            'inventoryQuantity': 100
+        }).json
+        product_skus.append(product['sku'])
+        product_ids.append(product['id'])
+    kit_products = [{'productSku': sku, 'quantity': 1, 'discountPercentage': 5.0} for sku in product_skus]
+    kit = kit_api_client.post('/api/kits', json={
+        'name': 'Budget Kit', 'sku': 'BUDGET-{}-K'.format(run_id), 'kitProducts': kit_products
+    }).json
+    return {'run_id': run_id, 'product_ids': product_ids, 'kit_id': kit['id'], 'kit_products': kit_products}
+
+
+def test_get_product_round_trips(query_budget, catalog):
+    response = query_budget('GET', '/api/products/{}'.format(catalog['product_ids'][0]), max_round_trips=1)
+    assert response.status_code == 200
+
+
+def test_get_products_by_ids_round_trips(query_budget, catalog):
+    product_ids = catalog['product_ids'][::-1] + ['missing']
+    response = query_budget('GET', '/api/products?ids={}'.format(','.join(product_ids)), max_round_trips=1)
+    assert response.status_code == 200
+    assert [product['id'] for product in response.json] == product_ids
+    assert response.json[-1] == {'id': 'missing', 'notFound': True}
+
+
+def test_get_kits_by_skus_round_trips(query_budget, catalog):
+    kit_sku = 'BUDGET-{}-K'.format(catalog['run_id'])
+    response = query_budget('GET', '/api/kits?skus={},missing&expand=products'.format(kit_sku), max_round_trips=2)
+    assert response.status_code == 200
+    assert response.json[0]['id'] == catalog['kit_id']
+    assert response.json[1] == {'sku': 'missing', 'notFound': True}
+
+
+def test_get_product_fields(query_budget, catalog):
+    response = query_budget('GET', '/api/products/{}?fields=sku,inventoryQuantity'.format(catalog['product_ids'][0]),
+                            max_round_trips=1)
+    assert response.status_code == 200
+    assert set(response.json) == {'sku', 'inventoryQuantity'}
+
+
+def test_filtered_product_list_round_trips(query_budget, catalog):
+    response = query_budget('GET', '/api/products?skuPrefix=BUDGET-{}&maxInventoryQuantity=100&sort=-sku'.format(
+        catalog['run_id']
+    ), max_round_trips=1)
+    assert response.status_code == 200
+    assert [product['id'] for product in response.json] == catalog['product_ids'][::-1]
+
+
+def test_search_products_round_trips(query_budget, catalog):
+    response = query_budget('GET', '/api/products/search?q=budget-{}&limit=2'.format(catalog['run_id']), max_round_trips=1)
+    assert response.status_code == 200
+    assert [product['id'] for product in response.json] == catalog['product_ids'][:2]
+
+
+def test_update_product_round_trips(query_budget, catalog):
+    # INFO: an inventory change also reads the kits using the product and their products, and saves their availability
+    response = query_budget('PUT', '/api/products/{}'.format(catalog['product_ids'][0]), max_round_trips=5, json={
+        'name': 'Budget Product', 'cost': 10.0, 'price': 25.0, 'inventoryQuantity': 10
+    })
+    assert response.status_code == 200
+
+
+def test_patch_product_round_trips(query_budget, catalog):
+    response = query_budget('PATCH', '/api/products/{}'.format(catalog['product_ids'][2]), max_round_trips=1, json={
+        'price': 21.0
+    })
+    assert response.status_code == 200
+    assert (response.json['price'], response.json['cost'], response.json['inventoryQuantity']) == (21.0, 10.0, 100)
+
+
+def test_patch_product_inventory_refreshes_the_kits(query_budget, catalog, kit_api_client):
+    response = query_budget('PATCH', '/api/products/{}'.format(catalog['product_ids'][2]), max_round_trips=4, json={
+        'inventoryQuantity': 3
+    })
+    assert response.status_code == 200
+    low_availability_kits = kit_api_client.get('/api/calculated-kits?maxInventory=3').json
+    assert catalog['kit_id'] in [kit['id'] for kit in low_availability_kits]
+
+
+def test_patch_product_without_changes(kit_api_client, catalog):
+    response = kit_api_client.patch('/api/products/{}'.format(catalog['product_ids'][2]), json={})
+    assert response.status_code == 400
+
+
+def test_patch_kit_products_round_trips(query_budget, catalog, kit_api_client):
+    kit_sku = 'BUDGET-{}-PATCH'.format(catalog['run_id'])
+    kit_id = kit_api_client.post('/api/kits', json={
+        'name': 'Budget Patch Kit', 'sku': kit_sku, 'kitProducts': catalog['kit_products']
+    }).json['id']
+    path = '/api/kits/{}/kit-products'.format(kit_id)
+    first, second = catalog['kit_products'][:2]
+
+    # INFO: the kit product changed, then reading every product and saving the availability, whatever the kit size
+    response = query_budget('PATCH', path, max_round_trips=3, json={'change': [dict(first, quantity=2)]})
+    assert response.status_code == 200
+    assert response.json['kitProducts'][0] == dict(first, quantity=2)
+    response = query_budget('PATCH', path, max_round_trips=3, json={'remove': [second['productSku']]})
+    assert [kit_product['productSku'] for kit_product in response.json['kitProducts']] == \
+        [kit_product['productSku'] for kit_product in catalog['kit_products'] if kit_product != second]
+    response = query_budget('PATCH', path, max_round_trips=4, json={'add': [second]})
+    assert response.json['kitProducts'][-1] == second
+
+    assert kit_api_client.patch(path, json={'add': [second]}).status_code == 400
+    assert kit_api_client.patch(path, json={'remove': ['missing']}).status_code == 404
+    assert kit_api_client.patch(path, json={'add': [dict(second, productSku='missing')]}).status_code == 404
+    assert kit_api_client.patch(path, json={'remove': [first['productSku']], 'change': [first]}).status_code == 400
+    assert kit_api_client.patch(path, json={}).status_code == 400
+    kit_api_client.delete('/api/kits/{}'.format(kit_id))
+
+
+def test_get_kit_round_trips(query_budget, catalog):
+    response = query_budget('GET', '/api/kits/{}'.format(catalog['kit_id']), max_round_trips=1)
+    assert response.status_code == 200
+
+
+def test_get_expanded_kit_round_trips(query_budget, catalog):
+    response = query_budget('GET', '/api/kits/{}?expand=products'.format(catalog['kit_id']), max_round_trips=2)
+    assert response.status_code == 200
+    assert [kit_product['product']['id'] for kit_product in response.json['kitProducts']] == catalog['product_ids']
+
+
+def test_expanded_kits_with_product_round_trips(query_budget, catalog):
+    product_sku = catalog['kit_products'][0]['productSku']
+    response = query_budget('GET', '/api/kits?productSku={}&expand=products'.format(product_sku), max_round_trips=2)
+    assert response.status_code == 200
+    assert response.json[0]['kitProducts'][0]['product']['sku'] == product_sku
+
+
+def test_calculated_kit_round_trips(query_budget, catalog):
+    response = query_budget('GET', '/api/calculated-kits/{}'.format(catalog['kit_id']), max_round_trips=2)
+    assert response.status_code == 200
+
+
+def test_calculated_kit_fields(query_budget, catalog, kit_api_client):
+    response = query_budget('GET', '/api/calculated-kits/{}?fields=name,sku'.format(catalog['kit_id']), max_round_trips=1)
+    assert response.json == {'name': 'Budget Kit', 'sku': 'BUDGET-{}-K'.format(catalog['run_id'])}
+    response = query_budget('GET', '/api/calculated-kits/{}?fields=sku,inventoryQuantity'.format(catalog['kit_id']),
+                            max_round_trips=2)
+    assert set(response.json) == {'sku', 'inventoryQuantity'}
+
+    response = kit_api_client.get('/api/calculated-kits/{}?fields=bogus'.format(catalog['kit_id']))
+    assert response.status_code == 400
+    assert response.json['fields'] == ['bogus']
+
+
+def test_kits_with_product_round_trips(query_budget, catalog):
+    product_skus = ','.join(kit_product['productSku'] for kit_product in catalog['kit_products'])
+    response = query_budget('GET', '/api/kits?productSku={}&limit=10'.format(product_skus), max_round_trips=1)
+    assert response.status_code == 200
+    assert [kit['id'] for kit in response.json] == [catalog['kit_id']]
+
+
+def test_low_availability_kits_round_trips(query_budget, catalog):
+    response = query_budget('GET', '/api/calculated-kits?maxInventory=100', max_round_trips=1)
+    assert response.status_code == 200
+    assert catalog['kit_id'] in [kit['id'] for kit in response.json]
+
+
+def test_create_kit_round_trips(query_budget, catalog):
+    # INFO: the components, the kit and its availability
+    response = query_budget('POST', '/api/kits', max_round_trips=3, json={
+        'name': 'Budget Kit', 'sku': 'BUDGET-{}-K2'.format(catalog['run_id']), 'kitProducts': catalog['kit_products']
+    })
+    assert response.status_code == 201
+
+
+def test_query_budget_should_fail_requests_over_budget(query_budget, catalog):
+    with pytest.raises(AssertionError, match='ProductRepository.get_many_by_skus=1'):
+        query_budget('PUT', '/api/kits/{}'.format(catalog['kit_id']), max_round_trips=2, json={
+            'name': 'Budget Kit', 'kitProducts': catalog['kit_products']
+        })
+
+
+def test_batch_coalesces_the_gets_by_id(query_budget, catalog):
+    requests = [{'method': 'GET', 'path': '/api/products/{}'.format(product_id)} for product_id in catalog['product_ids']]
+    requests.append({'method': 'GET', 'path': '/api/products/missing?fields=sku'})
+    response = query_budget('POST', '/api/batch', max_round_trips=1, json={'requests': requests})
+    assert response.status_code == 200
+    assert response.headers[REPOSITORY_CALLS_BY_METHOD_HEADER] == 'ProductRepository.get_many_by_ids=1'
+    statuses = [sub_response['status'] for sub_response in response.json['responses']]
+    assert statuses == [200] * COMPONENTS + [404]
+    assert [sub_response['body']['id'] for sub_response in response.json['responses'][:-1]] == catalog['product_ids']
+
+
+def test_batch_runs_writes_in_order(query_budget, catalog):
+    product_id = catalog['product_ids'][1]
+    response = query_budget('POST', '/api/batch', max_round_trips=9, json={'requests': [
+        {'method': 'GET', 'path': '/api/products/{}?fields=price'.format(product_id)},
+        {'method': 'PUT', 'path': '/api/products/{}'.format(product_id), 'body': {
+            'name': 'Budget Product 1', 'cost': 10.0, 'price': 30.0, 'inventoryQuantity': 100
+        }},
+        {'method': 'GET', 'path': '/api/products/{}?fields=price'.format(product_id)},
+        {'method': 'GET', 'path': '/api/kits/{}'.format(catalog['kit_id'])},
+        {'method': 'DELETE', 'path': '/api/batch'},
+    ]})
+    assert response.status_code == 200
+    responses = response.json['responses']
+    assert [sub_response['status'] for sub_response in responses] == [200, 200, 200, 200, 400]
+    assert responses[0]['body'] == {'price': 20.0}
+    assert responses[2]['body'] == {'price': 30.0}
+    assert responses[3]['body']['id'] == catalog['kit_id']
+
+
+def test_batch_answers_with_the_batch_representation(kit_api_client, catalog):
+    response = kit_api_client.post('/api/batch', headers={'Accept': 'application/msgpack'}, json={'requests': [
+        {'method': 'GET', 'path': '/api/products/{}?fields=sku'.format(catalog['product_ids'][0])}
+    ]})
+    assert response.mimetype == 'application/msgpack'
+    assert msgpack.unpackb(response.data, raw=False) == {'responses': [{'status': 200, 'body': {
+        'sku': 'BUDGET-{}-P0'.format(catalog['run_id'])
+    }}]}
+
+
+def test_batch_over_the_size_limit(kit_api_client):
+    response = kit_api_client.post('/api/batch', json={'requests': [{'method': 'GET', 'path': '/api/products'}] * 51})
+    assert response.status_code == 400